@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_latest_data(apps, schema_editor):
+    """
+    Point every existing `Redditor` and `Thread` at its newest data entry. Each model is backfilled with a single
+    UPDATE statement rather than one query per row.
+    """
+    for model_name, data_model_name, related_field in (
+        ("Redditor", "RedditorData", "redditor"),
+        ("Thread", "ThreadData", "thread"),
+    ):
+        model = apps.get_model("reecon", model_name)
+        data_model = apps.get_model("reecon", data_model_name)
+        latest_data = data_model.objects.filter(**{related_field: models.OuterRef("pk")}).order_by("-created").values("pk")[:1]
+        model.objects.update(latest_data=models.Subquery(latest_data))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reecon", "0002_models"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="redditor",
+            name="latest_data",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="The most recently created `RedditorData` entry for this redditor. This is kept up to date by `RedditorDataService.create_object`.",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="reecon.redditordata",
+            ),
+        ),
+        migrations.AddField(
+            model_name="thread",
+            name="latest_data",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="The most recently created `ThreadData` entry for this thread. This is kept up to date by `ThreadDataService.create_object`.",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="reecon.threaddata",
+            ),
+        ),
+        migrations.RunPython(backfill_latest_data, migrations.RunPython.noop),
+    ]
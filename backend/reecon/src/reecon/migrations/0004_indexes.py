@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:52
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without locking the tables against writes. This cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("reecon", "0003_latest_data"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="redditordata",
+            index=models.Index(fields=["redditor", "-created"], name="redditordata_redditor_created"),
+        ),
+        AddIndexConcurrently(
+            model_name="threaddata",
+            index=models.Index(fields=["thread", "-created"], name="threaddata_thread_created"),
+        ),
+        AddIndexConcurrently(
+            model_name="unprocessableredditor",
+            index=models.Index(fields=["created"], name="unprocessableredditor_created"),
+        ),
+        AddIndexConcurrently(
+            model_name="unprocessablethread",
+            index=models.Index(fields=["created"], name="unprocessablethread_created"),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reecon", "0004_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FetchedSubmission",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created", models.DateTimeField(auto_now_add=True, help_text="Date and time of creation.")),
+                ("author", models.CharField(blank=True, help_text="The username of the author. Empty if the author deleted their account.", max_length=32)),
+                ("created_utc", models.FloatField(help_text="The unix timestamp of when the submission was posted to reddit.")),
+                ("downs", models.IntegerField(help_text="The number of downvotes when the submission was fetched.")),
+                (
+                    "fullname",
+                    models.CharField(
+                        help_text="The reddit fullname of the submission, e.g. `t1_abc123` for a comment or `t3_abc123` for a thread.", max_length=16, unique=True
+                    ),
+                ),
+                ("parent_id", models.CharField(blank=True, help_text="The fullname of the thread or comment a comment is a response to. Empty for threads.", max_length=16)),
+                ("subreddit", models.CharField(help_text="The name of the subreddit the submission was posted in.", max_length=32)),
+                ("text", models.TextField(blank=True, help_text="The selftext of a thread or the body of a comment.")),
+                ("title", models.TextField(blank=True, help_text="The title of a thread. Empty for comments.")),
+                ("ups", models.IntegerField(help_text="The number of upvotes when the submission was fetched.")),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["author", "-created_utc"], name="fetchedsubmission_author_utc"),
+                    models.Index(fields=["created"], name="fetchedsubmission_created"),
+                ],
+            },
+        ),
+    ]
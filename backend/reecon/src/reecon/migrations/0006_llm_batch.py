@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reecon", "0005_fetched_submission"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LlmBatch",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created", models.DateTimeField(auto_now_add=True, help_text="Date and time of creation.")),
+                (
+                    "api_key_hash",
+                    models.CharField(help_text="The hash of the API key the batch was submitted with. The API key itself is only kept in the cache.", max_length=32),
+                ),
+                ("batch_id", models.CharField(help_text="The id of the batch assigned by the LLM provider.", max_length=64, unique=True)),
+                ("status", models.CharField(help_text="The status of the batch when it was last polled.", max_length=32)),
+                (
+                    "llm",
+                    models.ForeignKey(
+                        help_text="The LLM that processes the requests of the batch.", on_delete=django.db.models.deletion.CASCADE, related_name="batches", to="reecon.llm"
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="LlmBatchRequest",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created", models.DateTimeField(auto_now_add=True, help_text="Date and time of creation.")),
+                (
+                    "api_key_hash",
+                    models.CharField(help_text="The hash of the API key the request is submitted with. The API key itself is only kept in the cache.", max_length=32),
+                ),
+                ("env_id", models.CharField(help_text="The id of the worker env snapshot the job was processed with.", max_length=32)),
+                ("identifier", models.CharField(help_text="The username of the redditor or the URL path of the thread.")),
+                ("inputs", models.JSONField(help_text="The inputs that were prepared for the LLM.")),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("redditor", "Redditor"), ("thread", "Thread")], help_text="Whether the request processes a redditor or a thread.", max_length=16
+                    ),
+                ),
+                ("prompt", models.TextField(help_text="The prompt used to generate the data.")),
+                (
+                    "batch",
+                    models.ForeignKey(
+                        help_text="The batch the request was submitted in. Null until the request is submitted.",
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="requests",
+                        to="reecon.llmbatch",
+                    ),
+                ),
+                (
+                    "contributor",
+                    models.ForeignKey(
+                        help_text="The user who contributed resources to pay for LLM processing.",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "llm",
+                    models.ForeignKey(
+                        help_text="The LLM that processes the request.", on_delete=django.db.models.deletion.CASCADE, related_name="batch_requests", to="reecon.llm"
+                    ),
+                ),
+                (
+                    "submitter",
+                    models.ForeignKey(
+                        help_text="The user who submit request to initiate the LLM query.",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [models.UniqueConstraint(fields=("kind", "identifier"), name="llmbatchrequest_kind_identifier")],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reecon", "0006_llm_batch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="requestmetadata",
+            name="cached_input_tokens",
+            field=models.IntegerField(default=0, help_text="Number of input tokens that were read from the prompt cache of the LLM provider."),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reecon", "0007_request_metadata_cached_input_tokens"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="fetchedsubmission",
+            name="fetchedsubmission_author_utc",
+        ),
+        migrations.AddField(
+            model_name="fetchedsubmission",
+            name="listing_owner",
+            field=models.CharField(
+                blank=True,
+                help_text="The username of the redditor whose listing of threads or comments the submission is part of the stored history of. The history of a listing is only stored if it was listed to its end or to the previously stored history, so it has no gaps. Empty for submissions that were only stored as the parents of comments.",
+                max_length=32,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fetchedsubmission",
+            index=models.Index(fields=["listing_owner", "-created_utc"], name="fetchedsubmission_listing_utc"),
+        ),
+    ]
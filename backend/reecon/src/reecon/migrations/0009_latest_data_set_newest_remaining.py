@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:31
+
+import reecon.models.abstracts
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reecon", "0008_fetched_submission_listing_owner"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="redditor",
+            name="latest_data",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="The most recently created `RedditorData` entry for this redditor. This is kept up to date by `RedditorDataService.create_object`, and falls back to the newest remaining entry when it is deleted.",
+                null=True,
+                on_delete=reecon.models.abstracts.SET_NEWEST_REMAINING,
+                related_name="+",
+                to="reecon.redditordata",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="thread",
+            name="latest_data",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="The most recently created `ThreadData` entry for this thread. This is kept up to date by `ThreadDataService.create_object`, and falls back to the newest remaining entry when it is deleted.",
+                null=True,
+                on_delete=reecon.models.abstracts.SET_NEWEST_REMAINING,
+                related_name="+",
+                to="reecon.threaddata",
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:14
+
+from django.core.cache import cache
+from django.db import migrations, models
+
+
+def copy_cached_snapshots(apps, schema_editor):
+    """
+    Copy the snapshots that deferred batch requests still reference from the cache, where they were stored before.
+    """
+    llm_batch_request_model = apps.get_model("reecon", "LlmBatchRequest")
+    worker_env_snapshot_model = apps.get_model("reecon", "WorkerEnvSnapshot")
+    env_ids = set(llm_batch_request_model.objects.values_list("env_id", flat=True))
+    payloads = cache.get_many([f"worker-env:v1:{env_id}" for env_id in env_ids])
+    worker_env_snapshot_model.objects.bulk_create(
+        [worker_env_snapshot_model(env_id=key.rsplit(":", 1)[1], payload=payload.decode()) for key, payload in payloads.items()],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reecon", "0009_latest_data_set_newest_remaining"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WorkerEnvSnapshot",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created", models.DateTimeField(auto_now_add=True, help_text="Date and time of creation.")),
+                ("env_id", models.CharField(help_text="The id of the snapshot, derived from its contents.", max_length=32, unique=True)),
+                ("payload", models.TextField(help_text="The JSON encoded settings.")),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.RunPython(copy_cached_snapshots, migrations.RunPython.noop),
+    ]
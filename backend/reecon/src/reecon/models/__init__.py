@@ -1,4 +1,6 @@
+from .batch import *
 from .data import *
+from .env import *
 from .profile import *
 from .reddit import *
 from .status import *
@@ -10,18 +10,50 @@ __all__ = (
     "ContextQueryPrompt",
     "Created",
     "Description",
+    "from_values",
     "IgnoredReason",
     "LastProcessed",
     "RedditorUsername",
     "RequestMeta",
     "SentimentPolarity",
     "SentimentSubjectivity",
+    "SET_NEWEST_REMAINING",
     "Summary",
     "ThreadPath",
     "UnprocessableReason",
 )
 
 
+def from_values(model, db, values: dict):
+    """
+    Build a model instance from the values of a row, e.g. one that was selected as part of a UNION, the same way a
+    queryset does. Fields that are missing from `values` are deferred.
+    """
+    field_names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db(db, field_names, [values[field_name] for field_name in field_names])
+
+
+def SET_NEWEST_REMAINING(collector, field, sub_objs, using):
+    """
+    An `on_delete` handler for a pointer to the newest of the entries that refer back to the object, e.g.
+    `Redditor.latest_data`. When the entry it points to is deleted, it points to the newest of the remaining entries
+    instead, or to nothing if none remain. The entries are ordered by their `created` field.
+    """
+    entry_model = field.related_model
+    (back_field,) = [f for f in entry_model._meta.concrete_fields if f.is_relation and f.related_model is field.model]
+    deleted_pks = [entry.pk for entry in collector.data.get(entry_model, ())]
+    newest_remaining = dict(
+        entry_model._base_manager.using(using)
+        .filter(**{f"{back_field.attname}__in": [obj.pk for obj in sub_objs]})
+        .exclude(pk__in=deleted_pks)
+        .order_by(back_field.attname, "-created")
+        .distinct(back_field.attname)
+        .values_list(back_field.attname, "pk")
+    )
+    for obj in sub_objs:
+        collector.add_field_update(field, newest_remaining.get(obj.pk), [obj])
+
+
 class ContextQueryPrompt(models.Model):
     class Meta:
         abstract = True
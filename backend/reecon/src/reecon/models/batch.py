@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.db import models
+
+from .abstracts import Created
+from .data import LLM
+from .. import util
+
+
+__all__ = (
+    "LlmBatch",
+    "LlmBatchRequest",
+)
+
+
+class LlmBatch(Created):
+    """
+    A batch of LLM requests that was submitted to the batch API of the LLM provider.
+    """
+
+    api_key_hash = models.CharField(
+        max_length=32,
+        null=False,
+        help_text="The hash of the API key the batch was submitted with. The API key itself is only kept in the cache.",
+    )
+    batch_id = models.CharField(
+        max_length=64,
+        null=False,
+        unique=True,
+        help_text="The id of the batch assigned by the LLM provider.",
+    )
+    llm = models.ForeignKey(
+        LLM,
+        null=False,
+        on_delete=models.CASCADE,
+        related_name="batches",
+        help_text="The LLM that processes the requests of the batch.",
+    )
+    status = models.CharField(
+        max_length=32,
+        null=False,
+        help_text="The status of the batch when it was last polled.",
+    )
+
+    def __str__(self):
+        return util.format.class__str__(
+            self.__class__.__name__,
+            batch_id=self.batch_id,
+            llm=self.llm.name,
+            status=self.status,
+        )
+
+
+class LlmBatchRequest(Created):
+    """
+    The prepared inputs of a data processing job whose LLM request is deferred to a batch. The generated data is
+    stored once the batch completes, and the request is deleted afterward.
+    """
+
+    class Kind(models.TextChoices):
+        REDDITOR = "redditor"
+        THREAD = "thread"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "identifier"], name="llmbatchrequest_kind_identifier"),
+        ]
+
+    api_key_hash = models.CharField(
+        max_length=32,
+        null=False,
+        help_text="The hash of the API key the request is submitted with. The API key itself is only kept in the cache.",
+    )
+    batch = models.ForeignKey(
+        LlmBatch,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name="requests",
+        help_text="The batch the request was submitted in. Null until the request is submitted.",
+    )
+    contributor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=False,
+        on_delete=models.CASCADE,
+        related_name="+",
+        help_text="The user who contributed resources to pay for LLM processing.",
+    )
+    env_id = models.CharField(
+        max_length=32,
+        null=False,
+        help_text="The id of the worker env snapshot the job was processed with.",
+    )
+    identifier = models.CharField(
+        null=False,
+        help_text="The username of the redditor or the URL path of the thread.",
+    )
+    inputs = models.JSONField(
+        null=False,
+        help_text="The inputs that were prepared for the LLM.",
+    )
+    kind = models.CharField(
+        choices=Kind.choices,
+        max_length=16,
+        null=False,
+        help_text="Whether the request processes a redditor or a thread.",
+    )
+    llm = models.ForeignKey(
+        LLM,
+        null=False,
+        on_delete=models.CASCADE,
+        related_name="batch_requests",
+        help_text="The LLM that processes the request.",
+    )
+    prompt = models.TextField(
+        null=False,
+        help_text="The prompt used to generate the data.",
+    )
+    submitter = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=False,
+        on_delete=models.CASCADE,
+        related_name="+",
+        help_text="The user who submit request to initiate the LLM query.",
+    )
+
+    def __str__(self):
+        return util.format.class__str__(
+            self.__class__.__name__,
+            identifier=self.identifier,
+            kind=self.kind,
+            llm=self.llm.name,
+        )
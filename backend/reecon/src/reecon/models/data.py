@@ -57,6 +57,11 @@ class LLM(Created, Description):
 
 
 class RequestMetadata(models.Model):
+    cached_input_tokens = models.IntegerField(
+        default=0,
+        null=False,
+        help_text="Number of input tokens that were read from the prompt cache of the LLM provider.",
+    )
     contributor = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         null=False,
@@ -99,6 +104,7 @@ class RequestMetadata(models.Model):
     def __str__(self):
         return util.format.class__str__(
             self.__class__.__name__,
+            cached_input_tokens=self.cached_input_tokens,
             contributor=self.contributor.username,
             input_tokens=self.input_tokens,
             llm=self.llm.name,
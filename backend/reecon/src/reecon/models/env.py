@@ -0,0 +1,30 @@
+from django.db import models
+
+from .abstracts import Created
+from .. import util
+
+
+__all__ = ("WorkerEnvSnapshot",)
+
+
+class WorkerEnvSnapshot(Created):
+    """
+    A snapshot of the settings that a data processing job is processed with, see `reecon.schemas.save_worker_env`.
+    """
+
+    env_id = models.CharField(
+        max_length=32,
+        null=False,
+        unique=True,
+        help_text="The id of the snapshot, derived from its contents.",
+    )
+    payload = models.TextField(
+        null=False,
+        help_text="The JSON encoded settings.",
+    )
+
+    def __str__(self):
+        return util.format.class__str__(
+            self.__class__.__name__,
+            env_id=self.env_id,
+        )
@@ -1,2 +1,3 @@
 from .redditor import *
+from .submission import *
 from .thread import *
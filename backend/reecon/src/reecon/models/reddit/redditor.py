@@ -1,3 +1,10 @@
+import datetime as dt
+from typing import (
+    Iterable,
+    List,
+    NamedTuple,
+)
+
 from django.contrib.postgres.fields import ArrayField
 from django.db import models
 from django.utils.text import Truncator
@@ -5,12 +12,14 @@ from django.utils.text import Truncator
 from ..abstracts import (
     ContextQueryPrompt,
     Created,
+    from_values,
     IgnoredReason,
     LastProcessed,
     RedditorUsername,
     RequestMeta,
     SentimentPolarity,
     SentimentSubjectivity,
+    SET_NEWEST_REMAINING,
     Summary,
     UnprocessableReason,
 )
@@ -20,6 +29,7 @@ from ... import util
 __all__ = (
     "IgnoredRedditor",
     "Redditor",
+    "RedditorClassification",
     "RedditorContextQuery",
     "RedditorData",
     "UnprocessableRedditor",
@@ -40,11 +50,110 @@ class IgnoredRedditor(Created, IgnoredReason, RedditorUsername):
         )
 
 
+class RedditorClassification(NamedTuple):
+    fresh: List["Redditor"]
+    stale: List["Redditor"]
+    unprocessable: List["UnprocessableRedditor"]
+    ignored: List["IgnoredRedditor"]
+
+
+class RedditorQuerySet(models.QuerySet):
+    def classify(self, usernames: Iterable[str], *, stale_before: dt.datetime) -> RedditorClassification:
+        """
+        Look up the state of every username in a single query. The matching `Redditor`, `UnprocessableRedditor` and
+        `IgnoredRedditor` rows are combined with UNION ALL and returned as model instances, so they can be serialized
+        without being queried again. Usernames that are not in any of the returned lists are unknown.
+
+        Args:
+            usernames (Iterable[str]): The usernames to classify.
+            stale_before (dt.datetime): Redditors last processed before this are stale instead of fresh.
+
+        Returns:
+            RedditorClassification: The fresh, stale, unprocessable and ignored entries of the usernames.
+        """
+        usernames = list(usernames)
+        null_datetime = models.Value(None, output_field=models.DateTimeField())
+        null_id = models.Value(None, output_field=models.BigIntegerField())
+        null_text = models.Value(None, output_field=models.TextField())
+
+        redditors = self.filter(username__in=usernames).values(
+            row_state=models.Case(
+                models.When(last_processed__lt=stale_before, then=models.Value("stale")),
+                default=models.Value("fresh"),
+            ),
+            row_id=models.F("id"),
+            row_created=models.F("created"),
+            row_username=models.F("username"),
+            row_last_processed=models.F("last_processed"),
+            row_latest_data_id=models.F("latest_data_id"),
+            row_reason=null_text,
+        )
+        unprocessable_redditors = UnprocessableRedditor.objects.filter(username__in=usernames).values(
+            row_state=models.Value("unprocessable"),
+            row_id=models.F("id"),
+            row_created=models.F("created"),
+            row_username=models.F("username"),
+            row_last_processed=null_datetime,
+            row_latest_data_id=null_id,
+            row_reason=models.F("reason"),
+        )
+        ignored_redditors = IgnoredRedditor.objects.filter(username__in=usernames).values(
+            row_state=models.Value("ignored"),
+            row_id=models.F("id"),
+            row_created=models.F("created"),
+            row_username=models.F("username"),
+            row_last_processed=null_datetime,
+            row_latest_data_id=null_id,
+            row_reason=models.F("reason"),
+        )
+
+        classification = RedditorClassification(fresh=[], stale=[], unprocessable=[], ignored=[])
+        for row in redditors.union(unprocessable_redditors, ignored_redditors, all=True):
+            values = {
+                "id": row["row_id"],
+                "created": row["row_created"],
+                "username": row["row_username"],
+            }
+            if row["row_state"] in ("fresh", "stale"):
+                values.update(last_processed=row["row_last_processed"], latest_data_id=row["row_latest_data_id"])
+                getattr(classification, row["row_state"]).append(from_values(Redditor, self.db, values))
+            elif row["row_state"] == "unprocessable":
+                classification.unprocessable.append(from_values(UnprocessableRedditor, self.db, {**values, "reason": row["row_reason"]}))
+            else:
+                classification.ignored.append(from_values(IgnoredRedditor, self.db, {**values, "reason": row["row_reason"]}))
+        return classification
+
+    def with_latest_data(self):
+        """
+        Join the latest `RedditorData` entry of every redditor, along with the `RequestMetadata` graph that gets serialized
+        with it, so that accessing `Redditor.latest_data` does not cost a query per redditor.
+        """
+        return self.select_related(
+            "latest_data__request_meta__contributor",
+            "latest_data__request_meta__llm__provider",
+            "latest_data__request_meta__submitter",
+        )
+
+
 class Redditor(Created, LastProcessed, RedditorUsername):
     """
     Stores a single redditor entry.
     """
 
+    latest_data = models.ForeignKey(
+        "RedditorData",
+        null=True,
+        blank=True,
+        on_delete=SET_NEWEST_REMAINING,
+        related_name="+",
+        help_text=(
+            "The most recently created `RedditorData` entry for this redditor. This is kept up to date by `RedditorDataService.create_object`, and "
+            "falls back to the newest remaining entry when it is deleted."
+        ),
+    )
+
+    objects = RedditorQuerySet.as_manager()
+
     def __str__(self):
         return util.format.class__str__(
             self.__class__.__name__,
@@ -80,6 +189,12 @@ class RedditorData(Created, RequestMeta, SentimentPolarity, SentimentSubjectivit
     Stores a single redditor data entry. These values are generated by an LLM.
     """
 
+    class Meta:
+        indexes = [
+            # Serves newest-first lookups of a redditor's data, e.g. `redditor.data.latest("created")`.
+            models.Index(fields=["redditor", "-created"], name="redditordata_redditor_created"),
+        ]
+
     age = models.IntegerField(
         null=False,
         help_text="The inferred age of the redditor based on their submissions.",
@@ -123,6 +238,12 @@ class UnprocessableRedditor(Created, RedditorUsername, UnprocessableReason):
     comment / thread submissions available for processing.
     """
 
+    class Meta:
+        indexes = [
+            # Serves the `created__lte` range delete in the scheduled cleanup job.
+            models.Index(fields=["created"], name="unprocessableredditor_created"),
+        ]
+
     def __str__(self):
         return util.format.class__str__(
             self.__class__.__name__,
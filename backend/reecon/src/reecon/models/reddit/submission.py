@@ -0,0 +1,137 @@
+from typing import Iterable
+
+from django.db import models
+from django.utils.text import Truncator
+
+from ..abstracts import Created
+from ... import util
+
+
+__all__ = ("FetchedSubmission",)
+
+
+class FetchedSubmissionQuerySet(models.QuerySet):
+    def store(self, submissions: Iterable["FetchedSubmission"], *, listing_owner: str = "") -> None:
+        """
+        Insert fetched submissions with a single query. Submissions that are already stored are updated with the newly
+        fetched values, e.g. their latest vote counts.
+
+        Args:
+            submissions (Iterable[FetchedSubmission]): The unsaved submissions to store.
+            listing_owner (str): The username of the redditor whose listing the submissions continue the stored history
+                of. The submissions become part of that history, including the ones that were already stored as parents
+                of other comments. Submissions that already are part of a history stay part of it if this is empty.
+        """
+        # Postgres rejects an upsert that affects the same row twice, so only keep the last of duplicate fullnames.
+        submissions = {submission.fullname: submission for submission in submissions}
+        update_fields = ["author", "downs", "parent_id", "subreddit", "text", "title", "ups"]
+        if listing_owner:
+            for submission in submissions.values():
+                submission.listing_owner = listing_owner
+            # The history is expired from its oldest submissions, so a submission that joins it counts as stored now.
+            update_fields += ["created", "listing_owner"]
+        self.bulk_create(
+            submissions.values(),
+            update_conflicts=True,
+            unique_fields=["fullname"],
+            update_fields=update_fields,
+        )
+
+    def unlist(self, listing_owner: str, *, is_thread: bool) -> int:
+        """
+        Remove the threads or the comments of a redditor from their stored history. The submissions stay stored for
+        looking up the parents of comments.
+
+        Args:
+            listing_owner (str): The username of the redditor.
+            is_thread (bool): Whether to remove the threads or the comments.
+
+        Returns:
+            int: The number of submissions that were removed from the history.
+        """
+        return self.filter(fullname__startswith="t3_" if is_thread else "t1_", listing_owner=listing_owner).update(listing_owner="")
+
+
+class FetchedSubmission(Created):
+    """
+    Stores a single thread or comment as it was fetched from reddit, so that reprocessing an entity only fetches
+    submissions that are newer than the ones already stored. The text is stored before sanitization.
+    """
+
+    class Meta:
+        indexes = [
+            # Serves newest-first lookups of a redditor's stored history.
+            models.Index(fields=["listing_owner", "-created_utc"], name="fetchedsubmission_listing_utc"),
+            # Serves the `created__lte` range delete in the scheduled cleanup job.
+            models.Index(fields=["created"], name="fetchedsubmission_created"),
+        ]
+
+    author = models.CharField(
+        blank=True,
+        max_length=32,
+        null=False,
+        help_text="The username of the author. Empty if the author deleted their account.",
+    )
+    created_utc = models.FloatField(
+        null=False,
+        help_text="The unix timestamp of when the submission was posted to reddit.",
+    )
+    downs = models.IntegerField(
+        null=False,
+        help_text="The number of downvotes when the submission was fetched.",
+    )
+    fullname = models.CharField(
+        max_length=16,
+        null=False,
+        unique=True,
+        help_text="The reddit fullname of the submission, e.g. `t1_abc123` for a comment or `t3_abc123` for a thread.",
+    )
+    listing_owner = models.CharField(
+        blank=True,
+        max_length=32,
+        null=False,
+        help_text=(
+            "The username of the redditor whose listing of threads or comments the submission is part of the stored "
+            "history of. The history of a listing is only stored if it was listed to its end or to the previously stored "
+            "history, so it has no gaps. Empty for submissions that were only stored as the parents of comments."
+        ),
+    )
+    parent_id = models.CharField(
+        blank=True,
+        max_length=16,
+        null=False,
+        help_text="The fullname of the thread or comment a comment is a response to. Empty for threads.",
+    )
+    subreddit = models.CharField(
+        max_length=32,
+        null=False,
+        help_text="The name of the subreddit the submission was posted in.",
+    )
+    text = models.TextField(
+        blank=True,
+        null=False,
+        help_text="The selftext of a thread or the body of a comment.",
+    )
+    title = models.TextField(
+        blank=True,
+        null=False,
+        help_text="The title of a thread. Empty for comments.",
+    )
+    ups = models.IntegerField(
+        null=False,
+        help_text="The number of upvotes when the submission was fetched.",
+    )
+
+    objects = FetchedSubmissionQuerySet.as_manager()
+
+    def __str__(self):
+        return util.format.class__str__(
+            self.__class__.__name__,
+            author=self.author,
+            fullname=self.fullname,
+            text=Truncator(self.text).chars(100),
+        )
+
+    @property
+    def is_thread(self) -> bool:
+        return self.fullname.startswith("t3_")
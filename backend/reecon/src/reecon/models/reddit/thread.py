@@ -1,3 +1,10 @@
+import datetime as dt
+from typing import (
+    Iterable,
+    List,
+    NamedTuple,
+)
+
 from django.contrib.postgres.fields import ArrayField
 from django.db import models
 from django.utils.text import Truncator
@@ -5,10 +12,12 @@ from django.utils.text import Truncator
 from ..abstracts import (
     ContextQueryPrompt,
     Created,
+    from_values,
     LastProcessed,
     RequestMeta,
     SentimentPolarity,
     SentimentSubjectivity,
+    SET_NEWEST_REMAINING,
     Summary,
     ThreadPath,
     UnprocessableReason,
@@ -18,6 +27,7 @@ from ... import util
 
 __all__ = (
     "Thread",
+    "ThreadClassification",
     "ThreadContextQuery",
     "ThreadData",
     "UnprocessableThread",
@@ -25,11 +35,94 @@ __all__ = (
 )
 
 
+class ThreadClassification(NamedTuple):
+    fresh: List["Thread"]
+    stale: List["Thread"]
+    unprocessable: List["UnprocessableThread"]
+
+
+class ThreadQuerySet(models.QuerySet):
+    def classify(self, paths: Iterable[str], *, stale_before: dt.datetime) -> ThreadClassification:
+        """
+        Look up the state of every thread path in a single query. The matching `Thread` and `UnprocessableThread` rows
+        are combined with UNION ALL and returned as model instances, so they can be serialized without being queried
+        again. Paths that are not in any of the returned lists are unknown.
+
+        Args:
+            paths (Iterable[str]): The thread URL paths to classify.
+            stale_before (dt.datetime): Threads last processed before this are stale instead of fresh.
+
+        Returns:
+            ThreadClassification: The fresh, stale and unprocessable entries of the paths.
+        """
+        paths = list(paths)
+        threads = self.filter(path__in=paths).values(
+            row_state=models.Case(
+                models.When(last_processed__lt=stale_before, then=models.Value("stale")),
+                default=models.Value("fresh"),
+            ),
+            row_id=models.F("id"),
+            row_created=models.F("created"),
+            row_path=models.F("path"),
+            row_last_processed=models.F("last_processed"),
+            row_latest_data_id=models.F("latest_data_id"),
+            row_reason=models.Value(None, output_field=models.TextField()),
+        )
+        unprocessable_threads = UnprocessableThread.objects.filter(path__in=paths).values(
+            row_state=models.Value("unprocessable"),
+            row_id=models.F("id"),
+            row_created=models.F("created"),
+            row_path=models.F("path"),
+            row_last_processed=models.Value(None, output_field=models.DateTimeField()),
+            row_latest_data_id=models.Value(None, output_field=models.BigIntegerField()),
+            row_reason=models.F("reason"),
+        )
+
+        classification = ThreadClassification(fresh=[], stale=[], unprocessable=[])
+        for row in threads.union(unprocessable_threads, all=True):
+            values = {
+                "id": row["row_id"],
+                "created": row["row_created"],
+                "path": row["row_path"],
+            }
+            if row["row_state"] in ("fresh", "stale"):
+                values.update(last_processed=row["row_last_processed"], latest_data_id=row["row_latest_data_id"])
+                getattr(classification, row["row_state"]).append(from_values(Thread, self.db, values))
+            else:
+                classification.unprocessable.append(from_values(UnprocessableThread, self.db, {**values, "reason": row["row_reason"]}))
+        return classification
+
+    def with_latest_data(self):
+        """
+        Join the latest `ThreadData` entry of every thread, along with the `RequestMetadata` graph that gets serialized
+        with it, so that accessing `Thread.latest_data` does not cost a query per thread.
+        """
+        return self.select_related(
+            "latest_data__request_meta__contributor",
+            "latest_data__request_meta__llm__provider",
+            "latest_data__request_meta__submitter",
+        )
+
+
 class Thread(Created, LastProcessed, ThreadPath):
     """
     Stores a single reddit thread entry. These stats are generated by an LLM based on a prompt.
     """
 
+    latest_data = models.ForeignKey(
+        "ThreadData",
+        null=True,
+        blank=True,
+        on_delete=SET_NEWEST_REMAINING,
+        related_name="+",
+        help_text=(
+            "The most recently created `ThreadData` entry for this thread. This is kept up to date by `ThreadDataService.create_object`, and "
+            "falls back to the newest remaining entry when it is deleted."
+        ),
+    )
+
+    objects = ThreadQuerySet.as_manager()
+
     def __str__(self):
         return util.format.class__str__(
             self.__class__.__name__,
@@ -65,6 +158,12 @@ class ThreadData(Created, RequestMeta, SentimentPolarity, SentimentSubjectivity,
     Stores a single thread data entry. These values are generated by an LLM.
     """
 
+    class Meta:
+        indexes = [
+            # Serves newest-first lookups of a thread's data, e.g. `thread.data.latest("created")`.
+            models.Index(fields=["thread", "-created"], name="threaddata_thread_created"),
+        ]
+
     keywords = ArrayField(
         models.CharField(
             null=False,
@@ -98,6 +197,12 @@ class UnprocessableThread(Created, ThreadPath, UnprocessableReason):
     comments available for processing.
     """
 
+    class Meta:
+        indexes = [
+            # Serves the `created__lte` range delete in the scheduled cleanup job.
+            models.Index(fields=["created"], name="unprocessablethread_created"),
+        ]
+
     def __str__(self):
         return util.format.class__str__(
             self.__class__.__name__,
@@ -1,10 +1,20 @@
 import datetime as dt
+import functools
+import hashlib
 
-from pydantic import Field
+from pydantic import (
+    Field,
+    TypeAdapter,
+)
 from pydantic.dataclasses import dataclass
 
 
-__all__ = ("get_worker_env", "WorkerEnv")
+__all__ = (
+    "get_worker_env",
+    "load_worker_env",
+    "save_worker_env",
+    "WorkerEnv",
+)
 
 
 @dataclass
@@ -20,12 +30,17 @@ class LlmEnv:
         ge=0.0,
         le=1.0,
     )
+    exact_token_counting: bool = False
+    # Snapshots stored before inputs could be encoded differently were processed with the JSON encoding.
+    input_encoding: str = "json"
 
 
 @dataclass
 class RedditSubmissionEnv:
     max_length: int
     min_length: int
+    # 0 disables parallel sanitization.
+    parallel_sanitize_threshold: int = 0
 
 
 @dataclass
@@ -52,11 +67,19 @@ class RedditorAccountEnv:
     min_age: dt.timedelta
 
 
+@dataclass
+class RedditorListingEnv:
+    # 0 lists as many submissions as reddit returns, which is at most 1000.
+    max_submissions: int = 100
+
+
 @dataclass
 class RedditorEnv:
     account: RedditorAccountEnv
     llm: LlmEnv
     submission: RedditEntitySubmissionEnv
+    # Snapshots stored before the listings could be configured were listed with the default limit of praw.
+    listing: RedditorListingEnv = Field(default_factory=RedditorListingEnv)
 
 
 @dataclass
@@ -92,13 +115,19 @@ def get_worker_env():
             submission=RedditSubmissionEnv(
                 max_length=config.SUBMISSION_FILTER_MAX_LENGTH,
                 min_length=config.SUBMISSION_FILTER_MIN_LENGTH,
+                parallel_sanitize_threshold=config.SUBMISSION_PARALLEL_SANITIZE_THRESHOLD,
             ),
         ),
         redditor=RedditorEnv(
             account=RedditorAccountEnv(
                 min_age=config.REDDITOR_ACCOUNT_MIN_AGE,
             ),
+            listing=RedditorListingEnv(
+                max_submissions=config.REDDITOR_LISTING_MAX_SUBMISSIONS,
+            ),
             llm=LlmEnv(
+                exact_token_counting=config.LLM_EXACT_TOKEN_COUNTING_ENABLED,
+                input_encoding=config.LLM_INPUT_ENCODING,
                 max_context_window_for_inputs=config.LLM_MAX_CONTEXT_WINDOW_FOR_INPUTS,
                 prompts=LlmPromptEnv(
                     process_context_query=config.REDDITOR_LLM_CONTEXT_QUERY_PROMPT,
@@ -111,6 +140,8 @@ def get_worker_env():
         ),
         thread=ThreadEnv(
             llm=LlmEnv(
+                exact_token_counting=config.LLM_EXACT_TOKEN_COUNTING_ENABLED,
+                input_encoding=config.LLM_INPUT_ENCODING,
                 max_context_window_for_inputs=config.LLM_MAX_CONTEXT_WINDOW_FOR_INPUTS,
                 prompts=LlmPromptEnv(
                     process_context_query=config.THREAD_LLM_CONTEXT_QUERY_PROMPT,
@@ -122,3 +153,44 @@ def get_worker_env():
             ),
         ),
     )
+
+
+def save_worker_env(env: WorkerEnv) -> str:
+    """
+    Store a snapshot of `env` in the database and return its id. Jobs only carry the id, so the prompts are stored once
+    instead of being pickled into every job. The id is derived from the contents of `env`, so enqueuing jobs with an
+    unchanged env reuses the existing snapshot and changing a prompt or setting creates a new one. Snapshots are not
+    kept in the cache, which may evict them while deferred jobs and batch requests still reference them.
+
+    Args:
+        env (WorkerEnv): The env to store.
+
+    Returns:
+        str: The id of the snapshot that can be passed to `load_worker_env`.
+    """
+    from .. import models
+
+    payload = TypeAdapter(WorkerEnv).dump_json(env)
+    env_id = hashlib.sha256(payload).hexdigest()[:32]
+    models.WorkerEnvSnapshot.objects.get_or_create(env_id=env_id, defaults={"payload": payload.decode()})
+    return env_id
+
+
+@functools.lru_cache(maxsize=32)
+def load_worker_env(env_id: str) -> WorkerEnv:
+    """
+    Load a snapshot stored by `save_worker_env`. Snapshots never change once they are stored, so they are kept in
+    memory after being loaded once. The returned env is shared and must not be modified.
+
+    Args:
+        env_id (str): The id returned by `save_worker_env`.
+
+    Returns:
+        WorkerEnv: The stored env.
+    """
+    from .. import models
+
+    snapshot = models.WorkerEnvSnapshot.objects.filter(env_id=env_id).first()
+    if snapshot is None:
+        raise LookupError(f"Worker env snapshot {env_id} does not exist")
+    return TypeAdapter(WorkerEnv).validate_json(snapshot.payload)
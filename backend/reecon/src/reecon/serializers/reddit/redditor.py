@@ -1,6 +1,9 @@
+from constance import config
+from django.db import models
 from rest_framework import serializers
 
 from ..data import RequestMetadataSerializer
+from ... import util
 from ...models import (
     IgnoredRedditor,
     Redditor,
@@ -12,6 +15,7 @@ from ...models import (
 
 __all__ = (
     "IgnoredRedditorSerializer",
+    "ProcessedRedditorListSerializer",
     "ProcessedRedditorSerializer",
     "RedditorContextQuerySerializer",
     "RedditorDataSerializer",
@@ -33,6 +37,31 @@ class IgnoredRedditorSerializer(serializers.ModelSerializer):
         exclude = ("id",)
 
 
+class ProcessedRedditorListSerializer(serializers.ListSerializer):
+    """
+    Serializes many redditors through a read-through cache keyed by username. The cached representations are fetched with
+    a single multi-get and only the redditors missing from the cache are serialized. Their latest data is loaded in one
+    query unless it was already loaded with the redditors. Cache entries are invalidated when a new `RedditorData` entry
+    is created for the redditor.
+    """
+
+    def to_representation(self, data):
+        redditors = {redditor.username: redditor for redditor in (data.all() if isinstance(data, models.manager.BaseManager) else data)}
+
+        def load(missing):
+            unloaded_pks = [redditors[username].pk for username in missing if not Redditor.latest_data.is_cached(redditors[username])]
+            loaded = Redditor.objects.filter(pk__in=unloaded_pks).with_latest_data().in_bulk() if unloaded_pks else {}
+            return {username: self.child.to_representation(loaded.get(redditors[username].pk, redditors[username])) for username in missing}
+
+        representations = util.cache.get_or_set_many(
+            redditors,
+            key_func=util.cache.processed_redditor_key,
+            load_func=load,
+            timeout=config.REDDITOR_FRESHNESS_TD.total_seconds(),
+        )
+        return [representations[username] for username in redditors]
+
+
 class ProcessedRedditorSerializer(serializers.ModelSerializer):
     data = serializers.SerializerMethodField(
         "get_data",
@@ -47,14 +76,18 @@ class ProcessedRedditorSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Redditor
-        exclude = ("id",)
+        exclude = (
+            "id",
+            "latest_data",
+        )
+        list_serializer_class = ProcessedRedditorListSerializer
 
     def get_data(self, redditor: Redditor) -> dict:
         """
         Even though we are storing all RedditorData entries, we only want to serialize
         the latest one, not all of them.
         """
-        data = redditor.data.latest("created")
+        data = redditor.latest_data
         serializer = RedditorDataSerializer(instance=data)
         return serializer.data
 
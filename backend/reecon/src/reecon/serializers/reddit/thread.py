@@ -1,6 +1,9 @@
+from constance import config
+from django.db import models
 from rest_framework import serializers
 
 from ..data import RequestMetadataSerializer
+from ... import util
 from ...models import (
     Thread,
     ThreadContextQuery,
@@ -11,6 +14,7 @@ from ...models import (
 
 
 __all__ = (
+    "ProcessedThreadListSerializer",
     "ProcessedThreadSerializer",
     "ThreadContextQuerySerializer",
     "ThreadDataSerializer",
@@ -19,6 +23,31 @@ __all__ = (
 )
 
 
+class ProcessedThreadListSerializer(serializers.ListSerializer):
+    """
+    Serializes many threads through a read-through cache keyed by path. The cached representations are fetched with
+    a single multi-get and only the threads missing from the cache are serialized. Their latest data is loaded in one
+    query unless it was already loaded with the threads. Cache entries are invalidated when a new `ThreadData` entry
+    is created for the thread.
+    """
+
+    def to_representation(self, data):
+        threads = {thread.path: thread for thread in (data.all() if isinstance(data, models.manager.BaseManager) else data)}
+
+        def load(missing):
+            unloaded_pks = [threads[path].pk for path in missing if not Thread.latest_data.is_cached(threads[path])]
+            loaded = Thread.objects.filter(pk__in=unloaded_pks).with_latest_data().in_bulk() if unloaded_pks else {}
+            return {path: self.child.to_representation(loaded.get(threads[path].pk, threads[path])) for path in missing}
+
+        representations = util.cache.get_or_set_many(
+            threads,
+            key_func=util.cache.processed_thread_key,
+            load_func=load,
+            timeout=config.THREAD_FRESHNESS_TD.total_seconds(),
+        )
+        return [representations[path] for path in threads]
+
+
 class ProcessedThreadSerializer(serializers.ModelSerializer):
     data = serializers.SerializerMethodField(
         "get_data",
@@ -36,14 +65,18 @@ class ProcessedThreadSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Thread
-        exclude = ("id",)
+        exclude = (
+            "id",
+            "latest_data",
+        )
+        list_serializer_class = ProcessedThreadListSerializer
 
     def get_data(self, thread: Thread) -> dict:
         """
         Even though we are storing all ThreadData entries, we only want to serialize
         the latest one, not all of them.
         """
-        data = thread.data.latest("created")
+        data = thread.latest_data
         serializer = ThreadDataSerializer(instance=data)
         return serializer.data
 
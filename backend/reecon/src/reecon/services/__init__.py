@@ -1,2 +1,5 @@
+from .batch import *
+from .clients import *
 from .llm_provider import *
+from .ratelimit import *
 from .reddit import *
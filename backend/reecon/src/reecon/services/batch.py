@@ -0,0 +1,365 @@
+import copy
+import itertools
+import json
+import logging
+from typing import (
+    Dict,
+    List,
+    Type,
+)
+
+from constance import config
+from django.core.cache import cache
+from django.db import transaction
+import django_rq
+from langchain_core.messages import AIMessage
+import pydantic
+import pydantic.json
+
+from . import (
+    clients,
+    llm_provider,
+)
+from .reddit import (
+    RedditorDataService,
+    ThreadDataService,
+)
+from .. import (
+    models,
+    schemas,
+)
+
+
+log = logging.getLogger("reecon.services.batch")
+
+
+__all__ = (
+    "defer",
+    "find",
+    "generate",
+    "poll_submitted",
+    "should_defer",
+    "submit_pending",
+)
+
+
+# The batch API ends batches within 24 hours of their submission. API keys are kept for an hour longer, so that the
+# output of a batch can still be downloaded by the next poll, and are deleted as soon as no batch needs them anymore.
+API_KEY_CACHE_TIMEOUT = 25 * 60 * 60
+BATCH_ENDPOINT = "/v1/chat/completions"
+# The statuses of batches that will not change anymore. Expired and cancelled batches may still have completed some of
+# their requests.
+TERMINAL_STATUSES = ("cancelled", "completed", "expired", "failed")
+
+SERVICES = {
+    models.LlmBatchRequest.Kind.REDDITOR: RedditorDataService,
+    models.LlmBatchRequest.Kind.THREAD: ThreadDataService,
+}
+KINDS = {service_cls: kind for kind, service_cls in SERVICES.items()}
+
+
+def _api_key_key(api_key_hash: str) -> str:
+    return f"llm-batch-api-key:{api_key_hash}"
+
+
+def _release_api_key(api_key_hash: str) -> None:
+    # `defer` caches the API key after storing its request, so a key that is still needed is never deleted here.
+    if not models.LlmBatchRequest.objects.filter(api_key_hash=api_key_hash).exists():
+        cache.delete(_api_key_key(api_key_hash))
+
+
+def _strict_json_schema(schema: dict) -> dict:
+    # Structured outputs require every object to forbid additional properties and to list all of its properties as
+    # required.
+    if schema.get("type") == "object":
+        schema["additionalProperties"] = False
+        schema["required"] = list(schema.get("properties", {}))
+    for key in ("$defs", "properties"):
+        for subschema in schema.get(key, {}).values():
+            _strict_json_schema(subschema)
+    for key in ("allOf", "anyOf"):
+        for subschema in schema.get(key, []):
+            _strict_json_schema(subschema)
+    if isinstance(schema.get("items"), dict):
+        _strict_json_schema(schema["items"])
+    return schema
+
+
+def _response_format(model: Type[pydantic.BaseModel]) -> dict:
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model.__name__,
+            "schema": _strict_json_schema(copy.deepcopy(model.model_json_schema())),
+            "strict": True,
+        },
+    }
+
+
+def should_defer() -> bool:
+    """
+    Returns whether the LLM request of a data processing job is deferred to a batch. Requests of jobs in the `high`
+    queue are always made right away, because a user is waiting on them.
+    """
+    return config.LLM_BATCH_ENABLED and llm_provider.current_priority() != "high"
+
+
+def find(service: RedditorDataService | ThreadDataService) -> models.LlmBatchRequest | None:
+    """
+    Returns the deferred request for the identifier of `service` if one is pending or submitted.
+    """
+    return models.LlmBatchRequest.objects.filter(identifier=service.identifier, kind=KINDS[type(service)]).first()
+
+
+def defer(service: RedditorDataService | ThreadDataService, *, inputs: List[schemas.LlmInput], prompt: str) -> models.LlmBatchRequest:
+    """
+    Store the prepared inputs of a data processing job so that its LLM request is submitted with the next batch.
+
+    Args:
+        service (RedditorDataService | ThreadDataService): The service of the job.
+        inputs (List[schemas.LlmInput]): The inputs to be processed by the LLM.
+        prompt (str): The prompt to be used for generation.
+
+    Returns:
+        models.LlmBatchRequest: The deferred request. An existing request is returned if the identifier is already deferred.
+    """
+    api_key = service.llm_provider.api_key
+    api_key_hash = llm_provider.api_key_hash(api_key)
+    request, _ = models.LlmBatchRequest.objects.get_or_create(
+        identifier=service.identifier,
+        kind=KINDS[type(service)],
+        defaults={
+            "api_key_hash": api_key_hash,
+            "contributor": service.contributor,
+            "env_id": schemas.save_worker_env(service.env),
+            "inputs": json.loads(json.dumps(inputs, default=pydantic.json.pydantic_encoder)),
+            "llm": service.llm,
+            "prompt": prompt,
+            "submitter": service.submitter,
+        },
+    )
+    # The API key is only kept in the cache, and only for as long as requests using it may be pending or in progress.
+    cache.set(_api_key_key(api_key_hash), api_key, API_KEY_CACHE_TIMEOUT)
+    return request
+
+
+def _batch_line(request: models.LlmBatchRequest) -> dict:
+    # The inputs are encoded the same way as they would have been without batching.
+    llm_env = getattr(schemas.load_worker_env(request.env_id), request.kind).llm
+    inputs = pydantic.TypeAdapter(List[schemas.LlmInput]).validate_python(request.inputs)
+    return {
+        "custom_id": str(request.pk),
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": request.llm.name,
+            "messages": [
+                {"role": "system", "content": request.prompt},
+                {"role": "user", "content": llm_provider.INPUT_ENCODERS[llm_env.input_encoding].encode(inputs)},
+            ],
+            "response_format": _response_format(SERVICES[request.kind].response_format),
+        },
+    }
+
+
+def submit_pending() -> List[models.LlmBatch]:
+    """
+    Submit the pending requests to the batch API. The requests are grouped by API key and LLM, since a batch is billed to
+    a single API key and only contains requests for a single model.
+
+    Returns:
+        List[models.LlmBatch]: The submitted batches.
+    """
+    batches = []
+    pending = models.LlmBatchRequest.objects.filter(batch__isnull=True).select_related("llm").order_by("api_key_hash", "llm_id", "pk")
+    for (api_key_hash, llm_id), group in itertools.groupby(pending, key=lambda request: (request.api_key_hash, request.llm_id)):
+        group = list(group)
+        if (api_key := cache.get(_api_key_key(api_key_hash))) is None:
+            log.warning("Dropping %d deferred requests because their API key has expired", len(group))
+            models.LlmBatchRequest.objects.filter(pk__in=[request.pk for request in group]).delete()
+            continue
+
+        # The lifetime of the API key starts over with the batches it is submitted with.
+        cache.touch(_api_key_key(api_key_hash), API_KEY_CACHE_TIMEOUT)
+        client = clients.get_openai_client(api_key=api_key)
+        for i in range(0, len(group), config.LLM_BATCH_MAX_REQUESTS):
+            chunk = group[i : i + config.LLM_BATCH_MAX_REQUESTS]
+            content = "\n".join(json.dumps(_batch_line(request)) for request in chunk).encode()
+            input_file = client.files.create(file=("batch.jsonl", content), purpose="batch")
+            remote_batch = client.batches.create(completion_window="24h", endpoint=BATCH_ENDPOINT, input_file_id=input_file.id)
+            with transaction.atomic():
+                batch = models.LlmBatch.objects.create(api_key_hash=api_key_hash, batch_id=remote_batch.id, llm_id=llm_id, status=remote_batch.status)
+                models.LlmBatchRequest.objects.filter(pk__in=[request.pk for request in chunk]).update(batch=batch)
+            log.info("Submitted batch %s with %d requests", batch.batch_id, len(chunk))
+            batches.append(batch)
+    return batches
+
+
+def _parse_output(content: str) -> Dict[int, dict]:
+    # Maps the primary key of every request that succeeded to the body of its chat completion.
+    results = {}
+    for line in content.splitlines():
+        if line.strip():
+            result = json.loads(line)
+            if result.get("response") and result["response"]["status_code"] == 200:
+                results[int(result["custom_id"])] = result["response"]["body"]
+    return results
+
+
+def _raw_response(service: RedditorDataService | ThreadDataService, body: dict | None) -> schemas.LlmProviderRawResponse | None:
+    if body is None:
+        return None
+    content = body["choices"][0]["message"]["content"] or ""
+    try:
+        parsed = service.response_format.model_validate_json(content)
+    except pydantic.ValidationError:
+        return None
+    raw = AIMessage(
+        content=content,
+        usage_metadata={
+            "input_token_details": {"cache_read": body["usage"].get("prompt_tokens_details", {}).get("cached_tokens", 0)},
+            "input_tokens": body["usage"]["prompt_tokens"],
+            "output_tokens": body["usage"]["completion_tokens"],
+            "total_tokens": body["usage"]["total_tokens"],
+        },
+    )
+    raw_response = schemas.LlmProviderRawResponse(parsed=parsed, raw=raw)
+    return None if llm_provider.is_missing_expected_generated_data(raw_response) else raw_response
+
+
+def _get_service(
+    *, kind: str, identifier: str, contributor: models.AppUser, llm: models.LLM, api_key: str, submitter: models.AppUser, env_id: str
+) -> RedditorDataService | ThreadDataService:
+    return SERVICES[kind](
+        identifier=identifier,
+        contributor=contributor,
+        llm=llm,
+        llm_providers_settings=schemas.LlmProvidersSettings.model_validate({llm.provider.name: {"api_key": api_key}}),
+        submitter=submitter,
+        env=schemas.load_worker_env(env_id),
+    )
+
+
+def generate(
+    *,
+    kind: str,
+    identifier: str,
+    contributor_id: int,
+    llm_id: int,
+    api_key: str,
+    submitter_id: int,
+    env_id: str,
+    inputs: List[dict],
+    prompt: str,
+) -> models.RedditorData | models.ThreadData:
+    """
+    Generate the data of a deferred request without batching, like a job without batching would. This is the job that
+    `poll_submitted` enqueues for the requests that failed in their batch or returned unusable data.
+
+    Returns:
+        models.RedditorData | models.ThreadData: The created data.
+    """
+    service = _get_service(
+        kind=kind,
+        identifier=identifier,
+        contributor=models.AppUser.objects.get(pk=contributor_id),
+        llm=models.LLM.objects.select_related("provider").get(pk=llm_id),
+        api_key=api_key,
+        submitter=models.AppUser.objects.get(pk=submitter_id),
+        env_id=env_id,
+    )
+    with llm_provider.priority("default"):
+        generated = service.generate(inputs=pydantic.TypeAdapter(List[schemas.LlmInput]).validate_python(inputs), prompt=prompt)
+    return service.create_object(generated=generated)
+
+
+def _complete(request: models.LlmBatchRequest, api_key: str, body: dict | None) -> None:
+    # Every request is deleted in the same transaction that stores its outcome, so a poll that is interrupted halfway
+    # through a batch does not store the data of the completed requests again.
+    service = _get_service(
+        kind=request.kind,
+        identifier=request.identifier,
+        contributor=request.contributor,
+        llm=request.llm,
+        api_key=api_key,
+        submitter=request.submitter,
+        env_id=request.env_id,
+    )
+    if raw_response := _raw_response(service, body):
+        inputs = pydantic.TypeAdapter(List[schemas.LlmInput]).validate_python(request.inputs)
+        generated = service.parse_response(inputs=inputs, prompt=request.prompt, raw_response=raw_response)
+        with transaction.atomic():
+            service.create_object(generated=generated)
+            request.delete()
+    else:
+        # Requests that failed or returned unusable data fall back to a regular request in a job of their own, so that a
+        # poll is not held up by them.
+        log.info("Enqueueing %s to be generated without batching", request)
+        with transaction.atomic():
+            django_rq.get_queue("default").enqueue(
+                generate,
+                kwargs={
+                    "kind": request.kind,
+                    "identifier": request.identifier,
+                    "contributor_id": request.contributor_id,
+                    "llm_id": request.llm_id,
+                    "api_key": api_key,
+                    "submitter_id": request.submitter_id,
+                    "env_id": request.env_id,
+                    "inputs": request.inputs,
+                    "prompt": request.prompt,
+                },
+            )
+            request.delete()
+
+
+def poll_submitted() -> List[models.LlmBatch]:
+    """
+    Check the status of the submitted batches and store the generated data of the batches that have ended. A batch that
+    cannot be checked, or whose requests cannot all be stored, is checked again with the next poll.
+
+    Returns:
+        List[models.LlmBatch]: The batches that have ended. They are deleted along with their requests.
+    """
+    ended = []
+    for batch in models.LlmBatch.objects.all():
+        if (api_key := cache.get(_api_key_key(batch.api_key_hash))) is None:
+            log.warning("Dropping batch %s because its API key has expired", batch.batch_id)
+            batch.delete()
+            continue
+
+        try:
+            if _poll(batch, api_key):
+                ended.append(batch)
+        except Exception:
+            log.exception("Failed to poll batch %s", batch.batch_id)
+    return ended
+
+
+def _poll(batch: models.LlmBatch, api_key: str) -> bool:
+    # Returns whether the batch has ended.
+    client = clients.get_openai_client(api_key=api_key)
+    remote_batch = client.batches.retrieve(batch.batch_id)
+    if remote_batch.status not in TERMINAL_STATUSES:
+        if remote_batch.status != batch.status:
+            batch.status = remote_batch.status
+            batch.save(update_fields=["status"])
+        return False
+
+    results = _parse_output(client.files.content(remote_batch.output_file_id).text) if remote_batch.output_file_id else {}
+    log.info("Batch %s ended with status %s and %d successful requests", batch.batch_id, remote_batch.status, len(results))
+    failed = 0
+    for request in batch.requests.select_related("contributor", "llm__provider", "submitter"):
+        try:
+            _complete(request, api_key, results.get(request.pk))
+        except Exception:
+            failed += 1
+            log.exception("Failed to store the generated data of %s", request)
+    if failed:
+        # The batch is dropped with its remaining requests once its API key expires.
+        log.warning("Keeping batch %s to retry %d requests with the next poll", batch.batch_id, failed)
+        return False
+
+    batch.delete()
+    _release_api_key(batch.api_key_hash)
+    return True
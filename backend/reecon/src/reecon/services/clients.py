@@ -0,0 +1,87 @@
+import functools
+
+from langchain.chat_models import init_chat_model
+from langchain_core.language_models import BaseChatModel
+import openai
+from praw.reddit import Reddit
+
+from .ratelimit import RedditRateLimiter
+
+
+__all__ = (
+    "get_chat_model",
+    "get_openai_client",
+    "get_reddit_client",
+)
+
+
+# Clients are kept per process and keyed by their credentials, so a worker process reuses the same HTTP connection pool
+# and OAuth token across jobs instead of performing the TLS and OAuth handshakes for every job. Only the least recently
+# used clients are evicted once there are more distinct credentials than this in use, e.g. one API key per user.
+MAX_CACHED_CLIENTS = 64
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_CLIENTS)
+def get_chat_model(*, api_key: str, llm_name: str, llm_provider_name: str) -> BaseChatModel:
+    """
+    Returns a chat model for the given LLM and API key. The chat model owns the HTTP client, so reusing it reuses its
+    connection pool.
+
+    Args:
+        api_key (str): The API key of the LLM provider.
+        llm_name (str): The name of the LLM.
+        llm_provider_name (str): The name of the LLM provider.
+
+    Returns:
+        BaseChatModel: The chat model.
+    """
+    kwargs = {}
+    if llm_provider_name == "openai":
+        # The rate limit headers calibrate the `ApiKeyScheduler` of the API key.
+        kwargs["include_response_headers"] = True
+    return init_chat_model(llm_name, api_key=api_key, model_provider=llm_provider_name, **kwargs)
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_CLIENTS)
+def get_openai_client(*, api_key: str) -> openai.OpenAI:
+    """
+    Returns an OpenAI client for the given API key. It is used for the endpoints that chat models do not cover, e.g. the
+    files and batches of the batch API.
+
+    Args:
+        api_key (str): The API key of the LLM provider.
+
+    Returns:
+        openai.OpenAI: The OpenAI client.
+    """
+    return openai.OpenAI(api_key=api_key)
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_CLIENTS)
+def get_reddit_client(*, client_id: str, client_secret: str, ratelimit_seconds: int, user_agent: str) -> Reddit:
+    """
+    Returns a read-only reddit client for the given credentials. The client owns the HTTP session and the OAuth token,
+    so reusing it reuses both. Its requests are rate limited together with the requests of every other client that
+    uses the same client id, including the clients of other worker processes.
+
+    Args:
+        client_id (str): The reddit API client id.
+        client_secret (str): The reddit API client secret.
+        ratelimit_seconds (int): How long the client is allowed to sleep when it is rate limited.
+        user_agent (str): The user agent sent with every request.
+
+    Returns:
+        Reddit: The reddit client.
+    """
+    reddit_client = Reddit(
+        client_id=client_id,
+        client_secret=client_secret,
+        ratelimit_seconds=ratelimit_seconds,
+        user_agent=user_agent,
+    )
+    reddit_client.read_only = True
+    # `_rate_limiter` is private to prawcore. The swap relies on the `Session` of prawcore 2.4.0, the version in uv.lock,
+    # calling `RateLimiter.call` of that attribute for every request. Check that it still does when upgrading prawcore.
+    session = reddit_client._core
+    session._rate_limiter = RedditRateLimiter(client_id=client_id, window_size=session._rate_limiter.window_size)
+    return reddit_client
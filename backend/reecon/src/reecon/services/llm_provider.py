@@ -1,14 +1,28 @@
+import abc
+import asyncio
+import contextlib
+import contextvars
+import datetime as dt
+import functools
+import hashlib
 import json
 import logging
-from typing import List
+import math
+import time
+from typing import (
+    Dict,
+    List,
+    Mapping,
+    Sequence,
+)
 
-from langchain.chat_models import init_chat_model
 from langchain_core.messages import (
     HumanMessage,
     SystemMessage,
 )
 from langchain_core.messages.utils import count_tokens_approximately
-
+from langchain_core.runnables import Runnable
+import openai
 import pydantic
 import pydantic.json
 from tenacity import (
@@ -19,39 +33,432 @@ from tenacity import (
     wait_random_exponential,
 )
 
+from . import (
+    clients,
+    ratelimit,
+)
 from .. import schemas
 
 
 log = logging.getLogger("reecon.services.llm_provider")
 
 
-__all__ = ("LlmProvider",)
+__all__ = (
+    "api_key_hash",
+    "ApiKeyScheduler",
+    "CompactInputEncoder",
+    "count_tokens",
+    "get_tokenizer",
+    "INPUT_ENCODERS",
+    "InputEncoder",
+    "JsonInputEncoder",
+    "LlmProvider",
+    "TokenBudget",
+)
+
+
+# The limits that are assumed for an API key until the headers of a response report its actual limits.
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200_000
+# The share of the budgets of an API key that requests without `high` priority leave to the requests with it.
+HIGH_PRIORITY_HEADROOM = 0.2
+# The number of attempts a request gets when it is rejected by the provider because the API key is rate limited.
+MAX_RATE_LIMITED_ATTEMPTS = 5
+
+# The tokens OpenAI adds to the content of a chat message for its role and delimiters.
+MESSAGE_TOKENS = 4
+# The precision of the timestamps of inputs encoded by `CompactInputEncoder`.
+COMPACT_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M"
+
+# The priority of the requests made in the current context, which is the name of the queue of the job that makes them.
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_request_priority", default="default")
+
+
+def api_key_hash(api_key: str) -> str:
+    """
+    Returns the hash that identifies an API key in redis and the database, where the API key itself is not stored.
+    """
+    return hashlib.sha256(api_key.encode()).hexdigest()[:32]
+
+
+def current_priority() -> str:
+    """
+    Returns the priority of the requests made in the current context.
+    """
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def priority(queue_name: str):
+    """
+    Schedule the requests made within this context with the priority of a queue. Requests of jobs from the `high` queue
+    are scheduled ahead of all other requests that use the same API key.
+
+    Args:
+        queue_name (str): The name of the queue of the job that makes the requests.
+    """
+    token = _priority.set(queue_name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
 
 
 def is_missing_expected_generated_data(raw_response: schemas.LlmProviderRawResponse):
     return not all(raw_response.parsed.model_dump().values())
 
 
+def build_messages(*, input_str: str, prompt: str, static_prefix: str = "") -> list:
+    """
+    Build the messages of a request so that the content that is identical across requests comes first. Providers cache
+    the longest prefix of a request that was seen before, e.g. OpenAI caches prefixes of at least 1024 tokens, and the
+    cache only applies while the prefix is byte for byte the same.
+
+    Prompts that are the same for every job, like the data prompts, are sent first, followed by the inputs. A prompt that
+    varies between requests, like the prompt of a context query, is split into `static_prefix` and the rest. The rest is
+    sent after the inputs, so that queries with different prompts for the same inputs share the prefix up to the end of
+    the inputs.
+
+    Args:
+        input_str (str): The serialized inputs.
+        prompt (str): The prompt to be used for generation.
+        static_prefix (str): The part at the start of `prompt` that is the same for every request.
+
+    Returns:
+        list: The messages.
+    """
+    if static_prefix and prompt.startswith(static_prefix) and (query := prompt[len(static_prefix) :].strip()):
+        return [SystemMessage(static_prefix), HumanMessage(input_str), HumanMessage(query)]
+    return [SystemMessage(prompt), HumanMessage(input_str)]
+
+
+def approximate_tokens(chars: int) -> int:
+    # The same heuristic `count_tokens_approximately` applies to a single user message with `chars` characters of content.
+    return math.ceil((chars + len("user")) / 4) + 3
+
+
+@functools.cache
+def get_tokenizer(llm_name: str):
+    """
+    Returns the BPE encoding of an LLM, or None if it is not available. The encoding is loaded the first time it is
+    needed and kept for the lifetime of the process. tiktoken downloads an encoding once and caches the file in
+    `TIKTOKEN_CACHE_DIR`, which the worker image is built with. An LLM without an encoding is not retried, and its tokens
+    are estimated with the heuristic instead.
+
+    Args:
+        llm_name (str): The name of the LLM, e.g. `gpt-4o-mini-2024-07-18`.
+
+    Returns:
+        tiktoken.Encoding | None: The encoding of the LLM.
+    """
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model(llm_name)
+    except Exception:
+        log.warning("No tokenizer is available for %s, falling back to estimating tokens", llm_name, exc_info=True)
+        return None
+
+
+def count_tokens(input_str: str, tokenizer=None) -> int:
+    """
+    Count the tokens of a user message with `input_str` as its content.
+
+    Args:
+        input_str (str): The content of the message.
+        tokenizer (tiktoken.Encoding | None): The encoding of the LLM. The tokens are estimated with a heuristic if None.
+
+    Returns:
+        int: The exact number of tokens if `tokenizer` is given, otherwise the estimated number of tokens.
+    """
+    if tokenizer is None:
+        return count_tokens_approximately([input_str])
+    return len(tokenizer.encode_ordinary(input_str)) + MESSAGE_TOKENS
+
+
+class InputEncoder(abc.ABC):
+    """
+    Serializes the inputs of a request. The encoding of a list of inputs is `prefix`, followed by the encoded inputs joined
+    by `separator`, followed by `suffix`. Every input is encoded on its own, given only the input before it, so the size of
+    the encoding can be tracked while the list is built one input at a time.
+    """
+
+    name: str
+    prefix: str
+    separator: str
+    suffix: str = ""
+
+    @abc.abstractmethod
+    def encode_input(self, llm_input: schemas.LlmInput, previous: schemas.LlmInput | None) -> str:
+        """
+        Encode a single input.
+
+        Args:
+            llm_input (schemas.LlmInput): The input to encode.
+            previous (schemas.LlmInput | None): The input before `llm_input`, or None if it is the first input.
+
+        Returns:
+            str: The encoded input.
+        """
+
+    def encode(self, inputs: Sequence[schemas.LlmInput]) -> str:
+        """
+        Encode a list of inputs.
+
+        Args:
+            inputs (Sequence[schemas.LlmInput]): The inputs to encode.
+
+        Returns:
+            str: The encoded inputs.
+        """
+        encoded = (self.encode_input(llm_input, previous) for previous, llm_input in zip([None, *inputs], inputs))
+        return f"{self.prefix}{self.separator.join(encoded)}{self.suffix}"
+
+
+class JsonInputEncoder(InputEncoder):
+    """
+    Encodes the inputs as a JSON list of objects, which repeats the keys of every input.
+    """
+
+    name = "json"
+    prefix = "["
+    separator = ", "
+    suffix = "]"
+
+    def encode_input(self, llm_input: schemas.LlmInput, previous: schemas.LlmInput | None) -> str:
+        return json.dumps(llm_input, default=pydantic.json.pydantic_encoder)
+
+
+class CompactInputEncoder(InputEncoder):
+    """
+    Encodes every input as a JSON array on a line of its own, below a header that names the columns once instead of
+    repeating the keys of every input. Timestamps are truncated to the minute, and an author or subreddit that is the
+    same as on the line before is left empty. All inputs of a redditor have the same author, and their submissions tend
+    to come in runs from the same subreddit.
+    """
+
+    name = "compact"
+    prefix = (
+        "Submissions, one per line as a JSON array of [author, subreddit, timestamp (UTC), upvotes, downvotes, text, context]. "
+        "An empty author or subreddit is the same as on the line before. Only comments have a context, which is the "
+        "submission they reply to.\n"
+    )
+    separator = "\n"
+
+    def encode_input(self, llm_input: schemas.LlmInput, previous: schemas.LlmInput | None) -> str:
+        row = [
+            "" if previous and previous.author == llm_input.author else llm_input.author,
+            "" if previous and previous.subreddit == llm_input.subreddit else llm_input.subreddit,
+            llm_input.timestamp.astimezone(dt.timezone.utc).strftime(COMPACT_TIMESTAMP_FORMAT),
+            llm_input.upvotes,
+            llm_input.downvotes,
+            llm_input.text,
+        ]
+        if isinstance(llm_input, schemas.CommentSubmission):
+            row.append(llm_input.context)
+        return json.dumps(row, ensure_ascii=False, separators=(",", ":"))
+
+
+INPUT_ENCODERS: Dict[str, InputEncoder] = {encoder.name: encoder for encoder in (CompactInputEncoder(), JsonInputEncoder())}
+
+
+class TokenBudget:
+    """
+    Tracks the number of tokens of a list of inputs while it is built one input at a time. The count is the same as
+    `LlmProvider.estimate_tokens` for the whole list with the same encoder, but adding an input only encodes that input,
+    so building a list of n inputs is O(n) instead of O(n²).
+
+    With a tokenizer, every encoded input is tokenized on its own along with the separator before it. A token that spans
+    two inputs, like the end of a line and the line break after it, is then counted as two, so the count can exceed the
+    exact count of the whole list by about a token per input. It errs on the side of staying within the context window.
+    """
+
+    def __init__(self, max_tokens: int, encoder: InputEncoder, tokenizer=None):
+        self.encoder = encoder
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer
+        self.chars = len(encoder.prefix) + len(encoder.suffix)
+        self.content_tokens = self._content_tokens(encoder.prefix) + self._content_tokens(encoder.suffix)
+        self.previous: schemas.LlmInput | None = None
+        self.size = 0
+
+    def _content_tokens(self, s: str) -> int:
+        return len(self.tokenizer.encode_ordinary(s)) if self.tokenizer and s else 0
+
+    def _tokens(self, chars: int, content_tokens: int) -> int:
+        return approximate_tokens(chars) if self.tokenizer is None else content_tokens + MESSAGE_TOKENS
+
+    @property
+    def tokens(self) -> int:
+        return self._tokens(self.chars, self.content_tokens)
+
+    def add(self, llm_input: schemas.LlmInput) -> bool:
+        """
+        Add an input if the number of tokens stays below `max_tokens`.
+
+        Args:
+            llm_input (schemas.LlmInput): The input to add.
+
+        Returns:
+            bool: Whether the input fit in the budget and was added.
+        """
+        encoded = self.encoder.encode_input(llm_input, self.previous)
+        if self.size:
+            encoded = self.encoder.separator + encoded
+        chars = self.chars + len(encoded)
+        content_tokens = self.content_tokens + self._content_tokens(encoded)
+        if self._tokens(chars, content_tokens) >= self.max_tokens:
+            return False
+        self.chars = chars
+        self.content_tokens = content_tokens
+        self.previous = llm_input
+        self.size += 1
+        return True
+
+    def is_exhausted(self, min_chars: int) -> bool:
+        """
+        Returns whether an input can no longer fit once its encoding adds at least `min_chars` characters. The tokens of
+        those characters are estimated with the heuristic even with a tokenizer, since the text they encode is unknown.
+
+        Args:
+            min_chars (int): The minimum number of characters an input adds, e.g. the minimum length of its text.
+
+        Returns:
+            bool: Whether no input of at least `min_chars` characters will be added anymore.
+        """
+        chars = self.chars + (len(self.encoder.separator) if self.size else 0) + min_chars
+        content_tokens = self.content_tokens + math.ceil(min_chars / 4)
+        return self._tokens(chars, content_tokens) >= self.max_tokens
+
+
+class ApiKeyScheduler:
+    """
+    Schedules the requests of all jobs that share an API key within the requests-per-minute and tokens-per-minute
+    budgets of the key. The budgets are token buckets in redis that every worker process draws from. They are
+    calibrated with the `x-ratelimit-*` headers of every response, so they converge on the actual limits of the key.
+    Requests wait until both budgets allow them instead of being rejected by the provider.
+    """
+
+    def __init__(self, api_key: str):
+        key_hash = api_key_hash(api_key)
+        self.requests = ratelimit.TokenBucket(
+            f"llm-ratelimit:{key_hash}:requests",
+            capacity=DEFAULT_REQUESTS_PER_MINUTE,
+            rate=DEFAULT_REQUESTS_PER_MINUTE / 60,
+        )
+        self.tokens = ratelimit.TokenBucket(
+            f"llm-ratelimit:{key_hash}:tokens",
+            capacity=DEFAULT_TOKENS_PER_MINUTE,
+            rate=DEFAULT_TOKENS_PER_MINUTE / 60,
+        )
+
+    def _acquire(self, tokens: int, reserve: bool) -> float:
+        costs = [(self.requests, 1), (self.tokens, tokens)]
+        return ratelimit.acquire_all(costs, headroom=None if reserve else HIGH_PRIORITY_HEADROOM)
+
+    def acquire(self, tokens: int) -> None:
+        """
+        Wait until the budgets allow a request. High priority requests reserve their budget right away, others wait
+        until the budgets have headroom left for high priority requests.
+
+        Args:
+            tokens (int): The estimated number of tokens of the request.
+        """
+        reserve = _priority.get() == "high"
+        while (wait := self._acquire(tokens, reserve)) > 0:
+            log.debug("Waiting %0.2f seconds for the budget of the API key", wait)
+            time.sleep(wait)
+            if reserve:
+                return
+
+    async def aacquire(self, tokens: int) -> None:
+        """
+        The coroutine version of `acquire`.
+        """
+        reserve = _priority.get() == "high"
+        while (wait := await asyncio.to_thread(self._acquire, tokens, reserve)) > 0:
+            log.debug("Waiting %0.2f seconds for the budget of the API key", wait)
+            await asyncio.sleep(wait)
+            if reserve:
+                return
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        """
+        Calibrate the budgets with the rate limit headers of a response.
+
+        Args:
+            headers (Mapping[str, str]): The response headers.
+        """
+        for bucket, name in ((self.requests, "requests"), (self.tokens, "tokens")):
+            if f"x-ratelimit-limit-{name}" in headers and f"x-ratelimit-remaining-{name}" in headers:
+                limit = float(headers[f"x-ratelimit-limit-{name}"])
+                # The budgets are replenished continuously up to the per-minute limit.
+                bucket.calibrate(remaining=float(headers[f"x-ratelimit-remaining-{name}"]), rate=limit / 60, capacity=limit)
+
+    def invoke(self, runnable: Runnable, messages: list) -> dict:
+        """
+        Invoke a structured output runnable once the budgets allow it.
+
+        Args:
+            runnable (Runnable): A runnable that returns the raw response along with the parsed output.
+            messages (list): The messages to invoke the runnable with.
+
+        Returns:
+            dict: The output of the runnable.
+        """
+        tokens = count_tokens_approximately(messages)
+        for attempt in range(1, MAX_RATE_LIMITED_ATTEMPTS + 1):
+            self.acquire(tokens)
+            try:
+                output = runnable.invoke(messages)
+            except openai.RateLimitError as e:
+                # Running out of credits is reported as a rate limit error as well, but waiting does not help then.
+                if e.code == "insufficient_quota" or attempt == MAX_RATE_LIMITED_ATTEMPTS:
+                    raise
+                self.update(e.response.headers)
+            else:
+                self.update(output["raw"].response_metadata.get("headers", {}))
+                return output
+
+    async def ainvoke(self, runnable: Runnable, messages: list) -> dict:
+        """
+        The coroutine version of `invoke`.
+        """
+        tokens = count_tokens_approximately(messages)
+        for attempt in range(1, MAX_RATE_LIMITED_ATTEMPTS + 1):
+            await self.aacquire(tokens)
+            try:
+                output = await runnable.ainvoke(messages)
+            except openai.RateLimitError as e:
+                if e.code == "insufficient_quota" or attempt == MAX_RATE_LIMITED_ATTEMPTS:
+                    raise
+                await asyncio.to_thread(self.update, e.response.headers)
+            else:
+                await asyncio.to_thread(self.update, output["raw"].response_metadata.get("headers", {}))
+                return output
+
+
 class LlmProvider:
-    def __init__(self, *, api_key: str, llm_name: str, llm_provider_name: str):
+    def __init__(self, *, api_key: str, input_encoder: InputEncoder, llm_name: str, llm_provider_name: str, tokenizer=None):
         self.api_key = api_key
+        self.input_encoder = input_encoder
         self.llm_name = llm_name
         self.llm_provider_name = llm_provider_name
+        self.tokenizer = tokenizer
+        self.scheduler = ApiKeyScheduler(api_key)
 
-    @staticmethod
-    def estimate_tokens(inputs: List[schemas.LlmInput]) -> int:
+    def estimate_tokens(self, inputs: List[schemas.LlmInput]) -> int:
         """
-        Estimate the number of tokens in a string using a simple heuristic. Use this when an exact count is not necessary.
-        This is a very rough estimate and should not be used for precise token counting.
+        Count the number of tokens of the encoded inputs with the tokenizer of the LLM. Without a tokenizer, the number is
+        estimated using a simple heuristic, which is a very rough estimate.
 
         Args:
             inputs (List[schemas.LlmInput]): The inputs to count the number of tokens for.
 
         Returns:
-            int: The estimated number of tokens.
+            int: The number of tokens.
         """
-        input_str = json.dumps(inputs, default=pydantic.json.pydantic_encoder)
-        return count_tokens_approximately([input_str])
+        return count_tokens(self.input_encoder.encode(inputs), self.tokenizer)
 
     @retry(
         before_sleep=before_sleep_log(log, logging.DEBUG),
@@ -60,7 +467,9 @@ class LlmProvider:
         stop=stop_after_attempt(3),
         wait=wait_random_exponential(min=1, max=60),
     )
-    def generate_data(self, *, inputs: List[schemas.LlmInput], prompt: str, response_format: type[pydantic.BaseModel]) -> schemas.LlmProviderRawResponse:  # pragma: no cover
+    def generate_data(
+        self, *, inputs: List[schemas.LlmInput], prompt: str, response_format: type[pydantic.BaseModel], static_prefix: str = ""
+    ) -> schemas.LlmProviderRawResponse:  # pragma: no cover
         """
         Generate data using the LLM provider.
 
@@ -68,17 +477,42 @@ class LlmProvider:
             inputs (List[schemas.LlmInput]): The inputs to be processed by the LLM.
             prompt (str): The prompt to be used for generation.
             response_format (type[pydantic.BaseModel]): The expected response format.
+            static_prefix (str): The part at the start of `prompt` that is the same for every request. See `build_messages`.
 
         Returns:
             pydantic.BaseModel: The generated data.
         """
-        model = init_chat_model(self.llm_name, api_key=self.api_key, model_provider=self.llm_provider_name)
+        model = clients.get_chat_model(api_key=self.api_key, llm_name=self.llm_name, llm_provider_name=self.llm_provider_name)
         runnable = model.with_structured_output(response_format, include_raw=True)
-        input_str = json.dumps(inputs, default=pydantic.json.pydantic_encoder)
-        output = runnable.invoke(
-            [
-                SystemMessage(prompt),
-                HumanMessage(input_str),
-            ]
-        )
+        input_str = self.input_encoder.encode(inputs)
+        output = self.scheduler.invoke(runnable, build_messages(input_str=input_str, prompt=prompt, static_prefix=static_prefix))
+        return schemas.LlmProviderRawResponse(**output)
+
+    @retry(
+        before_sleep=before_sleep_log(log, logging.DEBUG),
+        reraise=True,
+        retry=retry_if_result(is_missing_expected_generated_data),
+        stop=stop_after_attempt(3),
+        wait=wait_random_exponential(min=1, max=60),
+    )
+    async def agenerate_data(
+        self, *, inputs: List[schemas.LlmInput], prompt: str, response_format: type[pydantic.BaseModel], static_prefix: str = ""
+    ) -> schemas.LlmProviderRawResponse:  # pragma: no cover
+        """
+        Generate data using the LLM provider without blocking the event loop. This is the coroutine version of
+        `generate_data`.
+
+        Args:
+            inputs (List[schemas.LlmInput]): The inputs to be processed by the LLM.
+            prompt (str): The prompt to be used for generation.
+            response_format (type[pydantic.BaseModel]): The expected response format.
+            static_prefix (str): The part at the start of `prompt` that is the same for every request. See `build_messages`.
+
+        Returns:
+            pydantic.BaseModel: The generated data.
+        """
+        model = clients.get_chat_model(api_key=self.api_key, llm_name=self.llm_name, llm_provider_name=self.llm_provider_name)
+        runnable = model.with_structured_output(response_format, include_raw=True)
+        input_str = self.input_encoder.encode(inputs)
+        output = await self.scheduler.ainvoke(runnable, build_messages(input_str=input_str, prompt=prompt, static_prefix=static_prefix))
         return schemas.LlmProviderRawResponse(**output)
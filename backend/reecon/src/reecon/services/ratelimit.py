@@ -0,0 +1,176 @@
+import functools
+import logging
+import time
+from typing import (
+    Iterable,
+    Mapping,
+    Tuple,
+)
+
+from django_redis import get_redis_connection
+from prawcore.rate_limit import RateLimiter
+
+
+log = logging.getLogger("reecon.services.ratelimit")
+
+
+__all__ = (
+    "acquire_all",
+    "RedditRateLimiter",
+    "TokenBucket",
+)
+
+
+# Reddit allows 100 requests per minute per OAuth client id. This is the rate used until a response calibrates it.
+DEFAULT_REDDIT_REQUESTS_PER_SECOND = 100 / 60
+# The number of reddit requests that may be made at once after the bucket has been idle.
+REDDIT_BURST = 10
+
+# Takes `cost` tokens from every bucket and returns the number of seconds to wait before using them. Buckets are hashes
+# with the fields `tokens`, `ts`, `rate` and `capacity`. The defaults in ARGV are used until a bucket is calibrated.
+#
+# With a negative `headroom`, the buckets go negative instead of refusing the tokens, so a caller reserves its place in
+# line and is not starved by callers that retry more eagerly. Otherwise, the tokens are only taken if `headroom` times
+# the capacity of every bucket is left afterwards. Nothing is taken if any bucket is short, and the caller is expected
+# to try again after waiting. Callers that reserve are therefore always served before callers that need headroom.
+ACQUIRE_SCRIPT = """
+local now = redis.call("TIME")
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local ttl = tonumber(ARGV[1])
+local headroom = tonumber(ARGV[2])
+local buckets = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local offset = 2 + (i - 1) * 3
+    local state = redis.call("HMGET", key, "tokens", "ts", "rate", "capacity")
+    local capacity = tonumber(state[4]) or tonumber(ARGV[offset + 1])
+    local rate = tonumber(state[3]) or tonumber(ARGV[offset + 2])
+    local tokens = capacity
+    if state[1] then
+        tokens = math.min(capacity, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+    end
+    local floor = math.max(headroom, 0) * capacity
+    -- A cost larger than what the bucket can ever hold is capped, otherwise the caller would wait forever.
+    local cost = math.min(tonumber(ARGV[offset + 3]), capacity - floor)
+    wait = math.max(wait, (cost + floor - tokens) / rate)
+    buckets[i] = {key, tokens - cost, rate, capacity}
+end
+if headroom < 0 or wait <= 0 then
+    for _, bucket in ipairs(buckets) do
+        redis.call("HSET", bucket[1], "tokens", bucket[2], "ts", now, "rate", bucket[3], "capacity", bucket[4])
+        redis.call("EXPIRE", bucket[1], ttl)
+    end
+end
+return tostring(math.max(wait, 0))
+"""
+
+# Sets the refill rate and capacity of a bucket to the limits reported by the upstream. The bucket never holds more
+# tokens than the upstream reports to be remaining.
+CALIBRATE_SCRIPT = """
+local now = redis.call("TIME")
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local ttl = tonumber(ARGV[1])
+local remaining = tonumber(ARGV[2])
+local rate = tonumber(ARGV[3])
+local capacity = tonumber(ARGV[4])
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts", "rate", "capacity")
+local tokens = capacity
+if state[1] then
+    tokens = math.min(capacity, tonumber(state[1]) + (now - tonumber(state[2])) * tonumber(state[3]))
+end
+redis.call("HSET", KEYS[1], "tokens", math.min(tokens, remaining), "ts", now, "rate", rate, "capacity", capacity)
+redis.call("EXPIRE", KEYS[1], ttl)
+return "1"
+"""
+
+
+@functools.cache
+def _scripts():
+    redis = get_redis_connection("default")
+    return redis.register_script(ACQUIRE_SCRIPT), redis.register_script(CALIBRATE_SCRIPT)
+
+
+class TokenBucket:
+    """
+    A token bucket that is stored in redis, so that every worker process and replica draws from the same bucket. The
+    state is read and written by lua scripts, which redis runs atomically, and timestamps come from the redis clock.
+    """
+
+    def __init__(self, key: str, *, capacity: float, rate: float, ttl: int = 3600):
+        self.key = key
+        self.capacity = capacity
+        self.rate = rate
+        self.ttl = ttl
+
+    def acquire(self, cost: float = 1) -> float:
+        """
+        Take tokens from the bucket, reserving them if the bucket does not hold enough.
+
+        Args:
+            cost (float): The number of tokens to take.
+
+        Returns:
+            float: The number of seconds to wait before the tokens may be used.
+        """
+        return acquire_all([(self, cost)])
+
+    def calibrate(self, *, remaining: float, rate: float, capacity: float | None = None) -> None:
+        """
+        Adjust the bucket to the limits reported by the upstream.
+
+        Args:
+            remaining (float): The number of tokens the upstream reports to be remaining.
+            rate (float): The number of tokens that are refilled per second.
+            capacity (float | None): The maximum number of tokens. Defaults to the capacity the bucket was created with.
+        """
+        _, calibrate = _scripts()
+        calibrate(keys=[self.key], args=[self.ttl, remaining, rate, self.capacity if capacity is None else capacity])
+
+
+def acquire_all(costs: Iterable[Tuple[TokenBucket, float]], *, headroom: float | None = None) -> float:
+    """
+    Take tokens from several buckets at once, e.g. the request and the token budget of an API key.
+
+    Args:
+        costs (Iterable[Tuple[TokenBucket, float]]): The buckets along with the number of tokens to take from each.
+        headroom (float | None): The share of the capacity of every bucket that must be left after taking the tokens.
+            Nothing is taken if any bucket is short and the caller has to call this again after waiting. When None, the
+            tokens are reserved instead, which puts the caller ahead of all callers that need headroom.
+
+    Returns:
+        float: The number of seconds to wait before the tokens may be used, or before trying again.
+    """
+    costs = list(costs)
+    keys, args = [], []
+    for bucket, cost in costs:
+        keys.append(bucket.key)
+        args.extend([bucket.capacity, bucket.rate, cost])
+    ttl = max(bucket.ttl for bucket, _ in costs)
+    acquire, _ = _scripts()
+    return float(acquire(keys=keys, args=[ttl, -1 if headroom is None else headroom, *args]))
+
+
+class RedditRateLimiter(RateLimiter):
+    """
+    Replaces the rate limiter of a prawcore session, which only knows about the requests of its own client. Every
+    request takes a token from a bucket that is shared by all clients with the same client id, and the `X-Ratelimit-*`
+    headers of every response calibrate that bucket.
+    """
+
+    def __init__(self, *, client_id: str, window_size: int):
+        super().__init__(window_size=window_size)
+        self.bucket = TokenBucket(f"reddit-ratelimit:{client_id}", capacity=REDDIT_BURST, rate=DEFAULT_REDDIT_REQUESTS_PER_SECOND)
+
+    def delay(self) -> None:
+        if (wait := self.bucket.acquire()) > 0:
+            log.debug("Sleeping %0.2f seconds to stay under the reddit rate limit", wait)
+            time.sleep(wait)
+
+    def update(self, response_headers: Mapping[str, str]) -> None:
+        # prawcore 2.x passes the headers positionally and later versions by keyword, so both have to be accepted.
+        super().update(response_headers=response_headers)
+        if "x-ratelimit-remaining" in response_headers:
+            # Reddit's limit applies to fixed windows, so the remaining requests are spread evenly until the window resets.
+            remaining = float(response_headers["x-ratelimit-remaining"])
+            reset = max(float(response_headers["x-ratelimit-reset"]), 1)
+            self.bucket.calibrate(remaining=remaining, rate=max(remaining, 1) / reset)
@@ -1,10 +1,24 @@
 import abc
 import datetime as dt
+import functools
+import heapq
+import itertools
 import logging
-from typing import List
+import math
+import operator
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+)
 
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
-from praw.reddit import Reddit
+from langchain_core.messages.ai import UsageMetadata
 from praw.models import (
     Comment,
     MoreComments,
@@ -17,6 +31,7 @@ from prawcore.exceptions import (
     NotFound,
     TooManyRequests,
 )
+import pydantic
 from tenacity import (
     before_sleep_log,
     retry,
@@ -25,7 +40,10 @@ from tenacity import (
     wait_random_exponential,
 )
 
-from . import llm_provider
+from . import (
+    clients,
+    llm_provider,
+)
 from .. import (
     exceptions,
     models,
@@ -43,6 +61,164 @@ __all__ = (
 
 log = logging.getLogger("reecon.services.reddit")
 
+# The maximum number of fullnames reddit's `/api/info` endpoint accepts per request.
+INFO_CHUNK_SIZE = 100
+# The maximum number of submissions reddit returns per listing request.
+LISTING_PAGE_SIZE = 100
+
+
+def cached_input_tokens(usage_metadata: UsageMetadata) -> int:
+    """
+    Returns the number of input tokens that the LLM provider read from its prompt cache. Providers that do not cache
+    prompts do not report it.
+    """
+    return usage_metadata.get("input_token_details", {}).get("cache_read", 0)
+
+
+def fetched_submission(obj: Comment | Submission) -> models.FetchedSubmission:
+    """
+    Create an unsaved `FetchedSubmission` from a praw thread or comment.
+
+    Args:
+        obj (Comment | Submission): The praw thread or comment.
+
+    Returns:
+        models.FetchedSubmission: The unsaved submission.
+    """
+    is_thread = isinstance(obj, Submission)
+    return models.FetchedSubmission(
+        author=obj.author.name if obj.author else "",
+        created_utc=obj.created_utc,
+        downs=obj.downs,
+        fullname=obj.fullname,
+        parent_id="" if is_thread else obj.parent_id,
+        subreddit=obj.subreddit.display_name,
+        text=obj.selftext if is_thread else obj.body,
+        title=obj.title if is_thread else "",
+        ups=obj.ups,
+    )
+
+
+class SubmissionListing:
+    """
+    A newest-first listing of a redditor's threads or comments, continued by their stored history once the newest
+    stored submission is reached, and by resuming the listing after the oldest stored submission once the stored
+    history runs out. The listing is paged lazily, so only the pages that are iterated over are requested, and none
+    between the newest and the oldest stored submission.
+
+    The stored history of a listing is the newest-first run of its submissions that were fetched without a gap, which
+    later runs extend at both ends.
+    """
+
+    def __init__(
+        self,
+        new: Callable[..., Iterable[Comment | Submission]],
+        stored: List[models.FetchedSubmission],
+        *,
+        limit: int | None,
+        owner: str,
+        page_size: int = LISTING_PAGE_SIZE,
+    ):
+        """
+        Args:
+            new (Callable[..., Iterable[Comment | Submission]]): Returns the newest-first listing of the redditor's
+                threads or comments, e.g. `redditor.comments.new`.
+            stored (List[models.FetchedSubmission]): The stored history of the same listing, newest first.
+            limit (int | None): The maximum number of objects a listing returns. None if it returns all of them.
+            owner (str): The username of the redditor.
+            page_size (int): The number of submissions reddit returns per request of the listing.
+        """
+        self.limit = limit
+        self.new = new
+        self.owner = owner
+        self.page_size = page_size
+        self.stored = stored
+        # Whether the listing was iterated until the newest stored submission or its end. Only then are the fetched
+        # submissions continued by the stored history without a gap.
+        self.complete = False
+        # Whether the listing returned `limit` objects before it reached the newest stored submission.
+        self.cut_off = False
+        # The unsaved submissions that were fetched from the listing, newest first, followed by the ones that were
+        # fetched after resuming it.
+        self.fetched: List[models.FetchedSubmission] = []
+        self.resumed: List[models.FetchedSubmission] = []
+        # The number of objects taken from each listing request, including the one it stopped at.
+        self._listed: List[int] = []
+
+    def _list(self, **params) -> Iterator[Comment | Submission]:
+        self._listed.append(0)
+        for obj in self.new(limit=self.limit, **params):
+            self._listed[-1] += 1
+            if not isinstance(obj, MoreComments):
+                yield obj
+
+    def __iter__(self) -> Iterator[models.FetchedSubmission]:
+        stored_fullnames = {submission.fullname for submission in self.stored}
+        newest_created_utc = self.stored[0].created_utc if self.stored else None
+
+        for obj in self._list():
+            # The newest stored submission may have been deleted since, so also stop at anything older than it.
+            if obj.fullname in stored_fullnames or (newest_created_utc is not None and obj.created_utc < newest_created_utc):
+                self.complete = True
+                break
+            submission = fetched_submission(obj)
+            self.fetched.append(submission)
+            yield submission
+        else:
+            # A listing that returned `limit` objects was cut off by the limit rather than at its end.
+            self.cut_off = self.limit is not None and self.listed >= self.limit
+            self.complete = not self.cut_off
+            if self.complete:
+                yield from self.stored
+            return
+
+        yield from self.stored
+        # The submissions that are older than the stored history are only listed once it is used up.
+        for obj in self._list(params={"after": self.stored[-1].fullname}):
+            submission = fetched_submission(obj)
+            self.fetched.append(submission)
+            self.resumed.append(submission)
+            yield submission
+
+    @property
+    def listed(self) -> int:
+        """
+        The number of objects that were taken from the listing.
+        """
+        return sum(self._listed)
+
+    @property
+    def pages(self) -> int:
+        """
+        The number of pages of the listing that were requested. praw requests a page once the objects of the previous
+        one were taken, so this does not count a last request that returned no objects.
+        """
+        return sum(math.ceil(listed / self.page_size) for listed in self._listed)
+
+    def store(self) -> None:
+        """
+        Store the fetched submissions. They become part of the stored history of the listing if they are continued by
+        it, or if the listing was cut off by its limit, in which case the submissions between them and the stored
+        history were never fetched, so they replace it. Otherwise, the listing was not iterated far enough to tell, so
+        the fetched submissions are only stored for looking up the parents of comments and the stored history is kept
+        for a later run to reach.
+        """
+        if self.complete:
+            models.FetchedSubmission.objects.store(self.fetched, listing_owner=self.owner)
+            if self.resumed:
+                # The stored history is expired from the submissions that were stored first, which are the oldest ones
+                # unless the history was extended past them. The submissions that extend it are dated back, so that
+                # they do not outlive the rest of it and leave a gap.
+                models.FetchedSubmission.objects.filter(fullname__in=[submission.fullname for submission in self.resumed]).update(
+                    created=min(submission.created for submission in self.stored)
+                )
+        elif self.cut_off:
+            if self.stored:
+                models.FetchedSubmission.objects.unlist(self.owner, is_thread=self.stored[0].is_thread)
+            models.FetchedSubmission.objects.store(self.fetched, listing_owner=self.owner)
+        elif self.listed:
+            models.FetchedSubmission.objects.store(self.fetched)
+
 
 class RedditBase(abc.ABC):
     def __init__(
@@ -58,36 +234,208 @@ class RedditBase(abc.ABC):
         self.identifier = identifier
         self.contributor = contributor
         self.llm = llm
+        self.submitter = submitter
+        self.env = env
+        self.input_encoder = llm_provider.INPUT_ENCODERS[self.llm_env.input_encoding]
+        self.tokenizer = llm_provider.get_tokenizer(llm.name) if self.llm_env.exact_token_counting else None
         llm_provider_settings = getattr(llm_providers_settings, llm.provider.name)
         self.llm_provider = llm_provider.LlmProvider(
             api_key=llm_provider_settings.api_key,
+            input_encoder=self.input_encoder,
             llm_name=llm.name,
             llm_provider_name=llm.provider.name,
+            tokenizer=self.tokenizer,
         )
-        self.submitter = submitter
-        self.env = env
 
-        self.reddit_client = Reddit(
+        self.reddit_client = clients.get_reddit_client(
             client_id=self.env.reddit.api.client_id,
             client_secret=self.env.reddit.api.client_secret,
             ratelimit_seconds=self.env.reddit.api.ratelimit_seconds,
             user_agent=self.env.reddit.api.user_agent,
         )
-        self.reddit_client.read_only = True
+        # The number of network requests saved by resolving comment parents in bulk instead of one `comment.parent()`
+        # lookup per comment.
+        self.parent_requests_avoided = 0
+        # The number of listing pages requested for the history of a redditor.
+        self.listing_pages = 0
+
+    @property
+    @abc.abstractmethod
+    def llm_env(self) -> schemas.env.LlmEnv:
+        pass
+
+    def token_budget(self) -> llm_provider.TokenBudget:
+        max_input_tokens = int(self.llm.context_window * self.llm_env.max_context_window_for_inputs)
+        return llm_provider.TokenBudget(max_input_tokens, self.input_encoder, self.tokenizer)
+
+    def get_comment_submissions(self, comments: List[Tuple[models.FetchedSubmission, str]], loaded: Dict[str, models.FetchedSubmission]) -> List[schemas.CommentSubmission]:
+        """
+        Build the submissions for comments along with the context their parent provides, which is truncated to the
+        maximum length of a submission. Parents are looked up by fullname in `loaded` and in the `FetchedSubmission`
+        store first, which requires no network requests. The remaining parents are fetched in bulk through the
+        `/api/info` endpoint in chunks of `INFO_CHUNK_SIZE` and stored.
+
+        Args:
+            comments (List[Tuple[models.FetchedSubmission, str]]): The comments and their sanitized text.
+            loaded (Dict[str, models.FetchedSubmission]): Comments and threads that are already loaded keyed by fullname.
+
+        Returns:
+            List[schemas.CommentSubmission]: The submissions in the same order as `comments`.
+        """
+        parent_ids = dict.fromkeys(comment.parent_id for comment, _ in comments)
+        parents = {parent_id: loaded[parent_id] for parent_id in parent_ids if parent_id in loaded}
+        if unloaded_parent_ids := [parent_id for parent_id in parent_ids if parent_id not in parents]:
+            parents.update(models.FetchedSubmission.objects.in_bulk(unloaded_parent_ids, field_name="fullname"))
+
+        missing_parent_ids = [parent_id for parent_id in parent_ids if parent_id not in parents]
+        fetched_parents = []
+        requests = 0
+        for i in range(0, len(missing_parent_ids), INFO_CHUNK_SIZE):
+            fetched_parents.extend(fetched_submission(parent) for parent in self.reddit_client.info(fullnames=missing_parent_ids[i : i + INFO_CHUNK_SIZE]))
+            requests += 1
+        if fetched_parents:
+            models.FetchedSubmission.objects.store(fetched_parents)
+            parents.update((parent.fullname, parent) for parent in fetched_parents)
+
+        self.parent_requests_avoided += len(comments) - requests
+        log.debug("Resolved %d comment parents of %s with %d requests", len(comments), self.identifier, requests)
+
+        submissions = []
+        for comment, text in comments:
+            # If `comment` is a top-level comment, `parent` will be the thread. Otherwise, `parent` will be the parent
+            # comment that `comment` is a response to. The intention here is to capture the context in which the
+            # comment was made. Parents that reddit no longer returns provide no context.
+            parent = parents.get(comment.parent_id)
+            if parent is None:
+                context = ""
+            elif parent.is_thread:
+                context = f"{parent.title} | {parent.text}"
+            else:
+                context = parent.text
+            submissions.append(self.submission_input(comment, text, context=context[: self.env.reddit.submission.max_length]))
+        return submissions
+
+    @staticmethod
+    def submission_input(submission: models.FetchedSubmission, text: str, *, context: str | None = None) -> schemas.LlmInput:
+        """
+        Build the input for a fetched submission.
+
+        Args:
+            submission (models.FetchedSubmission): The thread or comment.
+            text (str): The sanitized text of the submission.
+            context (str | None): The context of a comment. Threads have no context.
+
+        Returns:
+            schemas.LlmInput: A `CommentSubmission` if `context` is given, otherwise a `ThreadSubmission`.
+        """
+        fields = {
+            "author": submission.author,
+            "downvotes": submission.downs,
+            "subreddit": submission.subreddit,
+            "text": text,
+            "timestamp": timezone.make_aware(dt.datetime.fromtimestamp(submission.created_utc)).isoformat(),
+            "upvotes": submission.ups,
+        }
+        if context is None:
+            return schemas.ThreadSubmission(**fields)
+        return schemas.CommentSubmission(context=context, **fields)
+
+    def select_submissions(
+        self, candidates: Iterable[Tuple[models.FetchedSubmission, str]], token_budget: llm_provider.TokenBudget
+    ) -> List[Tuple[models.FetchedSubmission, str]]:
+        """
+        Select submissions in order until the first one that does not fit in the token budget, or until the budget
+        cannot fit a submission of the minimum length anymore, whichever comes first. No more candidates are consumed
+        then, so a lazy iterable of candidates stops requesting listing pages and sanitizing texts there. A submission
+        that does not even fit in the empty budget is skipped instead.
+
+        Args:
+            candidates (Iterable[Tuple[models.FetchedSubmission, str]]): The submissions and their sanitized text, which is
+                empty for submissions that were rejected by sanitization.
+            token_budget (llm_provider.TokenBudget): The budget for the inputs.
+
+        Returns:
+            List[Tuple[models.FetchedSubmission, str]]: The selected submissions and their sanitized text.
+        """
+        selected = []
+        submissions_text = set()
+        min_length = max(self.env.reddit.submission.min_length, 1)
+        if token_budget.is_exhausted(min_length):
+            return selected
+
+        for submission, text in candidates:
+            if text and text not in submissions_text:
+                # The context of a comment is only known once its parent is resolved, so it is budgeted by
+                # `get_submissions`.
+                if token_budget.add(self.submission_input(submission, text, context=None if submission.is_thread else "")):
+                    selected.append((submission, text))
+                    submissions_text.add(text)
+                    if token_budget.is_exhausted(min_length):
+                        break
+                elif selected:
+                    break
+        return selected
+
+    def get_submissions(self, selected: List[Tuple[models.FetchedSubmission, str]], loaded: Dict[str, models.FetchedSubmission]) -> List[schemas.LlmInput]:
+        """
+        Build the inputs for the selected threads and comments in the same order. The selection did not budget the
+        context of comments, so the inputs are budgeted again along with it. The inputs that no longer fit are dropped from
+        the end, which is where the least relevant ones are.
+
+        Args:
+            selected (List[Tuple[models.FetchedSubmission, str]]): The submissions and their sanitized text.
+            loaded (Dict[str, models.FetchedSubmission]): Comments and threads that are already loaded keyed by fullname.
+
+        Returns:
+            List[schemas.LlmInput]: The inputs.
+        """
+        comment_submissions = iter(self.get_comment_submissions([(submission, text) for submission, text in selected if not submission.is_thread], loaded))
+        submissions = [self.submission_input(submission, text) if submission.is_thread else next(comment_submissions) for submission, text in selected]
+        token_budget = self.token_budget()
+        fitted = list(itertools.takewhile(token_budget.add, submissions))
+        if len(fitted) < len(submissions):
+            log.debug("Dropped %d inputs of %s that no longer fit with the context of comments", len(submissions) - len(fitted), self.identifier)
+        return fitted
 
     @abc.abstractmethod
     def get_inputs(self) -> List[schemas.LlmInput]:
         pass
 
+    async def aget_inputs(self) -> List[schemas.LlmInput]:
+        # praw is synchronous, so the reddit requests run in a worker thread of their own instead of blocking the event
+        # loop. The database queries in `get_inputs` use that thread's connection.
+        return await util.db.database_sync_to_async(self.get_inputs, thread_sensitive=False)()
+
     def sanitize_submission(self, s: str) -> str:
         return util.inputs.sanitize(s, min_length=self.env.reddit.submission.min_length, max_length=self.env.reddit.submission.max_length)
 
+    def sanitize_submissions(self, texts: List[str]) -> Iterable[str]:
+        """
+        Sanitize the texts of submissions in order. If there are at least `parallel_sanitize_threshold` texts, they are
+        sanitized in parallel by `util.inputs.sanitize_all`. Otherwise, every text is sanitized when it is consumed, so
+        the texts after the last one that is used are not sanitized at all.
+
+        Args:
+            texts (List[str]): The texts to sanitize.
+
+        Returns:
+            Iterable[str]: The sanitized texts.
+        """
+        threshold = self.env.reddit.submission.parallel_sanitize_threshold
+        if threshold and len(texts) >= threshold:
+            return util.inputs.sanitize_all(texts, min_length=self.env.reddit.submission.min_length, max_length=self.env.reddit.submission.max_length)
+        return map(self.sanitize_submission, texts)
+
     @abc.abstractmethod
     def unprocessable_entity(self, reason: str) -> exceptions.UnprocessableEntityError:
         pass
 
 
 class RedditorBase(RedditBase):
+    @property
+    def llm_env(self) -> schemas.env.LlmEnv:
+        return self.env.redditor.llm
+
     @retry(
         before_sleep=before_sleep_log(log, logging.DEBUG),
         reraise=True,
@@ -96,10 +444,14 @@ class RedditorBase(RedditBase):
         wait=wait_random_exponential(min=1, max=60),
     )
     def get_inputs(self) -> List[schemas.LlmInput]:
-        submissions: List[schemas.LlmInput] = []
         redditor: Redditor = self.reddit_client.redditor(name=self.identifier)
 
-        max_input_tokens = int(self.llm.context_window * self.env.redditor.llm.max_context_window_for_inputs)
+        token_budget = self.token_budget()
+
+        stored_threads: List[models.FetchedSubmission] = []
+        stored_comments: List[models.FetchedSubmission] = []
+        for stored in models.FetchedSubmission.objects.filter(listing_owner=self.identifier).order_by("-created_utc"):
+            (stored_threads if stored.is_thread else stored_comments).append(stored)
 
         try:
             try:
@@ -111,51 +463,30 @@ class RedditorBase(RedditBase):
                 if timezone.now() - redditor_created_ts < self.env.redditor.account.min_age:
                     raise self.unprocessable_entity(f"Account age is less than {self.env.redditor.account.min_age} old")
 
-            thread: Submission
-            for thread in redditor.submissions.new():
-                if text := self.sanitize_submission(thread.selftext):
-                    existing_submissions_text = [submission.text for submission in submissions]
-                    if text not in existing_submissions_text:
-                        thread_submission = schemas.ThreadSubmission(
-                            author=thread.author.name,
-                            downvotes=thread.downs,
-                            subreddit=thread.subreddit.display_name,
-                            text=text,
-                            timestamp=timezone.make_aware(dt.datetime.fromtimestamp(thread.created_utc)).isoformat(),
-                            upvotes=thread.ups,
-                        )
-                        pending_tokens = self.llm_provider.estimate_tokens(existing_submissions_text + [thread_submission.text])
-                        if pending_tokens < max_input_tokens:
-                            submissions.append(thread_submission)
-                        else:
-                            break
-
-            comment: Comment
-            for comment in redditor.comments.new():
-                if isinstance(comment, MoreComments):
-                    continue
-                if text := self.sanitize_submission(comment.body):
-                    existing_submissions_text = [submission.text for submission in submissions]
-                    if text not in existing_submissions_text:
-                        # If `comment` is a top-level comment, `parent` will be a `Submission` instance for the thread.
-                        # Otherwise, `parent` will be the parent comment that `comment` is a response to. The intention
-                        # here is to capture the context in which the comment was made.
-                        parent = comment.parent()
-                        is_top_level_comment = isinstance(parent, Submission)
-                        comment_submission = schemas.CommentSubmission(
-                            author=comment.author.name,
-                            downvotes=comment.downs,
-                            context=f"{parent.title} | {parent.selftext}" if is_top_level_comment else parent.body,
-                            subreddit=comment.subreddit.display_name,
-                            text=text,
-                            timestamp=timezone.make_aware(dt.datetime.fromtimestamp(comment.created_utc)).isoformat(),
-                            upvotes=comment.ups,
-                        )
-                        pending_tokens = self.llm_provider.estimate_tokens(existing_submissions_text + [comment_submission.text])
-                        if pending_tokens < max_input_tokens:
-                            submissions.append(comment_submission)
-                        else:
-                            break
+            # Only the submissions posted since the previous run are fetched, the rest of the history is stored. Threads
+            # and comments are selected newest first, so the listings are only paged as far as the budget reaches.
+            max_submissions = self.env.redditor.listing.max_submissions or None
+            page_size = min(max_submissions or LISTING_PAGE_SIZE, LISTING_PAGE_SIZE)
+            threads = SubmissionListing(redditor.submissions.new, stored_threads, limit=max_submissions, owner=self.identifier, page_size=page_size)
+            comments = SubmissionListing(redditor.comments.new, stored_comments, limit=max_submissions, owner=self.identifier, page_size=page_size)
+            newest_first = heapq.merge(threads, comments, key=operator.attrgetter("created_utc"), reverse=True)
+            selected = self.select_submissions(((submission, self.sanitize_submission(submission.text)) for submission in newest_first), token_budget)
+
+            # Parents of the redditor's comments are often their own threads or comments that were just listed.
+            loaded = {submission.fullname: submission for submission in threads.fetched + comments.fetched}
+            submissions = self.get_submissions(selected, loaded)
+            threads.store()
+            comments.store()
+
+            self.listing_pages = threads.pages + comments.pages
+            log.info(
+                "Listed %d submissions of %s in %d pages, avoided %d parent requests and kept %d submissions as inputs",
+                threads.listed + comments.listed,
+                self.identifier,
+                self.listing_pages,
+                self.parent_requests_avoided,
+                len(submissions),
+            )
         except (Forbidden, NotFound) as e:
             raise self.unprocessable_entity(str(e))
 
@@ -179,6 +510,10 @@ class RedditorBase(RedditBase):
 
 
 class ThreadBase(RedditBase):
+    @property
+    def llm_env(self) -> schemas.env.LlmEnv:
+        return self.env.thread.llm
+
     @retry(
         before_sleep=before_sleep_log(log, logging.DEBUG),
         reraise=True,
@@ -187,7 +522,6 @@ class ThreadBase(RedditBase):
         wait=wait_random_exponential(min=1, max=60),
     )
     def get_inputs(self) -> List[schemas.LlmInput]:
-        submissions: List[schemas.LlmInput] = []
         ignored_usernames = set(models.IgnoredRedditor.objects.values_list("username", flat=True))
 
         try:
@@ -195,49 +529,26 @@ class ThreadBase(RedditBase):
         except InvalidURL as e:
             raise self.unprocessable_entity(str(e))
 
-        max_input_tokens = int(self.llm.context_window * self.env.thread.llm.max_context_window_for_inputs)
+        token_budget = self.token_budget()
 
         try:
-            if text := self.sanitize_submission(thread.selftext):
-                thread_submission = schemas.ThreadSubmission(
-                    author=thread.author.name,
-                    downvotes=thread.downs,
-                    subreddit=thread.subreddit.display_name,
-                    text=text,
-                    timestamp=timezone.make_aware(dt.datetime.fromtimestamp(thread.created_utc)).isoformat(),
-                    upvotes=thread.ups,
-                )
-                pending_tokens = self.llm_provider.estimate_tokens(submissions + [thread_submission])
-                if pending_tokens < max_input_tokens:
-                    submissions.append(thread_submission)
-
-            comment: Comment
-            for comment in thread.comments.list():
-                if isinstance(comment, MoreComments):
+            # The thread and its comment forest are fetched with a single request, so they are not stored.
+            fetched_thread = fetched_submission(thread)
+            loaded = {fetched_thread.fullname: fetched_thread}
+            candidates = []
+            for obj in thread.comments.list():
+                if isinstance(obj, MoreComments):
                     continue
-                if comment.author and comment.author.name not in ignored_usernames:
-                    if text := self.sanitize_submission(comment.body):
-                        existing_submissions_text = [submission.text for submission in submissions]
-                        if text not in existing_submissions_text:
-                            # If `comment` is a top-level comment, `parent` will be a `Submission` instance for the thread.
-                            # Otherwise, `parent` will be the parent comment that `comment` is a response to. The intention
-                            # here is to capture the context in which the comment was made.
-                            parent = comment.parent()
-                            is_top_level_comment = isinstance(parent, Submission)
-                            comment_submission = schemas.CommentSubmission(
-                                author=comment.author.name,
-                                downvotes=comment.downs,
-                                context=f"{parent.title} | {parent.selftext}" if is_top_level_comment else parent.body,
-                                subreddit=comment.subreddit.display_name,
-                                text=text,
-                                timestamp=timezone.make_aware(dt.datetime.fromtimestamp(comment.created_utc)).isoformat(),
-                                upvotes=comment.ups,
-                            )
-                            pending_tokens = self.llm_provider.estimate_tokens(existing_submissions_text + [comment_submission.text])
-                            if pending_tokens < max_input_tokens:
-                                submissions.append(comment_submission)
-                            else:
-                                break
+                comment = fetched_submission(obj)
+                loaded[comment.fullname] = comment
+                if comment.author and comment.author not in ignored_usernames:
+                    candidates.append(comment)
+
+            sanitized = zip(candidates, self.sanitize_submissions([comment.text for comment in candidates]))
+            selected = self.select_submissions(itertools.chain([(fetched_thread, self.sanitize_submission(fetched_thread.text))], sanitized), token_budget)
+
+            # Only parents hidden behind "load more comments" are not part of the comment forest.
+            submissions = self.get_submissions(selected, loaded)
         except NotFound as e:
             raise self.unprocessable_entity(str(e))
 
@@ -261,22 +572,52 @@ class ThreadBase(RedditBase):
 
 
 class LlmActionBase(abc.ABC):
+    response_format: type[pydantic.BaseModel]
+
+    @property
+    def static_prompt_prefix(self) -> str:
+        # The prompt of a data job is the same for every job, so all of it is static.
+        return ""
+
     @abc.abstractmethod
     def create_object(self, *args, **kwargs):
         pass
 
+    async def acreate_object(self, *args, **kwargs):
+        # Thread sensitive `sync_to_async` calls share a single thread, so the database writes of concurrent jobs in an
+        # async worker run one after another on one connection.
+        return await util.db.database_sync_to_async(self.create_object)(*args, **kwargs)
+
+    def generate(self, *, inputs: List[schemas.LlmInput], prompt: str):
+        raw_response = self.llm_provider.generate_data(inputs=inputs, prompt=prompt, response_format=self.response_format, static_prefix=self.static_prompt_prefix)
+        log.debug("Retry stats: %s", self.llm_provider.generate_data.retry.statistics)
+        return self.parse_response(inputs=inputs, prompt=prompt, raw_response=raw_response)
+
+    async def agenerate(self, *, inputs: List[schemas.LlmInput], prompt: str):
+        raw_response = await self.llm_provider.agenerate_data(inputs=inputs, prompt=prompt, response_format=self.response_format, static_prefix=self.static_prompt_prefix)
+        log.debug("Retry stats: %s", self.llm_provider.agenerate_data.retry.statistics)
+        return self.parse_response(inputs=inputs, prompt=prompt, raw_response=raw_response)
+
     @abc.abstractmethod
-    def generate(self, *args, **kwargs):
+    def parse_response(self, *, inputs: List[schemas.LlmInput], prompt: str, raw_response: schemas.LlmProviderRawResponse):
         pass
 
 
 class RedditorContextQueryService(LlmActionBase, RedditorBase):
+    response_format = schemas.GeneratedRedditorContextQuery
+
+    @property
+    def static_prompt_prefix(self) -> str:
+        # The extension prefills the prompt of a context query with the default prompt, which users extend with their query.
+        return self.env.redditor.llm.prompts.process_context_query
+
     def create_object(self, generated: schemas.GeneratedRedditorContextQueryWithContext) -> models.RedditorContextQuery:
         redditor = models.Redditor.objects.get(username=self.identifier)
         return models.RedditorContextQuery.objects.create(
             context=redditor,
             prompt=generated.prompt,
             request_meta=models.RequestMetadata.objects.create(
+                cached_input_tokens=cached_input_tokens(generated.usage_metadata),
                 contributor=self.contributor,
                 input_tokens=generated.usage_metadata["input_tokens"],
                 llm=self.llm,
@@ -288,9 +629,7 @@ class RedditorContextQueryService(LlmActionBase, RedditorBase):
             response=generated.response,
         )
 
-    def generate(self, *, inputs: List[schemas.LlmInput], prompt: str) -> schemas.GeneratedRedditorContextQueryWithContext:
-        raw_response = self.llm_provider.generate_data(inputs=inputs, prompt=prompt, response_format=schemas.GeneratedRedditorContextQuery)
-        log.debug("Retry stats: %s", self.llm_provider.generate_data.retry.statistics)
+    def parse_response(self, *, inputs: List[schemas.LlmInput], prompt: str, raw_response: schemas.LlmProviderRawResponse) -> schemas.GeneratedRedditorContextQueryWithContext:
         parsed = raw_response.parsed.model_dump()
         return schemas.GeneratedRedditorContextQueryWithContext(
             inputs=inputs,
@@ -301,12 +640,20 @@ class RedditorContextQueryService(LlmActionBase, RedditorBase):
 
 
 class ThreadContextQueryService(LlmActionBase, ThreadBase):
+    response_format = schemas.GeneratedThreadContextQuery
+
+    @property
+    def static_prompt_prefix(self) -> str:
+        # The extension prefills the prompt of a context query with the default prompt, which users extend with their query.
+        return self.env.thread.llm.prompts.process_context_query
+
     def create_object(self, *, generated: schemas.GeneratedThreadContextQueryWithContext) -> models.ThreadContextQuery:
         thread = models.Thread.objects.get(path=self.identifier)
         return models.ThreadContextQuery.objects.create(
             context=thread,
             prompt=generated.prompt,
             request_meta=models.RequestMetadata.objects.create(
+                cached_input_tokens=cached_input_tokens(generated.usage_metadata),
                 contributor=self.contributor,
                 input_tokens=generated.usage_metadata["input_tokens"],
                 llm=self.llm,
@@ -318,13 +665,7 @@ class ThreadContextQueryService(LlmActionBase, ThreadBase):
             response=generated.response,
         )
 
-    def generate(self, *, inputs: List[schemas.LlmInput], prompt: str) -> schemas.GeneratedThreadContextQueryWithContext:
-        raw_response = self.llm_provider.generate_data(
-            inputs=inputs,
-            prompt=prompt,
-            response_format=schemas.GeneratedThreadContextQuery,
-        )
-        log.debug("Retry stats: %s", self.llm_provider.generate_data.retry.statistics)
+    def parse_response(self, *, inputs: List[schemas.LlmInput], prompt: str, raw_response: schemas.LlmProviderRawResponse) -> schemas.GeneratedThreadContextQueryWithContext:
         parsed = raw_response.parsed.model_dump()
         return schemas.GeneratedThreadContextQueryWithContext(
             inputs=inputs,
@@ -335,7 +676,12 @@ class ThreadContextQueryService(LlmActionBase, ThreadBase):
 
 
 class RedditorDataService(LlmActionBase, RedditorBase):
+    response_format = schemas.GeneratedRedditorData
+
+    @transaction.atomic
     def create_object(self, *, generated: schemas.GeneratedRedditorDataWithContext) -> models.RedditorData:
+        # `update_or_create` locks the `Redditor` row until the transaction commits, so concurrent writers cannot
+        # leave `latest_data` pointing at an older entry.
         redditor, _ = models.Redditor.objects.update_or_create(
             username=self.identifier,
             defaults={
@@ -346,12 +692,13 @@ class RedditorDataService(LlmActionBase, RedditorBase):
                 "username": self.identifier,
             },
         )
-        return models.RedditorData.objects.create(
+        redditor_data = models.RedditorData.objects.create(
             age=generated.age,
             interests=generated.normalized_interests(),
             iq=generated.iq,
             redditor=redditor,
             request_meta=models.RequestMetadata.objects.create(
+                cached_input_tokens=cached_input_tokens(generated.usage_metadata),
                 contributor=self.contributor,
                 input_tokens=generated.usage_metadata["input_tokens"],
                 llm=self.llm,
@@ -364,14 +711,13 @@ class RedditorDataService(LlmActionBase, RedditorBase):
             sentiment_subjectivity=generated.sentiment_subjectivity,
             summary=generated.summary,
         )
+        redditor.latest_data = redditor_data
+        redditor.save(update_fields=["latest_data"])
+        # Drop the cached representation only once the new entry is visible to readers that repopulate the cache.
+        transaction.on_commit(functools.partial(cache.delete, util.cache.processed_redditor_key(self.identifier)))
+        return redditor_data
 
-    def generate(self, *, inputs: List[schemas.LlmInput], prompt: str) -> schemas.GeneratedRedditorDataWithContext:
-        raw_response = self.llm_provider.generate_data(
-            inputs=inputs,
-            prompt=prompt,
-            response_format=schemas.GeneratedRedditorData,
-        )
-        log.debug("Retry stats: %s", self.llm_provider.generate_data.retry.statistics)
+    def parse_response(self, *, inputs: List[schemas.LlmInput], prompt: str, raw_response: schemas.LlmProviderRawResponse) -> schemas.GeneratedRedditorDataWithContext:
         parsed = raw_response.parsed.model_dump()
         return schemas.GeneratedRedditorDataWithContext(
             age=parsed["age"],
@@ -387,7 +733,12 @@ class RedditorDataService(LlmActionBase, RedditorBase):
 
 
 class ThreadDataService(LlmActionBase, ThreadBase):
+    response_format = schemas.GeneratedThreadData
+
+    @transaction.atomic
     def create_object(self, *, generated: schemas.GeneratedThreadDataWithContext) -> models.ThreadData:
+        # `update_or_create` locks the `Thread` row until the transaction commits, so concurrent writers cannot
+        # leave `latest_data` pointing at an older entry.
         thread, _ = models.Thread.objects.update_or_create(
             path=self.identifier,
             defaults={
@@ -398,9 +749,10 @@ class ThreadDataService(LlmActionBase, ThreadBase):
                 "path": self.identifier,
             },
         )
-        return models.ThreadData.objects.create(
+        thread_data = models.ThreadData.objects.create(
             keywords=generated.normalized_keywords(),
             request_meta=models.RequestMetadata.objects.create(
+                cached_input_tokens=cached_input_tokens(generated.usage_metadata),
                 contributor=self.contributor,
                 input_tokens=generated.usage_metadata["input_tokens"],
                 llm=self.llm,
@@ -414,14 +766,13 @@ class ThreadDataService(LlmActionBase, ThreadBase):
             summary=generated.summary,
             thread=thread,
         )
+        thread.latest_data = thread_data
+        thread.save(update_fields=["latest_data"])
+        # Drop the cached representation only once the new entry is visible to readers that repopulate the cache.
+        transaction.on_commit(functools.partial(cache.delete, util.cache.processed_thread_key(self.identifier)))
+        return thread_data
 
-    def generate(self, *, inputs: List[schemas.LlmInput], prompt: str) -> schemas.GeneratedThreadDataWithContext:
-        raw_response = self.llm_provider.generate_data(
-            inputs=inputs,
-            prompt=prompt,
-            response_format=schemas.GeneratedThreadData,
-        )
-        log.debug("Retry stats: %s", self.llm_provider.generate_data.retry.statistics)
+    def parse_response(self, *, inputs: List[schemas.LlmInput], prompt: str, raw_response: schemas.LlmProviderRawResponse) -> schemas.GeneratedThreadDataWithContext:
         parsed = raw_response.parsed.model_dump()
         return schemas.GeneratedThreadDataWithContext(
             inputs=inputs,
@@ -89,6 +89,12 @@ CONSTANCE_ADDITIONAL_FIELDS = {
             "required": False,
         },
     ],
+    "input_encoding_select": [
+        "django.forms.fields.ChoiceField",
+        {
+            "choices": (("compact", "compact"), ("json", "json")),
+        },
+    ],
     "llm_select": [
         "django.forms.fields.ChoiceField",
         {
@@ -134,6 +140,30 @@ CONSTANCE_CONFIG = collections.OrderedDict(
             "Enable processing of data for reddit threads.",
             "checkbox",
         ),
+        "LLM_BATCH_ENABLED": (
+            False,
+            "Defer the LLM requests of redditor and thread data processing jobs that are not in the `high` queue to the "
+            "batch API of the LLM provider. Batches cost half as much but can take up to 24 hours to complete.",
+            "checkbox",
+        ),
+        "LLM_BATCH_MAX_REQUESTS": (
+            1000,
+            "The maximum number of LLM requests submitted in a single batch.",
+        ),
+        "LLM_EXACT_TOKEN_COUNTING_ENABLED": (
+            False,
+            "Count the tokens of inputs with the tokenizer of the LLM instead of estimating them, so that inputs fill "
+            "`LLM_MAX_CONTEXT_WINDOW_FOR_INPUTS` of the context window without exceeding it. Tokens are estimated for "
+            "LLMs whose tokenizer is not available.",
+            "checkbox",
+        ),
+        "LLM_INPUT_ENCODING": (
+            "compact",
+            "How submissions are serialized for the LLM. `compact` names the fields once in a header followed by a line per "
+            "submission, which takes considerably fewer tokens than `json`, a list of objects that repeats the field names for "
+            "every submission.",
+            "input_encoding_select",
+        ),
         "LLM_NAME": (
             "gpt-4o-mini-2024-07-18",
             "Large language model to use for prompts. Only OpenAI models are currently supported - https://platform.openai.com/docs/models/",
@@ -178,6 +208,18 @@ CONSTANCE_CONFIG = collections.OrderedDict(
             120,
             "The minimum number of characters required for the text of a single submission to be included in " "processing. This is the length of the text after filtering.",
         ),
+        "SUBMISSION_PARALLEL_SANITIZE_THRESHOLD": (
+            0,
+            "The number of comments a thread needs for their text to be sanitized in parallel on a pool of processes in the "
+            "worker, instead of one comment at a time. Only megathreads are worth the overhead of the pool. 0 disables "
+            "parallel sanitization.",
+        ),
+        "REDDITOR_LISTING_MAX_SUBMISSIONS": (
+            100,
+            "The maximum number of threads and of comments listed from the history of a redditor. Listings are requested "
+            "from reddit in pages of up to 100 submissions, and paging stops early once the inputs fill the token budget. "
+            "0 lists as many submissions as reddit returns, which is at most 1000.",
+        ),
         "REDDITOR_MIN_SUBMISSIONS": (
             5,
             "The minimum number of submissions available after filtering for processing of a redditor to occur.",
@@ -210,6 +252,12 @@ CONSTANCE_CONFIG = collections.OrderedDict(
             "deletion, previously unprocessable paths will be reattempted if included in an API request.",
             timedelta,
         ),
+        "FETCHED_SUBMISSION_EXP_TD": (
+            timedelta(days=90),
+            "Defines how long `FetchedSubmission` entries will remain in the database before being deleted. Stored "
+            "submissions are reused when an entity is reprocessed, so only newer submissions are fetched from reddit.",
+            timedelta,
+        ),
         "REDDITOR_ACCOUNT_MIN_AGE": (
             timedelta(hours=1),
             "The minimum age a redditor account must be for data processing to occur.",
@@ -1,4 +1,6 @@
 from . import (
+    cache,
+    db,
     fields,
     format,
     inputs,
@@ -0,0 +1,68 @@
+import hashlib
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+)
+
+from django.core.cache import cache
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def context_query_key(identifier: str, *, data_id: int, env_id: str, llm_id: int, prompt: str) -> str:
+    """
+    Returns the key under which the primary key of the result of a context query is cached. Prompts that only differ in
+    whitespace or case share a key. The inputs of a context query are not known until they are fetched, so they are
+    identified by the entry of the latest data of the redditor or thread and the worker env snapshot, which change
+    whenever the redditor or thread is reprocessed or the settings that shape the inputs are changed.
+
+    Args:
+        identifier (str): The username of the redditor or the URL path of the thread.
+        data_id (int): The primary key of the latest data of the redditor or thread.
+        env_id (str): The id of the worker env snapshot the query is processed with.
+        llm_id (int): The primary key of the LLM that answers the query.
+        prompt (str): The prompt of the query.
+
+    Returns:
+        str: The cache key.
+    """
+    prompt_hash = _hash(" ".join(prompt.split()).casefold())
+    snapshot_hash = _hash(f"{env_id}:{data_id}")
+    return f"context-query:{identifier}:{llm_id}:{prompt_hash}:{snapshot_hash}"
+
+
+def processed_redditor_key(username: str) -> str:
+    return f"processed-redditor:{username}"
+
+
+def processed_thread_key(path: str) -> str:
+    return f"processed-thread:{path}"
+
+
+def get_or_set_many(identifiers: Iterable[str], *, key_func: Callable[[str], str], load_func: Callable[[list[str]], Dict[str, dict]], timeout: float) -> Dict[str, dict]:
+    """
+    Read-through cache for values that are stored per identifier. All identifiers are read with a single multi-get
+    and only the identifiers that are missing from the cache are passed to `load_func`. The loaded values are written
+    back to the cache with a single multi-set.
+
+    Args:
+        identifiers (Iterable[str]): The identifiers to get the values for.
+        key_func (Callable[[str], str]): Returns the cache key of an identifier.
+        load_func (Callable[[list[str]], Dict[str, dict]]): Loads the values of the identifiers missing from the cache.
+        timeout (float): The number of seconds loaded values are cached for.
+
+    Returns:
+        Dict[str, dict]: The values keyed by identifier. Identifiers that `load_func` did not return a value for are omitted.
+    """
+    keys = {key_func(identifier): identifier for identifier in identifiers}
+    values = {keys[key]: value for key, value in cache.get_many(keys).items()}
+
+    if missing := [identifier for identifier in keys.values() if identifier not in values]:
+        loaded = load_func(missing)
+        cache.set_many({key_func(identifier): value for identifier, value in loaded.items()}, timeout=timeout)
+        values.update(loaded)
+
+    return values
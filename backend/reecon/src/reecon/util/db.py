@@ -0,0 +1,25 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def _closing_old_connections(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return wrapper
+
+
+def database_sync_to_async(func, *, thread_sensitive: bool = True):
+    """
+    Like `asgiref.sync.sync_to_async`, but cleans up the database connections of the thread around the call the way
+    Django does around a request. The threads that run the calls outlive them, so their connections would otherwise be
+    kept open past `CONN_MAX_AGE` and reused after the database has dropped them.
+    """
+    return sync_to_async(_closing_old_connections(func), thread_sensitive=thread_sensitive)
@@ -1,15 +1,53 @@
+from concurrent.futures import (
+    BrokenExecutor,
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+import functools
+import multiprocessing
+import re
+import sys
+import threading
+from typing import (
+    List,
+    Sequence,
+)
+
+import django
+
 from . import (
     markdown,
     regex,
 )
 
 
+# Rendering Markdown as plain text only makes text shorter, except for tabs, which are expanded to spaces, code, whose `&`,
+# `<` and `>` are escaped, and HTML and autolinks, which may be put on lines of their own or obfuscated.
+_GROWS_WHEN_STRIPPED = re.compile(r"[\t`<]| {4}")
+# The number of sanitized texts that are kept per process. The submissions of a redditor are sanitized again every time
+# the redditor is processed.
+SANITIZE_CACHE_SIZE = 4096
+# The number of texts that are sent to a process of the pool at once, and the number of processes of the pool.
+SANITIZE_CHUNK_SIZE = 250
+SANITIZE_PROCESSES = 4
+
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=SANITIZE_CACHE_SIZE)
 def sanitize(s: str, *, max_length: int, min_length: int) -> str:
     if not s:
         return ""
 
     # Remove block quotes as they are someone else's words. We do not want them included in the responder's submissions.
     text = regex.match_block_quotes.sub("", s)
+
+    # Text that is already too short does not need to be parsed.
+    if len(text) < min_length and not _GROWS_WHEN_STRIPPED.search(text):
+        return ""
+
     text = markdown.strip(text)
     text = " ".join(line.strip() for line in text.splitlines())
     text = text.strip()
@@ -19,3 +57,54 @@ def sanitize(s: str, *, max_length: int, min_length: int) -> str:
         text = ""
 
     return text
+
+
+def _sanitize_chunk(texts: Sequence[str], *, max_length: int, min_length: int) -> List[str]:
+    return [sanitize(s, max_length=max_length, min_length=min_length) for s in texts]
+
+
+def _get_executor() -> Executor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if getattr(sys, "_is_gil_enabled", lambda: True)():
+                # Processes are spawned rather than forked, because the worker process may have threads of its own. Every
+                # process sets up django, since importing `reecon.util` imports the models.
+                _executor = ProcessPoolExecutor(max_workers=SANITIZE_PROCESSES, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup)
+            else:
+                # Without the GIL, threads sanitize in parallel without pickling the texts.
+                _executor = ThreadPoolExecutor(max_workers=SANITIZE_PROCESSES, thread_name_prefix="sanitize")
+        return _executor
+
+
+def _reset_executor(executor: Executor) -> None:
+    global _executor
+    with _executor_lock:
+        # Another job may have replaced the broken executor already.
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def sanitize_all(texts: Sequence[str], *, max_length: int, min_length: int) -> List[str]:
+    """
+    Sanitize many texts in parallel. The texts are split into chunks that are sanitized on a pool of `SANITIZE_PROCESSES`
+    processes, which is started the first time it is needed and shared by every job of the worker process. A pool whose
+    process died is broken for good, so it is replaced by the next call and the texts are sanitized serially instead.
+
+    Args:
+        texts (Sequence[str]): The texts to sanitize.
+        max_length (int): See `sanitize`.
+        min_length (int): See `sanitize`.
+
+    Returns:
+        List[str]: The sanitized texts in the same order as `texts`.
+    """
+    chunks = [texts[i : i + SANITIZE_CHUNK_SIZE] for i in range(0, len(texts), SANITIZE_CHUNK_SIZE)]
+    sanitize_chunk = functools.partial(_sanitize_chunk, max_length=max_length, min_length=min_length)
+    executor = _get_executor()
+    try:
+        return [text for chunk in executor.map(sanitize_chunk, chunks) for text in chunk]
+    except BrokenExecutor:
+        _reset_executor(executor)
+        return sanitize_chunk(texts)
@@ -1,23 +1,53 @@
-import io
+import re
+import threading
 
 import markdown
 
 
-def _unmark_element(element, stream=None):
-    if stream is None:
-        stream = io.StringIO()
-    if element.text:
-        stream.write(element.text)
-    for sub in element:
-        _unmark_element(sub, stream)
-    if element.tail:
-        stream.write(element.tail)
-    return stream.getvalue()
+# Characters and line prefixes that Markdown may treat as syntax. Text without any of them is rendered as paragraphs of
+# the text itself. This errs on the side of matching, e.g. a `*` surrounded by spaces is not syntax.
+_SYNTAX = re.compile(r"[\\`*_\[\]<&\t\r\x02\x03]|^\s*[-+=#>]|^ {4}|^\s*\d+[.)]|  \n", re.MULTILINE)
+# The blank lines that separate paragraphs.
+_PARAGRAPH_BREAK = re.compile(r"\n(?: *\n)+")
+
+_local = threading.local()
 
 
 # https://stackoverflow.com/a/54923798/4344185
-def strip(text):
-    markdown.Markdown.output_formats["plain"] = _unmark_element
-    md = markdown.Markdown(output_format="plain")
-    md.stripTopLevelTags = False
-    return md.convert(text)
+def _unmark_element(element) -> str:
+    # The root element has no tail, so the text and tails of it and its descendants are all that is left of the Markdown.
+    return "".join(element.itertext())
+
+
+def _converter() -> markdown.Markdown:
+    # Building a `Markdown` instance loads all of its processors, so every thread builds one and reuses it. Instances keep
+    # state between conversions and are not thread safe.
+    converter = getattr(_local, "converter", None)
+    if converter is None:
+        converter = _local.converter = markdown.Markdown()
+        converter.serializer = _unmark_element
+        converter.stripTopLevelTags = False
+    return converter
+
+
+def has_syntax(text: str) -> bool:
+    """
+    Returns whether Markdown may render `text` as anything other than paragraphs of the text itself.
+    """
+    return _SYNTAX.search(text) is not None
+
+
+def strip(text: str) -> str:
+    """
+    Render Markdown as plain text. Text without Markdown syntax is split into paragraphs the same way Markdown does
+    without parsing it.
+
+    Args:
+        text (str): The Markdown.
+
+    Returns:
+        str: The text with its Markdown syntax removed and its paragraphs on lines of their own.
+    """
+    if not has_syntax(text):
+        return "\n".join(paragraph for paragraph in (paragraph.lstrip() for paragraph in _PARAGRAPH_BREAK.split(text)) if paragraph).strip()
+    return _converter().reset().convert(text)
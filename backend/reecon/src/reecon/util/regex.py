@@ -20,4 +20,6 @@ and this continues the quote
     > this is indented 4 times (code block) so it does not match
 and neither should this
 """
-match_block_quotes = re.compile(r"(^\s{0,3}>\s?.*(\n(?!\n|\s{4}).*)*)", re.MULTILINE)
+# The quantifiers are possessive, so a match never backtracks into the lines it has consumed. A quote with many lines is
+# matched in linear time, where backtracking states would otherwise pile up for every line of it.
+match_block_quotes = re.compile(r"^\s{0,3}>\s?+.*+(?:\n(?!\n|\s{4}).*+)*+", re.MULTILINE)
@@ -0,0 +1,56 @@
+"""
+Micro-benchmark for removing block quotes from adversarial texts.
+
+Files in this directory are not collected by the default test run. Run this one explicitly with:
+
+    pytest tests/benchmarks/bench_block_quotes.py -s
+
+`util.regex.match_block_quotes` is timed for texts with half and with all of their lines, and compared to the pattern
+before its quantifiers were made possessive. The backtracking pattern keeps a state for every line of a quote, which
+makes it slower than linear on texts with many quoted lines.
+"""
+
+import re
+import time
+
+import pytest
+
+from reecon import util
+
+
+LINES = 100_000
+
+BACKTRACKING_MATCH_BLOCK_QUOTES = re.compile(r"(^\s{0,3}>\s?.*(\n(?!\n|\s{4}).*)*)", re.MULTILINE)
+
+TEXTS = {
+    "empty quote lines": ">\n" * LINES,
+    "one long quote": "> quote\n" + "continued\n" * LINES,
+    "quoted lines": "> quote\n" * LINES,
+    "whitespace before quotes": "   \n\n>" * LINES,
+    "unquoted lines": "this is just a string with a > symbol in it\n" * LINES,
+}
+
+
+def _time(pattern, s):
+    start = time.perf_counter()
+    result = pattern.sub("", s)
+    return time.perf_counter() - start, result
+
+
+@pytest.mark.parametrize("name", TEXTS)
+def test_match_block_quotes(name):
+    lines = TEXTS[name].splitlines(keepends=True)
+    half = "".join(lines[: len(lines) // 2])
+    full = "".join(lines)
+
+    half_elapsed, _ = _time(util.regex.match_block_quotes, half)
+    full_elapsed, result = _time(util.regex.match_block_quotes, full)
+    backtracking_elapsed, expected = _time(BACKTRACKING_MATCH_BLOCK_QUOTES, full)
+    print(
+        f"\n{name}\n{len(lines) // 2} lines: {half_elapsed:.4f}s\n{len(lines)} lines: {full_elapsed:.4f}s\nratio: {full_elapsed / half_elapsed:.2f}\n"
+        f"backtracking pattern: {backtracking_elapsed:.4f}s"
+    )
+
+    assert result == expected
+    # Quadratic matching would make this ratio approach 4.
+    assert full_elapsed / half_elapsed < 3
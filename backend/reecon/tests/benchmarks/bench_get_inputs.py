@@ -0,0 +1,71 @@
+"""
+Micro-benchmark for assembling the inputs of a thread with a large number of comments.
+
+Files in this directory are not collected by the default test run. Run this one explicitly with:
+
+    pytest tests/benchmarks/bench_get_inputs.py -s
+
+`ThreadBase.get_inputs` is timed for a synthetic thread with half and with all of its comments. Input collection is
+linear in the number of comments, so doubling the number of comments roughly doubles the time.
+"""
+
+import time
+from unittest.mock import patch
+
+import pytest
+
+from reecon.schemas import get_worker_env
+from reecon.services import get_reddit_client
+from reecon.services.reddit import ThreadBase
+
+
+COMMENTS = 5_000
+
+
+@pytest.fixture
+def mock_reddit_client(django_settings):
+    django_settings(
+        REDDIT_API_CLIENT_ID="",
+        REDDIT_API_CLIENT_SECRET="",
+        REDDIT_API_RATELIMIT_SECONDS=1,
+        REDDIT_API_USER_AGENT="",
+    )
+
+    get_reddit_client.cache_clear()
+    with patch("reecon.services.clients.Reddit") as mock:
+        yield mock.return_value
+    get_reddit_client.cache_clear()
+
+
+def _time_get_inputs(thread_base, mock_reddit_client, comments):
+    mock_reddit_client.submission.return_value.comments.list.return_value = comments
+    start = time.perf_counter()
+    inputs = thread_base.get_inputs()
+    elapsed = time.perf_counter() - start
+    assert len(inputs) == len(comments) + 1
+    return elapsed
+
+
+@pytest.mark.django_db
+def test_get_inputs(llm_providers_settings, llm_stub, mock_praw_comment, mock_praw_thread, mock_reddit_client, thread_stub, user_stub):
+    # Make the context window large enough that every comment fits, so the whole thread is always assembled.
+    llm_stub.context_window = 10_000_000
+    thread_base = ThreadBase(
+        identifier=thread_stub.identifier,
+        contributor=user_stub,
+        llm=llm_stub,
+        llm_providers_settings=llm_providers_settings,
+        submitter=user_stub,
+        env=get_worker_env(),
+    )
+    thread_base.env.reddit.submission.min_length = 1
+    mock_reddit_client.submission.return_value = mock_praw_thread(fullname="t3_thread")
+    # Every parent is part of the loaded comment forest, so no parents are fetched.
+    comments = [mock_praw_comment(body=f"Comment number {i}", fullname=f"t1_{i}", parent_id=f"t1_{i - 1}" if i else "t3_thread") for i in range(COMMENTS)]
+
+    half_elapsed = _time_get_inputs(thread_base, mock_reddit_client, comments[: COMMENTS // 2])
+    full_elapsed = _time_get_inputs(thread_base, mock_reddit_client, comments)
+    print(f"\n{COMMENTS // 2} comments: {half_elapsed:.3f}s\n{COMMENTS} comments: {full_elapsed:.3f}s\nratio: {full_elapsed / half_elapsed:.2f}")
+
+    # Quadratic collection would make this ratio approach 4.
+    assert full_elapsed / half_elapsed < 3
@@ -0,0 +1,207 @@
+"""
+Query plan benchmark for the indexes that serve the hot lookup and cleanup queries.
+
+Files in this directory are not collected by the default test run because they seed large amounts of data. Run this
+one explicitly with:
+
+    pytest tests/benchmarks/bench_query_plans.py -s
+
+The database is seeded with a realistic number of rows and every query is explained twice: once with the indexes
+from `Meta.indexes` dropped and once with them in place, so the change in query plan is visible in the output.
+"""
+
+import datetime as dt
+
+from django.db import connection
+from django.utils import timezone
+import pytest
+
+from reecon.models import (
+    AppUser,
+    Redditor,
+    RedditorContextQuery,
+    RedditorData,
+    RequestMetadata,
+    Thread,
+    ThreadData,
+    UnprocessableRedditor,
+    UnprocessableThread,
+)
+
+
+BATCH_SIZE = 5_000
+CONTEXT_QUERIES = 10_000
+DATA_PER_ENTITY = 2
+ENTITIES = 50_000
+UNPROCESSABLE_ENTITIES = 20_000
+USERS = 200
+
+INDEXED_MODELS = (
+    RedditorData,
+    ThreadData,
+    UnprocessableRedditor,
+    UnprocessableThread,
+)
+
+
+def _request_metadata(count, llm, users):
+    return RequestMetadata.objects.bulk_create(
+        (
+            RequestMetadata(
+                contributor=users[i % len(users)],
+                input_tokens=1000,
+                llm=llm,
+                output_tokens=500,
+                submitter=users[i % len(users)],
+                total_inputs=10,
+                total_tokens=1500,
+            )
+            for i in range(count)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+def _spread_created(model, step: dt.timedelta):
+    # `created` is set by `auto_now_add`, so spread the rows out over time after they are inserted.
+    with connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {model._meta.db_table} SET created = %s - id * %s", [timezone.now(), step])
+
+
+@pytest.fixture
+def seeded_database(llm_stub):
+    users = AppUser.objects.bulk_create(AppUser(username=f"user-{i}", password="!") for i in range(USERS))
+
+    redditors = Redditor.objects.bulk_create((Redditor(username=f"redditor-{i}") for i in range(ENTITIES)), batch_size=BATCH_SIZE)
+    request_metas = iter(_request_metadata(ENTITIES * DATA_PER_ENTITY, llm_stub, users))
+    RedditorData.objects.bulk_create(
+        (
+            RedditorData(
+                age=30,
+                interests=["interest"],
+                iq=100,
+                redditor=redditor,
+                request_meta=next(request_metas),
+                summary="summary",
+            )
+            for _ in range(DATA_PER_ENTITY)
+            for redditor in redditors
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    _spread_created(RedditorData, dt.timedelta(seconds=1))
+
+    threads = Thread.objects.bulk_create((Thread(path=f"/r/test/comments/{i}") for i in range(ENTITIES)), batch_size=BATCH_SIZE)
+    request_metas = iter(_request_metadata(ENTITIES * DATA_PER_ENTITY, llm_stub, users))
+    ThreadData.objects.bulk_create(
+        (
+            ThreadData(
+                keywords=["keyword"],
+                request_meta=next(request_metas),
+                summary="summary",
+                thread=thread,
+            )
+            for _ in range(DATA_PER_ENTITY)
+            for thread in threads
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    _spread_created(ThreadData, dt.timedelta(seconds=1))
+
+    request_metas = iter(_request_metadata(CONTEXT_QUERIES, llm_stub, users))
+    RedditorContextQuery.objects.bulk_create(
+        (
+            RedditorContextQuery(
+                context=redditors[i % len(redditors)],
+                prompt="prompt",
+                request_meta=next(request_metas),
+                response="response",
+            )
+            for i in range(CONTEXT_QUERIES)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+    # The cleanup jobs run more often than entries expire, so only the entries created since the previous run are
+    # expired at any time. Redditors expire after a day and are cleaned up hourly, threads expire after 15 minutes
+    # and are cleaned up every 5 minutes.
+    UnprocessableRedditor.objects.bulk_create(
+        (UnprocessableRedditor(reason="reason", username=f"unprocessable-{i}") for i in range(UNPROCESSABLE_ENTITIES)),
+        batch_size=BATCH_SIZE,
+    )
+    _spread_created(UnprocessableRedditor, dt.timedelta(hours=25) / UNPROCESSABLE_ENTITIES)
+    UnprocessableThread.objects.bulk_create(
+        (UnprocessableThread(path=f"/r/test/comments/unprocessable{i}", reason="reason") for i in range(UNPROCESSABLE_ENTITIES)),
+        batch_size=BATCH_SIZE,
+    )
+    _spread_created(UnprocessableThread, dt.timedelta(minutes=20) / UNPROCESSABLE_ENTITIES)
+
+    with connection.cursor() as cursor:
+        # Check the deferred foreign key constraints now, otherwise indexes cannot be rebuilt in this transaction.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute("ANALYZE")
+
+    return {
+        "redditor": redditors[len(redditors) // 2],
+        "thread": threads[len(threads) // 2],
+        "usernames": [redditor.username for redditor in redditors[:100]],
+        "user": users[len(users) // 2],
+    }
+
+
+def _queries(seeded):
+    now = timezone.now()
+    return {
+        "latest redditor data": (
+            RedditorData.objects.filter(redditor=seeded["redditor"]).order_by("-created")[:1],
+            "redditordata_redditor_created",
+        ),
+        "latest thread data": (
+            ThreadData.objects.filter(thread=seeded["thread"]).order_by("-created")[:1],
+            "threaddata_thread_created",
+        ),
+        "fresh redditors": (
+            Redditor.objects.filter(username__in=seeded["usernames"]).exclude(last_processed__lt=now - dt.timedelta(days=30)).values_list("username", flat=True),
+            "reecon_redditor_username",
+        ),
+        "expired unprocessable redditors": (
+            UnprocessableRedditor.objects.filter(created__lte=now - dt.timedelta(days=1)),
+            "unprocessableredditor_created",
+        ),
+        "expired unprocessable threads": (
+            UnprocessableThread.objects.filter(created__lte=now - dt.timedelta(minutes=15)),
+            "unprocessablethread_created",
+        ),
+        "submitted redditor context queries": (
+            RedditorContextQuery.objects.filter(request_meta__submitter=seeded["user"]),
+            "reecon_requestmetadata_submitter_id",
+        ),
+    }
+
+
+def _explain_all(seeded):
+    return {name: queryset.explain() for name, (queryset, _) in _queries(seeded).items()}
+
+
+@pytest.mark.django_db
+def test_query_plans(seeded_database):
+    with connection.schema_editor() as schema_editor:
+        for model in INDEXED_MODELS:
+            for index in model._meta.indexes:
+                schema_editor.remove_index(model, index)
+    plans_without_indexes = _explain_all(seeded_database)
+
+    with connection.schema_editor() as schema_editor:
+        for model in INDEXED_MODELS:
+            for index in model._meta.indexes:
+                schema_editor.add_index(model, index)
+    plans_with_indexes = _explain_all(seeded_database)
+
+    for name, (_, index_name) in _queries(seeded_database).items():
+        print(f"\n=== {name} ===")
+        print(f"--- without Meta.indexes ---\n{plans_without_indexes[name]}")
+        print(f"--- with Meta.indexes ---\n{plans_with_indexes[name]}")
+
+        # Indexes created implicitly for unique and foreign key columns get a hashed suffix in their name. The planner
+        # may still hash join against a small table, so only check that the index serving the filter is used.
+        assert index_name in plans_with_indexes[name]
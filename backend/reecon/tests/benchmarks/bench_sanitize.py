@@ -0,0 +1,102 @@
+"""
+Micro-benchmark for sanitizing the text of submissions.
+
+Files in this directory are not collected by the default test run. Run this one explicitly with:
+
+    pytest tests/benchmarks/bench_sanitize.py -s
+
+`util.inputs.sanitize` is timed over a synthetic corpus of comments, most of which are plain text like the majority of
+reddit comments, against stripping Markdown with a new `markdown.Markdown` instance per comment. Every comment of the
+corpus is unique, so the memoization of `sanitize` does not apply.
+"""
+
+import io
+import random
+import time
+
+import markdown
+
+from reecon import util
+
+
+COMMENTS = 5_000
+MAX_LENGTH = 3000
+MIN_LENGTH = 20
+
+WORDS = "the a this that post thread comment really think people would could just like get know time good make way even".split()
+MARKDOWN = (
+    "**{}**",
+    "*{}*",
+    "`{}`",
+    "[{}](https://www.reddit.com/r/test/)",
+    "~~{}~~",
+)
+
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(4, 20))
+    if rng.random() < 0.05:
+        i = rng.randrange(len(words))
+        words[i] = rng.choice(MARKDOWN).format(words[i])
+    return " ".join(words).capitalize() + rng.choice(".?!")
+
+
+def _paragraph(rng: random.Random) -> str:
+    kind = rng.random()
+    if kind < 0.05:
+        return "\n".join(f"- {_sentence(rng)}" for _ in range(rng.randint(2, 5)))
+    if kind < 0.1:
+        return f"> {_sentence(rng)}"
+    return " ".join(_sentence(rng) for _ in range(rng.randint(1, 4)))
+
+
+def _comment(i: int, rng: random.Random) -> str:
+    return "\n\n".join([f"Comment {i}.", *(_paragraph(rng) for _ in range(rng.randint(1, 3)))])
+
+
+def _corpus() -> list[str]:
+    rng = random.Random(0)
+    # Most reddit comments have no formatting at all.
+    return [_comment(i, rng) if rng.random() < 0.4 else " ".join(_sentence(rng) for _ in range(rng.randint(1, 5))) + f" {i}" for i in range(COMMENTS)]
+
+
+def _unmark_element(element, stream=None):
+    if stream is None:
+        stream = io.StringIO()
+    if element.text:
+        stream.write(element.text)
+    for sub in element:
+        _unmark_element(sub, stream)
+    if element.tail:
+        stream.write(element.tail)
+    return stream.getvalue()
+
+
+def _baseline_sanitize(s: str) -> str:
+    # The previous implementation, which builds a `markdown.Markdown` instance for every text.
+    text = util.regex.match_block_quotes.sub("", s)
+    markdown.Markdown.output_formats["plain"] = _unmark_element
+    md = markdown.Markdown(output_format="plain")
+    md.stripTopLevelTags = False
+    text = md.convert(text)
+    text = " ".join(line.strip() for line in text.splitlines()).strip()
+    return text if MIN_LENGTH <= len(text) <= MAX_LENGTH else ""
+
+
+def _time(func, corpus):
+    start = time.perf_counter()
+    results = [func(s) for s in corpus]
+    return time.perf_counter() - start, results
+
+
+def test_sanitize():
+    corpus = _corpus()
+    util.inputs.sanitize.cache_clear()
+
+    baseline_elapsed, expected = _time(_baseline_sanitize, corpus)
+    elapsed, results = _time(lambda s: util.inputs.sanitize(s, max_length=MAX_LENGTH, min_length=MIN_LENGTH), corpus)
+    util.inputs.sanitize.cache_clear()
+    print(f"\n{COMMENTS} comments\nnew Markdown per comment: {baseline_elapsed:.3f}s\nsanitize: {elapsed:.3f}s\nspeedup: {baseline_elapsed / elapsed:.1f}x")
+
+    assert results == expected
+    assert elapsed < baseline_elapsed / 2
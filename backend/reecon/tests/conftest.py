@@ -1,7 +1,10 @@
 import datetime as dt
+import itertools
 from unittest.mock import Mock
 
+from django.core.cache import cache
 from django.utils import timezone
+from django_redis import get_redis_connection
 from langchain_core.messages import AIMessage
 from langchain_core.messages.ai import UsageMetadata
 from praw.models import (
@@ -16,6 +19,7 @@ from reecon.schemas import (
     ThreadSubmission,
 )
 from reecon.models import (
+    FetchedSubmission,
     IgnoredRedditor,
     LLM,
     LlmProvider,
@@ -48,6 +52,25 @@ def ai_message(usage_metadata):
     return func
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Fixture to clear the cache so that cached representations do not leak between tests.
+    """
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_rate_limits():
+    """
+    Fixture to delete the rate limit buckets, which are stored in redis outside of the cache, so that their state does
+    not leak between tests.
+    """
+    redis = get_redis_connection("default")
+    for key in redis.scan_iter("*ratelimit*"):
+        redis.delete(key)
+
+
 @pytest.fixture
 def comment_submission(mock_praw_comment):
     def func(is_top_level=False, **kwargs):
@@ -77,6 +100,25 @@ def django_settings(settings):
     return func
 
 
+@pytest.fixture
+def fetched_submission_cls():
+    def func(*, author="redditor", created_utc=1234567890, fullname, listing_owner="", parent_id="", text="Stored text", title=""):
+        return FetchedSubmission.objects.create(
+            author=author,
+            created_utc=created_utc,
+            downs=10,
+            fullname=fullname,
+            listing_owner=listing_owner,
+            parent_id=parent_id,
+            subreddit="subreddit",
+            text=text,
+            title=title,
+            ups=50,
+        )
+
+    return func
+
+
 @pytest.fixture
 def ignored_redditor_cls():
     def func(*, reason, username):
@@ -149,12 +191,17 @@ def llm_provider_stub(llm_provider_cls):
     )
 
 
+# Fullnames are unique on reddit, so every mocked thread and comment gets its own.
+mock_praw_ids = itertools.count()
+
+
 @pytest.fixture
 def mock_praw_comment():
     def func(is_top_level=False, **kwargs):
         if is_top_level:
             mock_parent = Mock(
                 __class__=Submission,
+                fullname="t3_parent",
                 selftext="Parent thread body",
                 title="Thread title",
             )
@@ -162,14 +209,18 @@ def mock_praw_comment():
             mock_parent = Mock(
                 __class__=Comment,
                 body="Parent comment body",
+                fullname="t1_parent",
             )
 
         attrs = {
+            "__class__": Comment,
             "author.name": "redditor",
             "body": "Test comment body",
             "created_utc": 1234567890,
             "downs": 10,
+            "fullname": f"t1_mock{next(mock_praw_ids)}",
             "parent.return_value": mock_parent,
+            "parent_id": mock_parent.fullname,
             "subreddit.display_name": "subreddit",
             "ups": 50,
         }
@@ -183,11 +234,14 @@ def mock_praw_comment():
 def mock_praw_thread():
     def func(**kwargs):
         attrs = {
+            "__class__": Submission,
             "author.name": "redditor",
             "selftext": "Test thread body",
             "created_utc": 1234567890,
             "downs": 10,
+            "fullname": f"t3_mock{next(mock_praw_ids)}",
             "subreddit.display_name": "subreddit",
+            "title": "Test thread title",
             "ups": 50,
         }
         attrs.update(kwargs)
@@ -239,7 +293,7 @@ def redditor_context_query_cls():
 @pytest.fixture
 def redditor_data_cls():
     def func(*, age, interests, iq, redditor, request_meta, sentiment_polarity, sentiment_subjectivity, summary):
-        return RedditorData.objects.create(
+        redditor_data = RedditorData.objects.create(
             age=age,
             interests=interests,
             iq=iq,
@@ -249,6 +303,9 @@ def redditor_data_cls():
             sentiment_subjectivity=sentiment_subjectivity,
             summary=summary,
         )
+        redditor.latest_data = redditor_data
+        redditor.save(update_fields=["latest_data"])
+        return redditor_data
 
     return func
 
@@ -329,7 +386,7 @@ def thread_context_query_cls():
 @pytest.fixture
 def thread_data_cls():
     def func(*, keywords, request_meta, sentiment_polarity, sentiment_subjectivity, summary, thread):
-        return ThreadData.objects.create(
+        thread_data = ThreadData.objects.create(
             keywords=keywords,
             request_meta=request_meta,
             sentiment_polarity=sentiment_polarity,
@@ -337,6 +394,9 @@ def thread_data_cls():
             summary=summary,
             thread=thread,
         )
+        thread.latest_data = thread_data
+        thread.save(update_fields=["latest_data"])
+        return thread_data
 
     return func
 
@@ -48,5 +48,5 @@ class TestRequestMetadata:
 
     def test_str(self, llm_stub, request_metadata_cls, user_stub):
         request_meta = request_metadata_cls(contributor=user_stub, input_tokens=100, llm=llm_stub, output_tokens=200, submitter=user_stub, total_inputs=5, total_tokens=300)
-        expected_str = f"RequestMetadata(contributor={request_meta.contributor.username}, input_tokens={request_meta.input_tokens}, llm={request_meta.llm.name}, output_tokens={request_meta.output_tokens}, submitter={request_meta.submitter.username}, total_inputs={request_meta.total_inputs}, total_tokens={request_meta.total_tokens})"
+        expected_str = f"RequestMetadata(cached_input_tokens={request_meta.cached_input_tokens}, contributor={request_meta.contributor.username}, input_tokens={request_meta.input_tokens}, llm={request_meta.llm.name}, output_tokens={request_meta.output_tokens}, submitter={request_meta.submitter.username}, total_inputs={request_meta.total_inputs}, total_tokens={request_meta.total_tokens})"
         assert str(request_meta) == expected_str
@@ -1,7 +1,14 @@
+import datetime as dt
+
 import pytest
 from django.utils import timezone
 from django.utils.text import Truncator
 
+from reecon.models import (
+    Redditor,
+    RedditorData,
+)
+
 
 @pytest.mark.django_db
 class TestIgnoredRedditor:
@@ -29,6 +36,126 @@ class TestRedditor:
         expected_str = f"Redditor(last_processed={redditor.last_processed}, username={redditor.username})"
         assert str(redditor) == expected_str
 
+    def test_latest_data(self, redditor_data_cls, redditor_stub, request_metadata_cls, request_metadata_stub):
+        older = redditor_data_cls(
+            age=25,
+            interests=["coding"],
+            iq=100,
+            redditor=redditor_stub,
+            request_meta=request_metadata_stub,
+            sentiment_polarity=0.5,
+            sentiment_subjectivity=0.5,
+            summary="Older summary.",
+        )
+        newer = redditor_data_cls(
+            age=26,
+            interests=["reading"],
+            iq=110,
+            redditor=redditor_stub,
+            request_meta=request_metadata_cls(
+                contributor=request_metadata_stub.contributor,
+                input_tokens=100,
+                llm=request_metadata_stub.llm,
+                output_tokens=200,
+                submitter=request_metadata_stub.submitter,
+                total_inputs=5,
+                total_tokens=300,
+            ),
+            sentiment_polarity=0.5,
+            sentiment_subjectivity=0.5,
+            summary="Newer summary.",
+        )
+        assert older.created < newer.created
+        assert redditor_stub.latest_data == newer
+
+    def test_latest_data_falls_back_on_delete(self, redditor_cls, redditor_data_cls, redditor_stub, request_metadata_cls, request_metadata_stub):
+        def create_data(redditor, summary):
+            return redditor_data_cls(
+                age=25,
+                interests=["coding"],
+                iq=100,
+                redditor=redditor,
+                request_meta=request_metadata_cls(
+                    contributor=request_metadata_stub.contributor,
+                    input_tokens=100,
+                    llm=request_metadata_stub.llm,
+                    output_tokens=200,
+                    submitter=request_metadata_stub.submitter,
+                    total_inputs=5,
+                    total_tokens=300,
+                ),
+                sentiment_polarity=0.5,
+                sentiment_subjectivity=0.5,
+                summary=summary,
+            )
+
+        oldest = create_data(redditor_stub, "Oldest summary.")
+        older = create_data(redditor_stub, "Older summary.")
+        newer = create_data(redditor_stub, "Newer summary.")
+        other_redditor = redditor_cls(username="other-redditor")
+        other_data = create_data(other_redditor, "Other summary.")
+
+        newer.delete()
+        redditor_stub.refresh_from_db()
+        assert redditor_stub.latest_data == older
+
+        RedditorData.objects.filter(pk__in=[older.pk, other_data.pk]).delete()
+        redditor_stub.refresh_from_db()
+        other_redditor.refresh_from_db()
+        assert redditor_stub.latest_data == oldest
+        assert other_redditor.latest_data is None
+
+        redditor_stub.delete()
+        assert not RedditorData.objects.exists()
+
+    def test_with_latest_data(self, django_assert_num_queries, redditor_cls, redditor_data_cls, request_metadata_stub):
+        redditor = redditor_cls(username="testuser")
+        redditor_data = redditor_data_cls(
+            age=25,
+            interests=["coding"],
+            iq=100,
+            redditor=redditor,
+            request_meta=request_metadata_stub,
+            sentiment_polarity=0.5,
+            sentiment_subjectivity=0.5,
+            summary="A very active user.",
+        )
+        redditor_cls(username="no-data")
+
+        with django_assert_num_queries(1):
+            redditors = {r.username: r for r in Redditor.objects.with_latest_data()}
+            assert redditors["testuser"].latest_data == redditor_data
+            assert redditors["testuser"].latest_data.request_meta.llm.provider == request_metadata_stub.llm.provider
+            assert redditors["testuser"].latest_data.request_meta.submitter == request_metadata_stub.submitter
+            assert redditors["no-data"].latest_data is None
+
+    def test_classify(self, django_assert_num_queries, ignored_redditor_cls, redditor_cls, unprocessable_redditor_cls):
+        now = timezone.now()
+        fresh = redditor_cls(username="fresh", last_processed=now)
+        stale = redditor_cls(username="stale", last_processed=now - dt.timedelta(days=31))
+        unprocessable = unprocessable_redditor_cls(username="unprocessable", reason="not enough submissions")
+        ignored = ignored_redditor_cls(username="ignored", reason="spam")
+        redditor_cls(username="not-submitted")
+
+        with django_assert_num_queries(1):
+            classification = Redditor.objects.classify(
+                ["fresh", "stale", "unprocessable", "ignored", "unknown"],
+                stale_before=now - dt.timedelta(days=30),
+            )
+            assert classification.fresh == [fresh]
+            assert classification.fresh[0].last_processed == fresh.last_processed
+            assert classification.fresh[0].latest_data_id is None
+            assert classification.stale == [stale]
+            assert classification.unprocessable == [unprocessable]
+            assert classification.unprocessable[0].reason == unprocessable.reason
+            assert classification.unprocessable[0].created == unprocessable.created
+            assert classification.ignored == [ignored]
+            assert classification.ignored[0].reason == ignored.reason
+
+    def test_classify_no_usernames(self, redditor_stub):
+        classification = Redditor.objects.classify([], stale_before=timezone.now())
+        assert classification == ([], [], [], [])
+
 
 @pytest.mark.django_db
 class TestRedditorContextQuery:
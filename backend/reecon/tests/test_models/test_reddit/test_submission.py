@@ -0,0 +1,56 @@
+import pytest
+
+from reecon.models import FetchedSubmission
+
+
+@pytest.mark.django_db
+class TestFetchedSubmission:
+    def test_create(self, fetched_submission_cls):
+        thread = fetched_submission_cls(fullname="t3_asdf", title="Thread title")
+        comment = fetched_submission_cls(fullname="t1_asdf", parent_id="t3_asdf")
+        assert thread.is_thread
+        assert not comment.is_thread
+
+    def test_str(self, fetched_submission_cls):
+        fetched_submission = fetched_submission_cls(fullname="t1_asdf")
+        expected_str = "FetchedSubmission(author=redditor, fullname=t1_asdf, text=Stored text)"
+        assert str(fetched_submission) == expected_str
+
+    def test_store(self, fetched_submission_cls):
+        """
+        Test that storing submissions inserts new ones and updates the ones that are already stored.
+        """
+        fetched_submission_cls(fullname="t1_stored")
+        FetchedSubmission.objects.store(
+            [
+                FetchedSubmission(author="redditor", created_utc=1, downs=1, fullname="t1_stored", subreddit="subreddit", text="Edited text", ups=100),
+                FetchedSubmission(author="redditor", created_utc=2, downs=0, fullname="t1_new", subreddit="subreddit", text="Old text", ups=1),
+                FetchedSubmission(author="redditor", created_utc=2, downs=0, fullname="t1_new", subreddit="subreddit", text="New text", ups=1),
+            ]
+        )
+        assert dict(FetchedSubmission.objects.values_list("fullname", "text")) == {"t1_new": "New text", "t1_stored": "Edited text"}
+        assert FetchedSubmission.objects.get(fullname="t1_stored").ups == 100
+
+    def test_store_listing_owner(self, fetched_submission_cls):
+        """
+        Test that storing submissions for a listing adds them to its history, including ones that were stored as parents,
+        and that storing parents leaves the history as it is.
+        """
+        fetched_submission_cls(fullname="t1_parent")
+        fetched_submission_cls(fullname="t1_listed", listing_owner="redditor")
+        FetchedSubmission.objects.store(
+            [FetchedSubmission(author="redditor", created_utc=1, downs=0, fullname="t1_parent", subreddit="subreddit", text="Stored text", ups=1)],
+            listing_owner="redditor",
+        )
+        FetchedSubmission.objects.store([FetchedSubmission(author="redditor", created_utc=1, downs=0, fullname="t1_listed", subreddit="subreddit", text="Stored text", ups=1)])
+        assert dict(FetchedSubmission.objects.values_list("fullname", "listing_owner")) == {"t1_listed": "redditor", "t1_parent": "redditor"}
+
+    def test_unlist(self, fetched_submission_cls):
+        """
+        Test that unlisting removes only the threads or only the comments of a redditor from their history.
+        """
+        fetched_submission_cls(fullname="t1_listed", listing_owner="redditor")
+        fetched_submission_cls(fullname="t3_listed", listing_owner="redditor")
+        fetched_submission_cls(fullname="t1_other", listing_owner="other")
+        assert FetchedSubmission.objects.unlist("redditor", is_thread=False) == 1
+        assert dict(FetchedSubmission.objects.values_list("fullname", "listing_owner")) == {"t1_listed": "", "t1_other": "other", "t3_listed": "redditor"}
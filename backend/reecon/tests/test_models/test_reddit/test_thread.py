@@ -1,6 +1,11 @@
+import datetime as dt
+
 import pytest
+from django.utils import timezone
 from django.utils.text import Truncator
 
+from reecon.models import Thread
+
 
 @pytest.mark.django_db
 class TestThread:
@@ -15,6 +20,108 @@ class TestThread:
         expected_str = f"Thread(last_processed={thread.last_processed}, path={thread.path})"
         assert str(thread) == expected_str
 
+    def test_latest_data(self, request_metadata_cls, request_metadata_stub, thread_data_cls, thread_stub):
+        older = thread_data_cls(
+            keywords=["older"],
+            request_meta=request_metadata_stub,
+            sentiment_polarity=0.5,
+            sentiment_subjectivity=0.5,
+            summary="Older summary.",
+            thread=thread_stub,
+        )
+        newer = thread_data_cls(
+            keywords=["newer"],
+            request_meta=request_metadata_cls(
+                contributor=request_metadata_stub.contributor,
+                input_tokens=100,
+                llm=request_metadata_stub.llm,
+                output_tokens=200,
+                submitter=request_metadata_stub.submitter,
+                total_inputs=5,
+                total_tokens=300,
+            ),
+            sentiment_polarity=0.5,
+            sentiment_subjectivity=0.5,
+            summary="Newer summary.",
+            thread=thread_stub,
+        )
+        assert older.created < newer.created
+        assert thread_stub.latest_data == newer
+
+    def test_latest_data_falls_back_on_delete(self, request_metadata_cls, request_metadata_stub, thread_data_cls, thread_stub):
+        def create_data(summary):
+            return thread_data_cls(
+                keywords=["keyword"],
+                request_meta=request_metadata_cls(
+                    contributor=request_metadata_stub.contributor,
+                    input_tokens=100,
+                    llm=request_metadata_stub.llm,
+                    output_tokens=200,
+                    submitter=request_metadata_stub.submitter,
+                    total_inputs=5,
+                    total_tokens=300,
+                ),
+                sentiment_polarity=0.5,
+                sentiment_subjectivity=0.5,
+                summary=summary,
+                thread=thread_stub,
+            )
+
+        older = create_data("Older summary.")
+        newer = create_data("Newer summary.")
+
+        # Deleting the request metadata deletes its data along with it.
+        newer.request_meta.delete()
+        thread_stub.refresh_from_db()
+        assert thread_stub.latest_data == older
+
+        older.delete()
+        thread_stub.refresh_from_db()
+        assert thread_stub.latest_data is None
+
+    def test_with_latest_data(self, django_assert_num_queries, request_metadata_stub, thread_cls, thread_data_cls):
+        thread = thread_cls(path="/r/test/comments/asdf")
+        thread_data = thread_data_cls(
+            keywords=["test"],
+            request_meta=request_metadata_stub,
+            sentiment_polarity=0.5,
+            sentiment_subjectivity=0.5,
+            summary="A very informative thread.",
+            thread=thread,
+        )
+        thread_cls(path="/r/test/comments/nodata")
+
+        with django_assert_num_queries(1):
+            threads = {t.path: t for t in Thread.objects.with_latest_data()}
+            assert threads[thread.path].latest_data == thread_data
+            assert threads[thread.path].latest_data.request_meta.llm.provider == request_metadata_stub.llm.provider
+            assert threads[thread.path].latest_data.request_meta.contributor == request_metadata_stub.contributor
+            assert threads["/r/test/comments/nodata"].latest_data is None
+
+    def test_classify(self, django_assert_num_queries, thread_cls, unprocessable_thread_cls):
+        now = timezone.now()
+        fresh = thread_cls(path="/r/test/comments/fresh", last_processed=now)
+        stale = thread_cls(path="/r/test/comments/stale", last_processed=now - dt.timedelta(minutes=16))
+        unprocessable = unprocessable_thread_cls(path="/r/test/comments/unprocessable", reason="not enough submissions")
+        thread_cls(path="/r/test/comments/notsubmitted")
+
+        with django_assert_num_queries(1):
+            classification = Thread.objects.classify(
+                ["/r/test/comments/fresh", "/r/test/comments/stale", "/r/test/comments/unprocessable", "/r/test/comments/unknown"],
+                stale_before=now - dt.timedelta(minutes=15),
+            )
+            assert classification.fresh == [fresh]
+            assert classification.fresh[0].last_processed == fresh.last_processed
+            assert classification.fresh[0].latest_data_id is None
+            assert classification.stale == [stale]
+            assert classification.unprocessable == [unprocessable]
+            assert classification.unprocessable[0].reason == unprocessable.reason
+            assert classification.unprocessable[0].created == unprocessable.created
+
+    def test_classify_no_paths(self, thread_stub):
+        classification = Thread.objects.classify([], stale_before=timezone.now())
+        assert classification == ([], [], [])
+
 
 @pytest.mark.django_db
 class TestThreadContextQuery:
@@ -51,3 +51,8 @@ def redditor_env_stub(llm_env_stub, reddit_entity_submission_env_stub, redditor_
 @pytest.fixture
 def thread_env_stub(llm_env_stub, reddit_entity_submission_env_stub):
     return env.ThreadEnv(llm=llm_env_stub, submission=reddit_entity_submission_env_stub)
+
+
+@pytest.fixture
+def worker_env_stub(reddit_env_stub, redditor_env_stub, thread_env_stub):
+    return env.WorkerEnv(reddit=reddit_env_stub, redditor=redditor_env_stub, thread=thread_env_stub)
@@ -1,8 +1,11 @@
 import datetime as dt
 
 from constance.test import override_config
+from django.core.cache import cache
 from django.test import override_settings
+import pytest
 
+from reecon.models import WorkerEnvSnapshot
 from reecon.schemas import env
 
 
@@ -13,13 +16,17 @@ from reecon.schemas import env
     REDDIT_API_USER_AGENT="user_agent",
 )
 @override_config(
+    LLM_EXACT_TOKEN_COUNTING_ENABLED=True,
+    LLM_INPUT_ENCODING="json",
     LLM_MAX_CONTEXT_WINDOW_FOR_INPUTS=0.5,
     REDDITOR_ACCOUNT_MIN_AGE=30,
+    REDDITOR_LISTING_MAX_SUBMISSIONS=250,
     REDDITOR_LLM_CONTEXT_QUERY_PROMPT="context query",
     REDDITOR_LLM_DATA_PROMPT="data process",
     REDDITOR_MIN_SUBMISSIONS=5,
     SUBMISSION_FILTER_MAX_LENGTH=100,
     SUBMISSION_FILTER_MIN_LENGTH=10,
+    SUBMISSION_PARALLEL_SANITIZE_THRESHOLD=1000,
     THREAD_LLM_CONTEXT_QUERY_PROMPT="thread context query",
     THREAD_LLM_DATA_PROMPT="thread data process",
     THREAD_MIN_SUBMISSIONS=5,
@@ -33,20 +40,63 @@ def test_get_worker_env():
     assert worker_env.reddit.api.user_agent == "user_agent"
     assert worker_env.reddit.submission.max_length == 100
     assert worker_env.reddit.submission.min_length == 10
+    assert worker_env.reddit.submission.parallel_sanitize_threshold == 1000
     assert worker_env.redditor.account.min_age == dt.timedelta(seconds=30)
+    assert worker_env.redditor.listing.max_submissions == 250
+    assert worker_env.redditor.llm.exact_token_counting
+    assert worker_env.redditor.llm.input_encoding == "json"
     assert worker_env.redditor.llm.max_context_window_for_inputs == 0.5
     assert worker_env.redditor.llm.prompts.process_context_query == "context query"
     assert worker_env.redditor.llm.prompts.process_data == "data process"
     assert worker_env.redditor.submission.min_submissions == 5
+    assert worker_env.thread.llm.exact_token_counting
+    assert worker_env.thread.llm.input_encoding == "json"
     assert worker_env.thread.llm.max_context_window_for_inputs == 0.5
     assert worker_env.thread.llm.prompts.process_context_query == "thread context query"
     assert worker_env.thread.llm.prompts.process_data == "thread data process"
     assert worker_env.thread.submission.min_submissions == 5
 
 
+@pytest.mark.django_db
+def test_save_worker_env(worker_env_stub):
+    env_id = env.save_worker_env(worker_env_stub)
+    assert env.save_worker_env(worker_env_stub) == env_id
+    assert WorkerEnvSnapshot.objects.count() == 1
+    assert env.load_worker_env(env_id) == worker_env_stub
+
+    worker_env_stub.redditor.llm.prompts.process_data = "changed data process"
+    changed_env_id = env.save_worker_env(worker_env_stub)
+    assert changed_env_id != env_id
+    assert env.load_worker_env(changed_env_id).redditor.llm.prompts.process_data == "changed data process"
+
+
+@pytest.mark.django_db
+def test_load_worker_env_after_cache_is_cleared(worker_env_stub):
+    """
+    Test that a snapshot outlives the cache, since deferred jobs and batch requests may reference it for longer.
+    """
+    env_id = env.save_worker_env(worker_env_stub)
+    cache.clear()
+    env.load_worker_env.cache_clear()
+    assert env.load_worker_env(env_id) == worker_env_stub
+
+
+@pytest.mark.django_db
+def test_load_worker_env_missing(worker_env_stub):
+    env_id = env.save_worker_env(worker_env_stub)
+    WorkerEnvSnapshot.objects.all().delete()
+    env.load_worker_env.cache_clear()
+    with pytest.raises(LookupError, match=env_id):
+        env.load_worker_env(env_id)
+    with pytest.raises(LookupError):
+        env.load_worker_env("missing")
+
+
 def test_llm_env(llm_prompt_env_stub):
     llm_env = env.LlmEnv(prompts=llm_prompt_env_stub, max_context_window_for_inputs=0.5)
     assert llm_env.prompts is llm_prompt_env_stub
+    assert not llm_env.exact_token_counting
+    assert llm_env.input_encoding == "json"
     assert llm_env.max_context_window_for_inputs == 0.5
 
 
@@ -86,9 +136,15 @@ def test_redditor_account_env():
     assert redditor_account_env.min_age == dt.timedelta(days=30)
 
 
+def test_redditor_listing_env():
+    redditor_listing_env = env.RedditorListingEnv()
+    assert redditor_listing_env.max_submissions == 100
+
+
 def test_redditor_env(llm_env_stub, reddit_entity_submission_env_stub, redditor_account_env_stub):
     redditor_env = env.RedditorEnv(account=redditor_account_env_stub, llm=llm_env_stub, submission=reddit_entity_submission_env_stub)
     assert redditor_env.account is redditor_account_env_stub
+    assert redditor_env.listing == env.RedditorListingEnv()
     assert redditor_env.llm is llm_env_stub
     assert redditor_env.submission is reddit_entity_submission_env_stub
 
@@ -0,0 +1,388 @@
+import itertools
+import json
+from types import SimpleNamespace
+from typing import List
+from unittest.mock import (
+    MagicMock,
+    patch,
+)
+
+from constance.test import override_config
+from django.core.cache import cache
+from pydantic import TypeAdapter
+import pytest
+
+from reecon.models import (
+    LlmBatch,
+    LlmBatchRequest,
+    Redditor,
+    RedditorData,
+    Thread,
+    ThreadData,
+)
+from reecon.schemas import (
+    GeneratedRedditorData,
+    GeneratedRedditorDataWithContext,
+    GeneratedThreadData,
+    GeneratedThreadDataWithContext,
+    get_worker_env,
+    LlmInput,
+)
+from reecon.services import batch
+from reecon.services.clients import get_reddit_client
+from reecon.services.llm_provider import (
+    api_key_hash,
+    INPUT_ENCODERS,
+    priority,
+)
+from reecon.services.reddit import (
+    RedditorDataService,
+    ThreadDataService,
+)
+
+
+LLM_INPUTS = TypeAdapter(List[LlmInput])
+
+
+class StubBatchApi:
+    """
+    A local stand-in for the files and batches endpoints of the OpenAI batch API.
+    """
+
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.file_contents = {}
+        self.remote_batches = {}
+        self.files = SimpleNamespace(content=self.file_content, create=self.create_file)
+        self.batches = SimpleNamespace(create=self.create_batch, retrieve=self.remote_batches.__getitem__)
+
+    def create_file(self, *, file, purpose):
+        assert purpose == "batch"
+        file_id = f"file-{next(self.ids)}"
+        self.file_contents[file_id] = file[1].decode()
+        return SimpleNamespace(id=file_id)
+
+    def file_content(self, file_id):
+        return SimpleNamespace(text=self.file_contents[file_id])
+
+    def create_batch(self, *, completion_window, endpoint, input_file_id):
+        batch_id = f"batch-{next(self.ids)}"
+        self.remote_batches[batch_id] = SimpleNamespace(id=batch_id, input_file_id=input_file_id, output_file_id=None, status="validating")
+        return self.remote_batches[batch_id]
+
+    def lines(self, batch_id):
+        return [json.loads(line) for line in self.file_contents[self.remote_batches[batch_id].input_file_id].splitlines()]
+
+    def complete(self, batch_id, *, content, status_code=200):
+        # Every request of the batch responds with `content`.
+        output = []
+        for line in self.lines(batch_id):
+            body = {
+                "choices": [{"message": {"content": content, "role": "assistant"}}],
+                "usage": {"completion_tokens": 20, "prompt_tokens": 80, "prompt_tokens_details": {"cached_tokens": 64}, "total_tokens": 100},
+            }
+            output.append(json.dumps({"custom_id": line["custom_id"], "error": None, "response": {"body": body, "status_code": status_code}}))
+        self.file_contents["file-output"] = "\n".join(output)
+        self.remote_batches[batch_id].output_file_id = "file-output"
+        self.remote_batches[batch_id].status = "completed"
+
+
+@pytest.fixture
+def batch_api():
+    api = StubBatchApi()
+    with patch("reecon.services.batch.clients.get_openai_client", return_value=api):
+        yield api
+
+
+@pytest.fixture
+def job_queue():
+    queue = MagicMock()
+    with patch("reecon.services.batch.django_rq.get_queue", return_value=queue):
+        yield queue
+
+
+@pytest.fixture
+def generated_redditor_data(usage_metadata):
+    return GeneratedRedditorData(
+        age=30,
+        interests=["something"],
+        iq=100,
+        sentiment_polarity=0.5,
+        sentiment_subjectivity=0.5,
+        summary="Test summary",
+        usage_metadata=usage_metadata,
+    )
+
+
+@pytest.fixture
+def data_service(django_settings, llm_providers_settings, llm_stub, user_stub):
+    django_settings(
+        REDDIT_API_CLIENT_ID="",
+        REDDIT_API_CLIENT_SECRET="",
+        REDDIT_API_RATELIMIT_SECONDS=1,
+        REDDIT_API_USER_AGENT="",
+    )
+    get_reddit_client.cache_clear()
+
+    def func(service_cls, identifier):
+        return service_cls(
+            identifier=identifier,
+            contributor=user_stub,
+            llm=llm_stub,
+            llm_providers_settings=llm_providers_settings,
+            submitter=user_stub,
+            env=get_worker_env(),
+        )
+
+    with patch("reecon.services.clients.Reddit"):
+        yield func
+    get_reddit_client.cache_clear()
+
+
+@override_config(LLM_BATCH_ENABLED=True)
+def test_should_defer():
+    """
+    Test that the requests of jobs are deferred unless the job is in the `high` queue.
+    """
+    assert batch.should_defer()
+    with priority("low"):
+        assert batch.should_defer()
+    with priority("high"):
+        assert not batch.should_defer()
+
+
+@override_config(LLM_BATCH_ENABLED=False)
+def test_should_defer_disabled():
+    """
+    Test that no requests are deferred when batching is disabled.
+    """
+    assert not batch.should_defer()
+
+
+@pytest.mark.django_db
+class TestBatch:
+    def test_defer(self, comment_submission, data_service, llm_providers_settings):
+        """
+        Test that deferring a request stores its inputs, and keeps the API key in the cache instead of the database.
+        """
+        service = data_service(RedditorDataService, "redditor")
+        request = batch.defer(service, inputs=[comment_submission()], prompt="Test data prompt")
+        key_hash = api_key_hash(llm_providers_settings.openai.api_key)
+        assert request.api_key_hash == key_hash
+        assert request.batch is None
+        assert request.kind == LlmBatchRequest.Kind.REDDITOR
+        assert LLM_INPUTS.validate_python(request.inputs) == [comment_submission()]
+        assert cache.get(f"llm-batch-api-key:{key_hash}") == llm_providers_settings.openai.api_key
+        assert batch.find(service) == request
+
+    def test_defer_existing(self, comment_submission, data_service):
+        """
+        Test that deferring an identifier that is already deferred returns the existing request.
+        """
+        service = data_service(ThreadDataService, "/r/test/comments/abc/")
+        request = batch.defer(service, inputs=[comment_submission()], prompt="Test data prompt")
+        assert batch.defer(service, inputs=[], prompt="Another prompt") == request
+        assert LlmBatchRequest.objects.count() == 1
+
+    def test_submit_pending(self, batch_api, comment_submission, data_service, thread_submission):
+        """
+        Test that the pending requests of an API key and LLM are submitted in one batch.
+        """
+        batch.defer(data_service(RedditorDataService, "redditor"), inputs=[comment_submission()], prompt="Redditor prompt")
+        batch.defer(data_service(ThreadDataService, "/r/test/comments/abc/"), inputs=[thread_submission()], prompt="Thread prompt")
+
+        (llm_batch,) = batch.submit_pending()
+        assert llm_batch.status == "validating"
+        assert LlmBatchRequest.objects.filter(batch=llm_batch).count() == 2
+
+        redditor_line, thread_line = batch_api.lines(llm_batch.batch_id)
+        assert redditor_line["url"] == "/v1/chat/completions"
+        assert redditor_line["body"]["model"] == "llm-name"
+        assert redditor_line["body"]["messages"][0] == {"role": "system", "content": "Redditor prompt"}
+        assert redditor_line["body"]["messages"][1]["content"] == INPUT_ENCODERS["compact"].encode([comment_submission()])
+        assert redditor_line["body"]["response_format"]["json_schema"]["name"] == "GeneratedRedditorData"
+        assert thread_line["body"]["response_format"]["json_schema"]["name"] == "GeneratedThreadData"
+        assert thread_line["body"]["response_format"]["json_schema"]["strict"] is True
+
+        # Submitted requests are not submitted again.
+        assert batch.submit_pending() == []
+
+    @override_config(LLM_BATCH_MAX_REQUESTS=1)
+    def test_submit_pending_max_requests(self, batch_api, comment_submission, data_service):
+        """
+        Test that the pending requests are split into batches of at most `LLM_BATCH_MAX_REQUESTS` requests.
+        """
+        for username in ("redditor1", "redditor2"):
+            batch.defer(data_service(RedditorDataService, username), inputs=[comment_submission()], prompt="Redditor prompt")
+        assert len(batch.submit_pending()) == 2
+
+    def test_submit_pending_expired_api_key(self, batch_api, comment_submission, data_service):
+        """
+        Test that pending requests are dropped once their API key has expired from the cache.
+        """
+        batch.defer(data_service(RedditorDataService, "redditor"), inputs=[comment_submission()], prompt="Redditor prompt")
+        cache.clear()
+        assert batch.submit_pending() == []
+        assert not LlmBatchRequest.objects.exists()
+
+    def test_poll_submitted_in_progress(self, batch_api, comment_submission, data_service):
+        """
+        Test that batches that are still in progress are left alone.
+        """
+        batch.defer(data_service(RedditorDataService, "redditor"), inputs=[comment_submission()], prompt="Redditor prompt")
+        (llm_batch,) = batch.submit_pending()
+        batch_api.remote_batches[llm_batch.batch_id].status = "in_progress"
+
+        assert batch.poll_submitted() == []
+        assert LlmBatch.objects.get().status == "in_progress"
+        assert LlmBatchRequest.objects.count() == 1
+
+    def test_poll_submitted_completed(self, batch_api, comment_submission, data_service, generated_redditor_data):
+        """
+        Test that the generated data of a completed batch is stored and the batch is deleted.
+        """
+        batch.defer(data_service(RedditorDataService, "redditor"), inputs=[comment_submission()], prompt="Redditor prompt")
+        (llm_batch,) = batch.submit_pending()
+        batch_api.complete(llm_batch.batch_id, content=generated_redditor_data.model_dump_json())
+
+        assert len(batch.poll_submitted()) == 1
+        redditor_data = Redditor.objects.get(username="redditor").latest_data
+        assert redditor_data.summary == generated_redditor_data.summary
+        assert redditor_data.request_meta.cached_input_tokens == 64
+        assert redditor_data.request_meta.input_tokens == 80
+        assert redditor_data.request_meta.output_tokens == 20
+        assert redditor_data.request_meta.total_inputs == 1
+        assert not LlmBatch.objects.exists()
+        assert not LlmBatchRequest.objects.exists()
+
+    def test_poll_submitted_falls_back(self, batch_api, data_service, job_queue, llm_providers_settings, thread_submission, usage_metadata):
+        """
+        Test that requests that failed in the batch are enqueued to be generated without batching.
+        """
+        batch.defer(data_service(ThreadDataService, "/r/test/comments/abc/"), inputs=[thread_submission()], prompt="Thread prompt")
+        (llm_batch,) = batch.submit_pending()
+        batch_api.complete(llm_batch.batch_id, content="", status_code=500)
+
+        assert len(batch.poll_submitted()) == 1
+        assert not Thread.objects.exists()
+        assert not LlmBatchRequest.objects.exists()
+        (func,), job_kwargs = job_queue.enqueue.call_args
+        assert func is batch.generate
+        assert job_kwargs["kwargs"]["api_key"] == llm_providers_settings.openai.api_key
+
+        generated = GeneratedThreadDataWithContext(
+            inputs=[thread_submission()],
+            keywords=["keyword"],
+            prompt="Thread prompt",
+            sentiment_polarity=0.5,
+            sentiment_subjectivity=0.5,
+            summary="Fallback summary",
+            usage_metadata=usage_metadata,
+        )
+        with patch.object(ThreadDataService, "generate", return_value=generated) as mock_generate:
+            thread_data = func(**job_kwargs["kwargs"])
+
+        mock_generate.assert_called_once_with(inputs=[thread_submission()], prompt="Thread prompt")
+        assert Thread.objects.get(path="/r/test/comments/abc/").latest_data == thread_data
+        assert thread_data.summary == "Fallback summary"
+
+    def test_poll_submitted_invalid_content(self, batch_api, comment_submission, data_service, job_queue):
+        """
+        Test that a response that does not match the response format falls back to a request without batching.
+        """
+        batch.defer(data_service(RedditorDataService, "redditor"), inputs=[comment_submission()], prompt="Redditor prompt")
+        (llm_batch,) = batch.submit_pending()
+        batch_api.complete(llm_batch.batch_id, content="not json")
+
+        batch.poll_submitted()
+        job_queue.enqueue.assert_called_once()
+        assert job_queue.enqueue.call_args.kwargs["kwargs"]["identifier"] == "redditor"
+        assert not RedditorData.objects.exists()
+        assert not ThreadData.objects.exists()
+
+    def test_poll_submitted_enqueue_error(self, batch_api, comment_submission, data_service, job_queue):
+        """
+        Test that a batch is kept until all of its requests are either stored or enqueued.
+        """
+        batch.defer(data_service(RedditorDataService, "redditor"), inputs=[comment_submission()], prompt="Redditor prompt")
+        (llm_batch,) = batch.submit_pending()
+        batch_api.complete(llm_batch.batch_id, content="not json")
+        job_queue.enqueue.side_effect = ConnectionError
+
+        assert batch.poll_submitted() == []
+        assert LlmBatchRequest.objects.get().batch == llm_batch
+
+        job_queue.enqueue.side_effect = None
+        assert [ended.batch_id for ended in batch.poll_submitted()] == [llm_batch.batch_id]
+        assert not LlmBatchRequest.objects.exists()
+
+    def test_poll_submitted_interrupted(self, batch_api, comment_submission, data_service, generated_redditor_data):
+        """
+        Test that the requests of a batch are deleted as their data is stored, so that a poll that is interrupted does not
+        store their data again.
+        """
+        for username in ("redditor1", "redditor2"):
+            batch.defer(data_service(RedditorDataService, username), inputs=[comment_submission()], prompt="Redditor prompt")
+        (llm_batch,) = batch.submit_pending()
+        batch_api.complete(llm_batch.batch_id, content=generated_redditor_data.model_dump_json())
+
+        with patch.object(LlmBatch, "delete", side_effect=KeyboardInterrupt), pytest.raises(KeyboardInterrupt):
+            batch.poll_submitted()
+        assert RedditorData.objects.count() == 2
+        assert not LlmBatchRequest.objects.exists()
+
+        assert len(batch.poll_submitted()) == 1
+        assert RedditorData.objects.count() == 2
+        assert not LlmBatch.objects.exists()
+
+    def test_poll_submitted_retrieve_error(self, batch_api, comment_submission, data_service, generated_redditor_data):
+        """
+        Test that a batch that cannot be retrieved does not keep the other batches from being polled.
+        """
+        with override_config(LLM_BATCH_MAX_REQUESTS=1):
+            for username in ("redditor1", "redditor2"):
+                batch.defer(data_service(RedditorDataService, username), inputs=[comment_submission()], prompt="Redditor prompt")
+            failing_batch, llm_batch = batch.submit_pending()
+        del batch_api.remote_batches[failing_batch.batch_id]
+        batch_api.complete(llm_batch.batch_id, content=generated_redditor_data.model_dump_json())
+
+        assert [ended.batch_id for ended in batch.poll_submitted()] == [llm_batch.batch_id]
+        assert Redditor.objects.get().username == "redditor2"
+        assert LlmBatch.objects.get() == failing_batch
+
+    def test_poll_submitted_releases_api_key(self, batch_api, comment_submission, data_service, generated_redditor_data, llm_providers_settings):
+        """
+        Test that the API key is deleted from the cache once no request needs it anymore.
+        """
+        key = f"llm-batch-api-key:{api_key_hash(llm_providers_settings.openai.api_key)}"
+        batch.defer(data_service(RedditorDataService, "redditor1"), inputs=[comment_submission()], prompt="Redditor prompt")
+        (llm_batch,) = batch.submit_pending()
+        batch_api.complete(llm_batch.batch_id, content=generated_redditor_data.model_dump_json())
+
+        # The key is kept while another request of it is still pending.
+        batch.defer(data_service(RedditorDataService, "redditor2"), inputs=[comment_submission()], prompt="Redditor prompt")
+        batch.poll_submitted()
+        assert cache.get(key) == llm_providers_settings.openai.api_key
+
+        (llm_batch,) = batch.submit_pending()
+        batch_api.complete(llm_batch.batch_id, content=generated_redditor_data.model_dump_json())
+        batch.poll_submitted()
+        assert cache.get(key) is None
+
+
+def test_response_format():
+    """
+    Test that the response format of a schema requires all of its properties and forbids any others, as structured
+    outputs in strict mode do.
+    """
+    response_format = batch._response_format(GeneratedThreadData)
+    assert response_format["type"] == "json_schema"
+    assert response_format["json_schema"]["name"] == "GeneratedThreadData"
+    schema = response_format["json_schema"]["schema"]
+    assert schema["additionalProperties"] is False
+    assert schema["required"] == list(schema["properties"])
+    for definition in schema["$defs"].values():
+        assert definition["additionalProperties"] is False
+        assert definition["required"] == list(definition["properties"])
+    # The schema of the model itself is left untouched.
+    assert "input_token_details" not in GeneratedThreadData.model_json_schema()["$defs"]["UsageMetadata"]["required"]
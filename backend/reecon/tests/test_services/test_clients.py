@@ -0,0 +1,66 @@
+from unittest.mock import (
+    Mock,
+    patch,
+)
+
+import pytest
+
+from reecon.services.clients import (
+    get_chat_model,
+    get_reddit_client,
+)
+from reecon.services.ratelimit import RedditRateLimiter
+
+
+@pytest.fixture
+def mock_init_chat_model():
+    get_chat_model.cache_clear()
+    with patch("reecon.services.clients.init_chat_model") as mock:
+        yield mock
+    get_chat_model.cache_clear()
+
+
+@pytest.fixture
+def mock_reddit():
+    get_reddit_client.cache_clear()
+    with patch("reecon.services.clients.Reddit") as mock:
+        yield mock
+    get_reddit_client.cache_clear()
+
+
+def test_get_chat_model(mock_init_chat_model):
+    """
+    Test that chat models are created once per LLM and API key and reused afterwards.
+    """
+    mock_init_chat_model.side_effect = lambda *args, **kwargs: object()
+    chat_model = get_chat_model(api_key="key-1", llm_name="llm", llm_provider_name="openai")
+    assert get_chat_model(api_key="key-1", llm_name="llm", llm_provider_name="openai") is chat_model
+    assert get_chat_model(api_key="key-2", llm_name="llm", llm_provider_name="openai") is not chat_model
+    mock_init_chat_model.assert_any_call("llm", api_key="key-1", model_provider="openai", include_response_headers=True)
+    assert mock_init_chat_model.call_count == 2
+
+
+def test_get_reddit_client(mock_reddit):
+    """
+    Test that reddit clients are created once per set of credentials, reused afterwards and read-only.
+    """
+    mock_reddit.side_effect = lambda **kwargs: Mock()
+    credentials = {"client_id": "id", "client_secret": "secret", "ratelimit_seconds": 1, "user_agent": "agent"}
+    reddit_client = get_reddit_client(**credentials)
+    assert reddit_client.read_only is True
+    assert get_reddit_client(**credentials) is reddit_client
+    assert get_reddit_client(**{**credentials, "client_id": "other-id"}) is not reddit_client
+    mock_reddit.assert_any_call(**credentials)
+    assert mock_reddit.call_count == 2
+
+
+def test_get_reddit_client_shares_rate_limit(mock_reddit):
+    """
+    Test that reddit clients rate limit their requests with a bucket shared by every client with the same client id.
+    """
+    credentials = {"client_id": "id", "client_secret": "secret", "ratelimit_seconds": 1, "user_agent": "agent"}
+    mock_reddit.return_value._core._rate_limiter.window_size = 600
+    rate_limiter = get_reddit_client(**credentials)._core._rate_limiter
+    assert isinstance(rate_limiter, RedditRateLimiter)
+    assert rate_limiter.bucket.key == "reddit-ratelimit:id"
+    assert rate_limiter.window_size == 600
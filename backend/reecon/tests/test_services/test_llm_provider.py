@@ -1,16 +1,163 @@
-from langchain_core.messages import AIMessage
+import json
+import re
+from unittest.mock import (
+    Mock,
+    patch,
+)
+
+from django_redis import get_redis_connection
+import httpx
+from langchain_core.messages import (
+    AIMessage,
+    HumanMessage,
+    SystemMessage,
+)
+from langchain_core.messages.utils import count_tokens_approximately
+import openai
 from pydantic import BaseModel
 import pytest
 
-from reecon.services import LlmProvider
-from reecon.services.llm_provider import is_missing_expected_generated_data
-from reecon.schemas import LlmProviderRawResponse
+from reecon.services import (
+    ApiKeyScheduler,
+    LlmProvider,
+    TokenBudget,
+)
+from reecon.services.llm_provider import (
+    build_messages,
+    CompactInputEncoder,
+    count_tokens,
+    get_tokenizer,
+    INPUT_ENCODERS,
+    is_missing_expected_generated_data,
+    JsonInputEncoder,
+    priority,
+)
+from reecon.schemas import (
+    CommentSubmission,
+    LlmProviderRawResponse,
+    ThreadSubmission,
+)
 
 
 class MockParsedModel(BaseModel):
     field: str
 
 
+class StubTokenizer:
+    """
+    Splits text into words, runs of whitespace and single punctuation characters instead of loading a BPE encoding.
+    """
+
+    def encode_ordinary(self, text):
+        return re.findall(r"\w+|\s+|[^\w\s]", text)
+
+
+@pytest.fixture
+def submissions():
+    thread_submission = ThreadSubmission(
+        author="redditor",
+        downvotes=0,
+        subreddit="subreddit",
+        text='Thread body with ünïcödé "quotes"',
+        timestamp="2009-02-13T23:31:30+00:00",
+        upvotes=10,
+    )
+    comment_submission = CommentSubmission(
+        author="redditor",
+        context="Parent comment body",
+        downvotes=1,
+        subreddit="subreddit",
+        text="Comment body",
+        timestamp="2009-02-14T01:31:30+02:00",
+        upvotes=2,
+    )
+    other_comment_submission = comment_submission.model_copy(update={"author": "other", "text": "x" * 1001})
+    return [thread_submission, comment_submission, other_comment_submission]
+
+
+def test_compact_input_encoder(submissions):
+    """
+    Test that the compact encoding has a row per input and leaves an author or subreddit empty if it is the same as in
+    the row before.
+    """
+    header, *rows = CompactInputEncoder().encode(submissions).split("\n")
+    assert header.startswith("Submissions, one per line")
+    assert rows == [
+        '["redditor","subreddit","2009-02-13 23:31",10,0,"Thread body with ünïcödé \\"quotes\\""]',
+        '["","","2009-02-13 23:31",2,1,"Comment body","Parent comment body"]',
+        f'["other","","2009-02-13 23:31",2,1,"{"x" * 1001}","Parent comment body"]',
+    ]
+
+
+def test_compact_input_encoder_is_smaller(submissions):
+    """
+    Test that the compact encoding of a redditor's inputs is smaller than the JSON encoding.
+    """
+    inputs = submissions[:2] * 10
+    assert len(CompactInputEncoder().encode(inputs)) < len(JsonInputEncoder().encode(inputs)) / 2
+
+
+def test_json_input_encoder(submissions):
+    """
+    Test that the JSON encoding is a list of the inputs.
+    """
+    assert CommentSubmission.model_validate(json.loads(JsonInputEncoder().encode(submissions))[1]) == submissions[1]
+    assert JsonInputEncoder().encode([]) == "[]"
+
+
+def test_build_messages():
+    """
+    Test that a static prompt is sent before the inputs.
+    """
+    assert build_messages(input_str="[]", prompt="Static prompt") == [SystemMessage("Static prompt"), HumanMessage("[]")]
+
+
+def test_build_messages_with_static_prefix():
+    """
+    Test that the part of a prompt after its static prefix is sent after the inputs.
+    """
+    messages = build_messages(input_str="[]", prompt="Static prompt. Is this a bot? ", static_prefix="Static prompt.")
+    assert messages == [SystemMessage("Static prompt."), HumanMessage("[]"), HumanMessage("Is this a bot?")]
+
+
+def test_build_messages_without_static_prefix():
+    """
+    Test that a prompt is sent as is if it does not start with the static prefix or is the static prefix.
+    """
+    assert build_messages(input_str="[]", prompt="Is this a bot?", static_prefix="Static prompt.") == [SystemMessage("Is this a bot?"), HumanMessage("[]")]
+    assert build_messages(input_str="[]", prompt="Static prompt.", static_prefix="Static prompt.") == [SystemMessage("Static prompt."), HumanMessage("[]")]
+
+
+def test_count_tokens():
+    """
+    Test that tokens are counted with the tokenizer if there is one and estimated otherwise.
+    """
+    assert count_tokens("Comment body, with punctuation.") == count_tokens_approximately(["Comment body, with punctuation."])
+    assert count_tokens("Comment body, with punctuation.", StubTokenizer()) == 9 + 4
+
+
+def test_get_tokenizer():
+    """
+    Test that the encoding of an LLM is only loaded once per process.
+    """
+    get_tokenizer.cache_clear()
+    with patch("tiktoken.encoding_for_model", return_value=StubTokenizer()) as mock_encoding_for_model:
+        tokenizer = get_tokenizer("llm-name")
+        assert get_tokenizer("llm-name") is tokenizer
+    mock_encoding_for_model.assert_called_once_with("llm-name")
+    get_tokenizer.cache_clear()
+
+
+def test_get_tokenizer_unavailable():
+    """
+    Test that there is no tokenizer for an LLM whose encoding is unknown or cannot be downloaded.
+    """
+    get_tokenizer.cache_clear()
+    with patch("tiktoken.encoding_for_model", side_effect=KeyError("llm-name")):
+        assert get_tokenizer("llm-name") is None
+    get_tokenizer.cache_clear()
+
+
 def test_is_missing_expected_generated_data():
     """
     Test the is_missing_expected_generated_data function with a response that has all expected generated data.
@@ -34,15 +181,22 @@ def test_is_missing_expected_generated_data_with_missing_data():
 class TestLlmProvider:
     @pytest.fixture
     def llm_provider(self):
-        return LlmProvider(api_key="test_api_key", llm_name="test_llm_name", llm_provider_name="test_llm_provider_name")
+        return LlmProvider(api_key="test_api_key", input_encoder=JsonInputEncoder(), llm_name="test_llm_name", llm_provider_name="test_llm_provider_name")
 
-    def test_estimate_tokens(self, llm_provider):
+    def test_estimate_tokens(self, llm_provider, submissions):
         """
         Test the estimate_tokens method of the LlmProvider class.
         """
-        result = llm_provider.estimate_tokens("this is a string")
+        result = llm_provider.estimate_tokens(submissions)
         assert isinstance(result, int)
 
+    def test_estimate_tokens_uses_input_encoder(self, llm_provider, submissions):
+        """
+        Test that the estimate depends on the encoder the inputs are sent with.
+        """
+        compact_llm_provider = LlmProvider(api_key="test_api_key", input_encoder=CompactInputEncoder(), llm_name="test_llm_name", llm_provider_name="test_llm_provider_name")
+        assert compact_llm_provider.estimate_tokens(submissions * 10) < llm_provider.estimate_tokens(submissions * 10)
+
     def test_generate_data(self):
         """
         This is untested because it is just wrapping langchain functionality.
@@ -52,3 +206,144 @@ class TestLlmProvider:
         """
         This is untested because it is just wrapping langchain functionality.
         """
+
+
+class TestApiKeyScheduler:
+    @pytest.fixture
+    def rate_limit_error(self):
+        def func(code="rate_limit_exceeded", headers=None):
+            response = httpx.Response(429, headers=headers or {}, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+            return openai.RateLimitError("Rate limit reached", response=response, body={"code": code})
+
+        return func
+
+    @pytest.fixture
+    def mock_sleep(self):
+        # Tests that expect requests to wait delete the bucket in the `side_effect`, which refills it as if time had passed.
+        with patch("reecon.services.llm_provider.time.sleep") as mock:
+            yield mock
+
+    def test_invoke(self, mock_sleep):
+        """
+        Test that the budgets are calibrated with the rate limit headers of the response.
+        """
+        scheduler = ApiKeyScheduler("test_api_key")
+        headers = {
+            "x-ratelimit-limit-requests": "60",
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-limit-tokens": "1000",
+            "x-ratelimit-remaining-tokens": "900",
+        }
+        output = {"raw": AIMessage(content="", response_metadata={"headers": headers})}
+        runnable = Mock(**{"invoke.return_value": output})
+        assert scheduler.invoke(runnable, [HumanMessage("test")]) == output
+        mock_sleep.assert_not_called()
+        assert scheduler.requests.acquire() == pytest.approx(1, abs=0.1)
+
+    def test_invoke_prioritizes_high_queue(self, mock_sleep):
+        """
+        Test that requests of jobs from the `high` queue can use the budget that other requests leave to them.
+        """
+        scheduler = ApiKeyScheduler("test_api_key")
+        scheduler.requests.calibrate(remaining=10, rate=1, capacity=10)
+        runnable = Mock(**{"invoke.return_value": {"raw": AIMessage(content="")}})
+        for _ in range(8):
+            scheduler.invoke(runnable, [HumanMessage("test")])
+        mock_sleep.assert_not_called()
+
+        with priority("high"):
+            scheduler.invoke(runnable, [HumanMessage("test")])
+        mock_sleep.assert_not_called()
+
+        # The next request of a `default` job waits until the headroom is replenished and tries again.
+        mock_sleep.side_effect = lambda seconds: get_redis_connection("default").delete(scheduler.requests.key)
+        scheduler.invoke(runnable, [HumanMessage("test")])
+        mock_sleep.assert_called_once()
+        assert mock_sleep.call_args.args[0] == pytest.approx(2, abs=0.1)
+
+    def test_invoke_retries_rate_limit_error(self, mock_sleep, rate_limit_error):
+        """
+        Test that a request rejected because the API key is rate limited is retried once the budget allows it.
+        """
+        scheduler = ApiKeyScheduler("test_api_key")
+        output = {"raw": AIMessage(content="")}
+        headers = {"x-ratelimit-limit-requests": "60", "x-ratelimit-remaining-requests": "0"}
+        runnable = Mock(**{"invoke.side_effect": [rate_limit_error(headers=headers), output]})
+        mock_sleep.side_effect = lambda seconds: get_redis_connection("default").delete(scheduler.requests.key)
+        assert scheduler.invoke(runnable, [HumanMessage("test")]) == output
+        assert runnable.invoke.call_count == 2
+        # No requests are remaining, so the retry waits for 1 request plus the headroom of 12 requests to be replenished.
+        mock_sleep.assert_called_once()
+        assert mock_sleep.call_args.args[0] == pytest.approx(13, abs=0.1)
+
+    def test_invoke_if_insufficient_quota(self, mock_sleep, rate_limit_error):
+        """
+        Test that a request rejected because the API key is out of credits is not retried.
+        """
+        scheduler = ApiKeyScheduler("test_api_key")
+        runnable = Mock(**{"invoke.side_effect": rate_limit_error(code="insufficient_quota")})
+        with pytest.raises(openai.RateLimitError):
+            scheduler.invoke(runnable, [HumanMessage("test")])
+        runnable.invoke.assert_called_once()
+
+
+@pytest.mark.parametrize("encoder", INPUT_ENCODERS.values(), ids=INPUT_ENCODERS.keys())
+class TestTokenBudget:
+    def test_add(self, encoder, submissions):
+        """
+        Test that the estimate of the budget matches `LlmProvider.estimate_tokens` for the inputs added so far.
+        """
+        llm_provider = LlmProvider(api_key="test_api_key", input_encoder=encoder, llm_name="test_llm_name", llm_provider_name="test_llm_provider_name")
+        budget = TokenBudget(1_000_000, encoder)
+        inputs = []
+        assert budget.tokens == llm_provider.estimate_tokens(inputs)
+
+        for llm_input in submissions * 2:
+            assert budget.add(llm_input)
+            inputs.append(llm_input)
+            assert budget.tokens == llm_provider.estimate_tokens(inputs)
+
+    def test_add_with_tokenizer(self, encoder, submissions):
+        """
+        Test that the count of the budget matches `LlmProvider.estimate_tokens` with the same tokenizer.
+        """
+        llm_provider = LlmProvider(
+            api_key="test_api_key", input_encoder=encoder, llm_name="test_llm_name", llm_provider_name="test_llm_provider_name", tokenizer=StubTokenizer()
+        )
+        budget = TokenBudget(1_000_000, encoder, StubTokenizer())
+        inputs = []
+        assert budget.tokens == llm_provider.estimate_tokens(inputs)
+
+        for llm_input in submissions * 2:
+            assert budget.add(llm_input)
+            inputs.append(llm_input)
+            assert budget.tokens == llm_provider.estimate_tokens(inputs)
+        assert budget.tokens != TokenBudget(1_000_000, encoder).tokens
+
+    def test_add_exceeds_max_tokens(self, encoder, submissions):
+        """
+        Test that an input that would exceed the budget is not added and does not change the estimate.
+        """
+        llm_provider = LlmProvider(api_key="test_api_key", input_encoder=encoder, llm_name="test_llm_name", llm_provider_name="test_llm_provider_name")
+        budget = TokenBudget(llm_provider.estimate_tokens(submissions[:1]) + 1, encoder)
+        assert budget.add(submissions[0])
+        tokens = budget.tokens
+        assert not budget.add(submissions[1])
+        assert budget.tokens == tokens
+        assert budget.size == 1
+
+    @pytest.mark.parametrize("tokenizer", [None, StubTokenizer()])
+    def test_is_exhausted(self, encoder, submissions, tokenizer):
+        """
+        Test that the budget is exhausted for fewer characters once inputs are added.
+        """
+        budget = TokenBudget(200, encoder, tokenizer)
+        assert not budget.is_exhausted(100)
+        assert budget.is_exhausted(1000)
+
+        def min_chars():
+            return next(chars for chars in range(1000) if budget.is_exhausted(chars))
+
+        empty_min_chars = min_chars()
+        assert budget.add(submissions[0])
+        assert min_chars() < empty_min_chars
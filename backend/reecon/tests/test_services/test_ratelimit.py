@@ -0,0 +1,146 @@
+import inspect
+from unittest.mock import (
+    Mock,
+    patch,
+)
+
+from prawcore.rate_limit import RateLimiter
+import pytest
+
+from reecon.services.ratelimit import (
+    acquire_all,
+    RedditRateLimiter,
+    TokenBucket,
+)
+
+
+class TestTokenBucket:
+    def test_acquire(self):
+        """
+        Test that tokens are available without waiting until the burst capacity is used up, after which callers wait
+        for their place in line.
+        """
+        bucket = TokenBucket("test-ratelimit", capacity=2, rate=1)
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == pytest.approx(1, abs=0.1)
+        assert bucket.acquire() == pytest.approx(2, abs=0.1)
+
+    def test_acquire_is_shared(self):
+        """
+        Test that buckets with the same key draw from the same tokens, e.g. the buckets of different worker processes.
+        """
+        TokenBucket("test-ratelimit", capacity=1, rate=1).acquire()
+        assert TokenBucket("test-ratelimit", capacity=1, rate=1).acquire() == pytest.approx(1, abs=0.1)
+        assert TokenBucket("other-ratelimit", capacity=1, rate=1).acquire() == 0
+
+    def test_calibrate(self):
+        """
+        Test that calibrating spreads the remaining requests evenly until the window resets.
+        """
+        bucket = TokenBucket("test-ratelimit", capacity=10, rate=100)
+        bucket.calibrate(remaining=5, rate=0.5)
+        for _ in range(5):
+            assert bucket.acquire() == 0
+        assert bucket.acquire() == pytest.approx(2, abs=0.1)
+
+    def test_calibrate_capacity(self):
+        """
+        Test that calibrating replaces the capacity the bucket was created with.
+        """
+        TokenBucket("test-ratelimit", capacity=1, rate=1).calibrate(remaining=3, rate=1, capacity=3)
+        bucket = TokenBucket("test-ratelimit", capacity=1, rate=1)
+        for _ in range(3):
+            assert bucket.acquire() == 0
+        assert bucket.acquire() == pytest.approx(1, abs=0.1)
+
+
+class TestAcquireAll:
+    def test_acquire_all(self):
+        """
+        Test that the wait is the longest wait of any bucket and that tokens are taken from every bucket.
+        """
+        requests = TokenBucket("test-ratelimit-requests", capacity=10, rate=1)
+        tokens = TokenBucket("test-ratelimit-tokens", capacity=100, rate=10)
+        assert acquire_all([(requests, 1), (tokens, 100)]) == 0
+        assert acquire_all([(requests, 1), (tokens, 50)]) == pytest.approx(5, abs=0.1)
+        assert requests.acquire() == 0
+
+    def test_acquire_all_with_headroom(self):
+        """
+        Test that callers that need headroom take nothing while the buckets are short, and wait behind callers that
+        reserve.
+        """
+        bucket = TokenBucket("test-ratelimit", capacity=10, rate=1)
+        assert acquire_all([(bucket, 8)], headroom=0.2) == 0
+        assert acquire_all([(bucket, 1)], headroom=0.2) == pytest.approx(1, abs=0.1)
+        assert acquire_all([(bucket, 1)], headroom=0.2) == pytest.approx(1, abs=0.1)
+        assert bucket.acquire(4) == pytest.approx(2, abs=0.1)
+        assert acquire_all([(bucket, 1)], headroom=0.2) == pytest.approx(5, abs=0.1)
+
+    def test_acquire_all_caps_cost(self):
+        """
+        Test that a cost that exceeds the capacity takes everything but the headroom instead of waiting forever.
+        """
+        bucket = TokenBucket("test-ratelimit", capacity=10, rate=1)
+        assert acquire_all([(bucket, 100)], headroom=0.2) == 0
+        assert acquire_all([(bucket, 100)], headroom=0.2) == pytest.approx(8, abs=0.1)
+
+
+def _call(rate_limiter, request_function):
+    # prawcore 2.x takes the arguments of the request positionally, later versions take them by keyword.
+    if "method" in inspect.signature(RateLimiter.call).parameters:
+        return RateLimiter.call(rate_limiter, method="GET", request_function=request_function, set_header_callback=dict, url="https://oauth.reddit.com")
+    return RateLimiter.call(rate_limiter, request_function, dict, "GET", "https://oauth.reddit.com")
+
+
+class TestRedditRateLimiter:
+    def test_call(self):
+        """
+        Test that requests wait for a token from the shared bucket and that responses calibrate it.
+        """
+        rate_limiter = RedditRateLimiter(client_id="id", window_size=600)
+        request_function = Mock(return_value=Mock(headers={"x-ratelimit-remaining": "0.0", "x-ratelimit-reset": "30", "x-ratelimit-used": "1000"}))
+        # Once no requests are remaining, the next request waits until the window resets.
+        with patch("reecon.services.ratelimit.time.sleep") as mock_sleep:
+            _call(rate_limiter, request_function)
+            mock_sleep.assert_not_called()
+            _call(rate_limiter, request_function)
+            mock_sleep.assert_called_once()
+            assert mock_sleep.call_args.args[0] == pytest.approx(30, abs=0.1)
+        assert request_function.call_count == 2
+
+    def test_call_calibrates(self):
+        """
+        Test that the response headers reach `update` with the arguments that the installed prawcore passes them with.
+        """
+        rate_limiter = RedditRateLimiter(client_id="id", window_size=600)
+        request_function = Mock(return_value=Mock(headers={"x-ratelimit-remaining": "500.0", "x-ratelimit-reset": "250", "x-ratelimit-used": "100"}))
+        with patch.object(rate_limiter.bucket, "calibrate") as mock_calibrate:
+            _call(rate_limiter, request_function)
+        mock_calibrate.assert_called_once_with(remaining=500.0, rate=2.0)
+
+    @pytest.mark.parametrize("positional", [True, False])
+    def test_update_signature(self, positional):
+        """
+        Test that `update` accepts the headers both positionally, like prawcore 2.x passes them, and by keyword, like
+        later versions pass them.
+        """
+        rate_limiter = RedditRateLimiter(client_id="id", window_size=600)
+        headers = {"x-ratelimit-remaining": "500.0", "x-ratelimit-reset": "250", "x-ratelimit-used": "100"}
+        with patch.object(rate_limiter.bucket, "calibrate") as mock_calibrate:
+            if positional:
+                rate_limiter.update(headers)
+            else:
+                rate_limiter.update(response_headers=headers)
+        mock_calibrate.assert_called_once_with(remaining=500.0, rate=2.0)
+        assert rate_limiter.remaining == 500.0
+
+    def test_update_without_ratelimit_headers(self):
+        """
+        Test that responses without rate limit headers leave the bucket as it is.
+        """
+        rate_limiter = RedditRateLimiter(client_id="id", window_size=600)
+        with patch.object(rate_limiter.bucket, "calibrate") as mock_calibrate:
+            rate_limiter.update(response_headers={})
+        mock_calibrate.assert_not_called()
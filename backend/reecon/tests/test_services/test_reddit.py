@@ -1,32 +1,45 @@
 import datetime as dt
 import sys
 from unittest.mock import (
+    AsyncMock,
+    call,
     Mock,
     patch,
     PropertyMock,
 )
 
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
 from praw.exceptions import InvalidURL
 from prawcore.exceptions import (
     Forbidden,
     NotFound,
 )
-from praw.models import MoreComments
+from praw.models import (
+    MoreComments,
+    Submission,
+)
 import pytest
 from requests.models import Response
 
+from reecon import util
+
 from reecon.exceptions import (
     UnprocessableRedditorError,
     UnprocessableThreadError,
 )
 from reecon.models import (
+    FetchedSubmission,
+    Redditor,
     RedditorContextQuery,
     RedditorData,
+    Thread,
     ThreadContextQuery,
     ThreadData,
     UnprocessableRedditor,
     UnprocessableThread,
 )
+from reecon.services.clients import get_reddit_client
 from reecon.services.reddit import (
     RedditorBase,
     RedditorContextQueryService,
@@ -56,7 +69,7 @@ def mock_llm_provider():
 
 
 @pytest.fixture
-def mock_reddit_client(django_settings):
+def mock_reddit_client(django_settings, mock_praw_comment, mock_praw_thread):
     # These are defined in the settings.py of the server app which has reecon installed.
     django_settings(
         REDDIT_API_CLIENT_ID="",
@@ -65,8 +78,19 @@ def mock_reddit_client(django_settings):
         REDDIT_API_USER_AGENT="",
     )
 
-    with patch("reecon.services.reddit.Reddit") as mock:
+    def info(fullnames):
+        # `/api/info` returns parents with the same text as the parents `mock_praw_comment` creates.
+        for fullname in fullnames:
+            if fullname.startswith("t3_"):
+                yield mock_praw_thread(fullname=fullname, selftext="Parent thread body", title="Thread title")
+            else:
+                yield mock_praw_comment(body="Parent comment body", fullname=fullname)
+
+    get_reddit_client.cache_clear()
+    with patch("reecon.services.clients.Reddit") as mock:
+        mock.return_value.info.side_effect = info
         yield mock
+    get_reddit_client.cache_clear()
 
 
 @pytest.mark.django_db
@@ -96,6 +120,220 @@ class TestRedditorBase:
         inputs = redditor_base_stub.get_inputs()
         assert inputs == [thread_submission(), comment_submission()]
 
+    def test_get_inputs_resolves_parents_from_listed_submissions(
+        self, comment_submission, mock_praw_comment, mock_praw_thread, mock_reddit_client, redditor_base_stub, thread_submission
+    ):
+        """
+        Test that parents the redditor's own threads and comments were listed for are not fetched again.
+        """
+        mock_thread = mock_praw_thread(fullname="t3_own", title="Own thread")
+        mock_comment = mock_praw_comment(body="Own comment", fullname="t1_own", parent_id="t3_own")
+        mock_reply = mock_praw_comment(body="Own reply", fullname="t1_reply", parent_id="t1_own")
+        redditor = Mock(["comments", "submissions"], created_utc=1234567890)
+        redditor.submissions.new.return_value = [mock_thread]
+        redditor.comments.new.return_value = [mock_comment, mock_reply]
+        mock_reddit_client.return_value.redditor.return_value = redditor
+
+        redditor_base_stub.env.reddit.submission.min_length = 1
+        redditor_base_stub.env.redditor.submission.min_submissions = 1
+        inputs = redditor_base_stub.get_inputs()
+        assert inputs == [
+            thread_submission(),
+            comment_submission(text="Own comment", context="Own thread | Test thread body"),
+            comment_submission(text="Own reply", context="Own comment"),
+        ]
+        mock_reddit_client.return_value.info.assert_not_called()
+        assert redditor_base_stub.parent_requests_avoided == 2
+
+    def test_get_inputs_only_fetches_new_submissions(
+        self, comment_submission, fetched_submission_cls, mock_praw_comment, mock_praw_thread, mock_reddit_client, redditor_base_stub, thread_submission
+    ):
+        """
+        Test that the listings are only consumed up to the newest stored submission, that the fetched submissions are
+        merged with and added to the stored ones, and that the listing is resumed after the oldest stored submission.
+        """
+        fetched_submission_cls(fullname="t3_stored", listing_owner="redditor", text="Stored thread", title="Stored title")
+        fetched_submission_cls(fullname="t1_stored", listing_owner="redditor", parent_id="t3_stored", text="Stored comment")
+        comments = iter(
+            [
+                mock_praw_comment(body="New comment"),
+                mock_praw_comment(body="Stored comment", fullname="t1_stored"),
+                mock_praw_comment(body="Older comment", created_utc=1234560000),
+            ]
+        )
+        redditor = Mock(["comments", "submissions"], created_utc=1234567890)
+        redditor.submissions.new.return_value = [mock_praw_thread(selftext="New thread")]
+        redditor.comments.new.side_effect = [comments, [mock_praw_comment(body="Resumed comment", created_utc=1234560000, fullname="t1_resumed")]]
+        mock_reddit_client.return_value.redditor.return_value = redditor
+
+        # The mocked submissions are authored by "redditor".
+        redditor_base_stub.identifier = "redditor"
+        redditor_base_stub.env.reddit.submission.min_length = 1
+        redditor_base_stub.env.redditor.submission.min_submissions = 1
+        inputs = redditor_base_stub.get_inputs()
+        assert inputs == [
+            thread_submission(text="New thread"),
+            thread_submission(text="Stored thread"),
+            comment_submission(text="New comment"),
+            comment_submission(text="Stored comment", context="Stored title | Stored thread"),
+            comment_submission(body="Resumed comment", created_utc=1234560000, text="Resumed comment"),
+        ]
+        # The listing was not paged past the stored comment, but resumed after it.
+        assert next(comments).body == "Older comment"
+        assert redditor.comments.new.call_args_list == [call(limit=100), call(limit=100, params={"after": "t1_stored"})]
+        assert set(FetchedSubmission.objects.values_list("text", flat=True)) == {
+            "New thread",
+            "New comment",
+            "Parent comment body",
+            "Resumed comment",
+            "Stored thread",
+            "Stored comment",
+        }
+        # Parents are stored without becoming part of the history.
+        assert set(FetchedSubmission.objects.filter(listing_owner="redditor").values_list("text", flat=True)) == {
+            "New thread",
+            "New comment",
+            "Resumed comment",
+            "Stored thread",
+            "Stored comment",
+        }
+        # The resumed submissions expire together with the rest of the history they extend.
+        resumed = FetchedSubmission.objects.get(fullname="t1_resumed")
+        assert resumed.created == FetchedSubmission.objects.get(fullname="t1_stored").created
+
+    def test_get_inputs_ignores_stored_parents(self, fetched_submission_cls, mock_praw_comment, mock_reddit_client, redditor_base_stub):
+        """
+        Test that a submission of the redditor that was stored as the parent of another comment is not mistaken for
+        their stored history, which would stop the listing before the older submissions that were never stored.
+        """
+        fetched_submission_cls(created_utc=1234567899, fullname="t1_parent", text="Parent comment body")
+        redditor = Mock(["comments", "submissions"], created_utc=1234567890)
+        redditor.submissions.new.return_value = []
+        redditor.comments.new.return_value = [mock_praw_comment(body="Test comment", created_utc=1234567890)]
+        mock_reddit_client.return_value.redditor.return_value = redditor
+
+        redditor_base_stub.identifier = "redditor"
+        redditor_base_stub.env.reddit.submission.min_length = 1
+        redditor_base_stub.env.redditor.submission.min_submissions = 1
+        inputs = redditor_base_stub.get_inputs()
+        assert [llm_input.text for llm_input in inputs] == ["Test comment"]
+        assert not FetchedSubmission.objects.get(fullname="t1_parent").listing_owner
+
+    def test_get_inputs_limited_listing_replaces_stored_history(self, fetched_submission_cls, mock_praw_comment, mock_reddit_client, redditor_base_stub):
+        """
+        Test that a listing that was cut off by its limit is not continued by the stored history, since the submissions
+        in between were never fetched, and that it replaces the stored history instead.
+        """
+        fetched_submission_cls(created_utc=1234560000, fullname="t1_stored", listing_owner="redditor", text="Stored comment")
+        redditor = Mock(["comments", "submissions"], created_utc=1234567890)
+        redditor.submissions.new.return_value = []
+        redditor.comments.new.return_value = [mock_praw_comment(body=f"Comment {i}", fullname=f"t1_new{i}") for i in range(2)]
+        mock_reddit_client.return_value.redditor.return_value = redditor
+
+        redditor_base_stub.identifier = "redditor"
+        redditor_base_stub.env.reddit.submission.min_length = 1
+        redditor_base_stub.env.redditor.listing.max_submissions = 2
+        redditor_base_stub.env.redditor.submission.min_submissions = 1
+        inputs = redditor_base_stub.get_inputs()
+        assert [llm_input.text for llm_input in inputs] == ["Comment 0", "Comment 1"]
+        assert set(FetchedSubmission.objects.values_list("fullname", flat=True)) == {"t1_new0", "t1_new1", "t1_parent", "t1_stored"}
+        assert set(FetchedSubmission.objects.filter(listing_owner="redditor").values_list("fullname", flat=True)) == {"t1_new0", "t1_new1"}
+
+    def test_get_inputs_continues_limited_listing(self, mock_praw_comment, mock_reddit_client, redditor_base_stub):
+        """
+        Test that the history stored from a listing that was cut off by its limit is continued by a later run, which only
+        fetches the submissions posted since and then resumes the listing after the oldest stored submission.
+        """
+        old_comments = [mock_praw_comment(body=f"Old comment {i}", created_utc=1234567800 - i, fullname=f"t1_old{i}") for i in range(150)]
+        redditor = Mock(["comments", "submissions"], created_utc=1234567890)
+        redditor.submissions.new.return_value = []
+        redditor.comments.new.return_value = old_comments[:100]
+        mock_reddit_client.return_value.redditor.return_value = redditor
+
+        redditor_base_stub.identifier = "redditor"
+        redditor_base_stub.env.reddit.submission.min_length = 1
+        redditor_base_stub.env.redditor.listing.max_submissions = 100
+        redditor_base_stub.env.redditor.submission.min_submissions = 1
+        redditor_base_stub.get_inputs()
+        assert FetchedSubmission.objects.filter(listing_owner="redditor").count() == 100
+
+        new_comments = [mock_praw_comment(body=f"New comment {i}", created_utc=1234567890 - i, fullname=f"t1_new{i}") for i in range(2)]
+        listing = iter(new_comments + old_comments[:98])
+        redditor.comments.new.reset_mock()
+        redditor.comments.new.return_value = None
+        redditor.comments.new.side_effect = [listing, old_comments[100:]]
+        inputs = redditor_base_stub.get_inputs()
+        assert [llm_input.text for llm_input in inputs] == [comment.body for comment in new_comments + old_comments]
+        # Only the new comments and the stored one that the listing stopped at were taken from the first page.
+        assert len(list(listing)) == 97
+        assert redditor.comments.new.call_args_list == [call(limit=100), call(limit=100, params={"after": "t1_old99"})]
+        assert redditor_base_stub.listing_pages == 2
+        assert FetchedSubmission.objects.filter(listing_owner="redditor").count() == 152
+
+    def test_get_inputs_interleaves_threads_and_comments_by_recency(
+        self, comment_submission, mock_praw_comment, mock_praw_thread, mock_reddit_client, redditor_base_stub, thread_submission
+    ):
+        """
+        Test that the redditor's threads and comments are selected newest first across both listings.
+        """
+        redditor = Mock(["comments", "submissions"], created_utc=1234567890)
+        redditor.submissions.new.return_value = [mock_praw_thread(created_utc=1234567803, selftext="Thread 3"), mock_praw_thread(created_utc=1234567801, selftext="Thread 1")]
+        redditor.comments.new.return_value = [mock_praw_comment(body="Comment 4", created_utc=1234567804), mock_praw_comment(body="Comment 2", created_utc=1234567802)]
+        mock_reddit_client.return_value.redditor.return_value = redditor
+
+        redditor_base_stub.env.reddit.submission.min_length = 1
+        redditor_base_stub.env.redditor.submission.min_submissions = 1
+        inputs = redditor_base_stub.get_inputs()
+        assert inputs == [
+            comment_submission(body="Comment 4", created_utc=1234567804, text="Comment 4"),
+            thread_submission(created_utc=1234567803, selftext="Thread 3", text="Thread 3"),
+            comment_submission(body="Comment 2", created_utc=1234567802, text="Comment 2"),
+            thread_submission(created_utc=1234567801, selftext="Thread 1", text="Thread 1"),
+        ]
+
+    def test_get_inputs_stops_fetching_when_budget_is_exhausted(self, fetched_submission_cls, mock_praw_comment, mock_reddit_client, redditor_base_stub):
+        """
+        Test that the listings are not paged any further once the token budget cannot fit a submission of the minimum
+        length, and that the stored history behind the submissions that were never fetched is kept for a later run.
+        """
+        fetched_submission_cls(created_utc=1234560000, fullname="t1_stored", listing_owner="redditor", text="Stored comment")
+        # Two of these fit in the budget, after which there is no room for another submission of the minimum length.
+        comments = iter([mock_praw_comment(body=f"Comment {i} " + "word " * 1000, fullname=f"t1_new{i}") for i in range(5)])
+        redditor = Mock(["comments", "submissions"], created_utc=1234567890)
+        redditor.submissions.new.return_value = []
+        redditor.comments.new.return_value = comments
+        mock_reddit_client.return_value.redditor.return_value = redditor
+
+        redditor_base_stub.identifier = "redditor"
+        redditor_base_stub.env.reddit.submission.max_length = sys.maxsize
+        redditor_base_stub.env.reddit.submission.min_length = 4000
+        redditor_base_stub.env.redditor.submission.min_submissions = 1
+        inputs = redditor_base_stub.get_inputs()
+        assert [llm_input.text.split(" word")[0] for llm_input in inputs] == ["Comment 0", "Comment 1"]
+        assert len(list(comments)) == 3
+        assert set(FetchedSubmission.objects.values_list("fullname", flat=True)) == {"t1_new0", "t1_new1", "t1_parent", "t1_stored"}
+        assert set(FetchedSubmission.objects.filter(listing_owner="redditor").values_list("fullname", flat=True)) == {"t1_stored"}
+
+    @pytest.mark.parametrize("max_submissions, limit, pages", [(0, None, 2), (10, 10, 4)])
+    def test_get_inputs_limits_listings(self, max_submissions, limit, pages, mock_praw_comment, mock_praw_thread, mock_reddit_client, redditor_base_stub):
+        """
+        Test that the listings are limited to `max_submissions` and that the listing pages they were requested in are
+        counted.
+        """
+        redditor = Mock(["comments", "submissions"], created_utc=1234567890)
+        redditor.submissions.new.return_value = [mock_praw_thread(selftext=f"Thread {i}") for i in range(10)]
+        redditor.comments.new.return_value = [mock_praw_comment(body=f"Comment {i}") for i in range(30)]
+        mock_reddit_client.return_value.redditor.return_value = redditor
+
+        redditor_base_stub.env.reddit.submission.min_length = 1
+        redditor_base_stub.env.redditor.listing.max_submissions = max_submissions
+        redditor_base_stub.env.redditor.submission.min_submissions = 1
+        inputs = redditor_base_stub.get_inputs()
+        assert len(inputs) == 40
+        redditor.submissions.new.assert_called_once_with(limit=limit)
+        redditor.comments.new.assert_called_once_with(limit=limit)
+        assert redditor_base_stub.listing_pages == pages
+
     def test_get_inputs_excludes_duplicate_comments_text(self, comment_submission, mock_praw_comment, mock_reddit_client, redditor_base_stub):
         """
         Test that duplicate comments are excluded when getting inputs.
@@ -325,6 +563,15 @@ class TestRedditorContextQueryService:
         assert isinstance(result, GeneratedRedditorContextQuery)
         assert result.response == raw_response.parsed.response
 
+    def test_generate_static_prompt_prefix(self, comment_submission, llm_provider_raw_response, mock_llm_provider, redditor_context_query_service_stub):
+        """
+        Test that the default context query prompt is passed as the static prefix of the prompt.
+        """
+        mock_llm_provider.return_value.generate_data.return_value = llm_provider_raw_response()
+        redditor_context_query_service_stub.generate(inputs=[comment_submission()], prompt="Test context query prompt")
+        static_prefix = mock_llm_provider.return_value.generate_data.call_args.kwargs["static_prefix"]
+        assert static_prefix == redditor_context_query_service_stub.env.redditor.llm.prompts.process_context_query
+
 
 @pytest.mark.django_db
 class TestRedditorDataService:
@@ -388,6 +635,47 @@ class TestRedditorDataService:
         assert obj.sentiment_subjectivity == raw_response.parsed.sentiment_subjectivity
         assert obj.summary == raw_response.parsed.summary
         assert obj.redditor.identifier == redditor_data_service_stub.identifier
+        assert Redditor.objects.get(username=redditor_data_service_stub.identifier).latest_data == obj
+
+    def test_create_object_stores_cached_input_tokens(self, comment_submission, llm_provider_raw_response, redditor_data_service_stub):
+        """
+        Test that the `create_object` method stores the number of input tokens that were read from the prompt cache.
+        """
+        raw_response = llm_provider_raw_response()
+        usage_metadata = {**raw_response.raw.usage_metadata, "input_token_details": {"cache_read": 64}}
+        obj = redditor_data_service_stub.create_object(
+            generated=GeneratedRedditorDataWithContext(
+                inputs=[comment_submission()],
+                prompt="Test data prompt",
+                **{**raw_response.parsed.model_dump(), "usage_metadata": usage_metadata},
+            ),
+        )
+        assert obj.request_meta.cached_input_tokens == 64
+        assert obj.request_meta.input_tokens == usage_metadata["input_tokens"]
+
+    def test_create_object_invalidates_cache(self, comment_submission, django_capture_on_commit_callbacks, llm_provider_raw_response, redditor_data_service_stub):
+        """
+        Test that the `create_object` method drops the cached representation of the redditor once the transaction commits.
+        """
+        key = util.cache.processed_redditor_key(redditor_data_service_stub.identifier)
+        cache.set(key, {"username": redditor_data_service_stub.identifier})
+        raw_response = llm_provider_raw_response()
+        with django_capture_on_commit_callbacks(execute=True):
+            redditor_data_service_stub.create_object(
+                generated=GeneratedRedditorDataWithContext(
+                    age=raw_response.parsed.age,
+                    inputs=[comment_submission()],
+                    interests=raw_response.parsed.interests,
+                    iq=raw_response.parsed.iq,
+                    prompt="Test data prompt",
+                    sentiment_polarity=raw_response.parsed.sentiment_polarity,
+                    sentiment_subjectivity=raw_response.parsed.sentiment_subjectivity,
+                    summary=raw_response.parsed.summary,
+                    usage_metadata=raw_response.raw.usage_metadata,
+                ),
+            )
+            assert cache.get(key) is not None
+        assert cache.get(key) is None
 
     def test_generate(self, ai_message, comment_submission, llm_provider_raw_response, mock_llm_provider, redditor_data_service_stub):
         """
@@ -404,6 +692,41 @@ class TestRedditorDataService:
         assert result.sentiment_subjectivity == raw_response.parsed.sentiment_subjectivity
         assert result.summary == raw_response.parsed.summary
 
+    def test_agenerate(self, comment_submission, llm_provider_raw_response, mock_llm_provider, redditor_data_service_stub):
+        """
+        Test that the `agenerate` method awaits the LLM provider and returns the same result as `generate`.
+        """
+        raw_response = llm_provider_raw_response()
+        mock_llm_provider.return_value.agenerate_data = AsyncMock(return_value=raw_response)
+        result = async_to_sync(redditor_data_service_stub.agenerate)(inputs=[comment_submission()], prompt="Test data prompt")
+        mock_llm_provider.return_value.agenerate_data.assert_awaited_once()
+        mock_llm_provider.return_value.generate_data.assert_not_called()
+        assert isinstance(result, GeneratedRedditorData)
+        assert result.summary == raw_response.parsed.summary
+
+    # The connections are cleaned up around the database writes, which would roll back the transaction of the test.
+    @pytest.mark.django_db(transaction=True)
+    def test_acreate_object(self, comment_submission, llm_provider_raw_response, redditor_data_service_stub):
+        """
+        Test that the `acreate_object` method creates a RedditorData object when awaited.
+        """
+        raw_response = llm_provider_raw_response()
+        obj = async_to_sync(redditor_data_service_stub.acreate_object)(
+            generated=GeneratedRedditorDataWithContext(
+                age=raw_response.parsed.age,
+                inputs=[comment_submission()],
+                interests=raw_response.parsed.interests,
+                iq=raw_response.parsed.iq,
+                prompt="Test data prompt",
+                sentiment_polarity=raw_response.parsed.sentiment_polarity,
+                sentiment_subjectivity=raw_response.parsed.sentiment_subjectivity,
+                summary=raw_response.parsed.summary,
+                usage_metadata=raw_response.raw.usage_metadata,
+            ),
+        )
+        assert isinstance(obj, RedditorData)
+        assert Redditor.objects.get(username=redditor_data_service_stub.identifier).latest_data == obj
+
 
 @pytest.mark.django_db
 class TestThreadBase:
@@ -431,6 +754,113 @@ class TestThreadBase:
         inputs = thread_base_stub.get_inputs()
         assert inputs == [thread_submission(text="Test submission"), comment_submission(text="Test comment")]
 
+    @pytest.mark.parametrize("threshold, parallel", [(0, False), (3, False), (2, True)])
+    def test_get_inputs_sanitizes_in_parallel(
+        self, comment_submission, mock_praw_comment, mock_praw_thread, mock_reddit_client, thread_base_stub, thread_submission, threshold, parallel
+    ):
+        """
+        Test that the comments of threads with at least `parallel_sanitize_threshold` comments are sanitized in parallel.
+        """
+        submission = mock_praw_thread(selftext="Test submission")
+        submission.comments.list.return_value = [mock_praw_comment(body="__Test__ comment"), mock_praw_comment(body="Another comment")]
+        mock_reddit_client.return_value.submission.return_value = submission
+
+        thread_base_stub.env.reddit.submission.min_length = 1
+        thread_base_stub.env.reddit.submission.parallel_sanitize_threshold = threshold
+        thread_base_stub.env.thread.submission.min_submissions = 1
+        with patch("reecon.services.reddit.util.inputs.sanitize_all", side_effect=util.inputs._sanitize_chunk) as mock_sanitize_all:
+            inputs = thread_base_stub.get_inputs()
+        assert inputs == [thread_submission(text="Test submission"), comment_submission(text="Test comment"), comment_submission(text="Another comment")]
+        assert mock_sanitize_all.called == parallel
+
+    def test_get_inputs_resolves_parents_from_comment_forest(
+        self, comment_submission, mock_praw_comment, mock_praw_thread, mock_reddit_client, thread_base_stub, thread_submission
+    ):
+        """
+        Test that parents in the loaded comment forest are resolved without network requests and that the remaining
+        parents are fetched through `/api/info` in chunks of 100.
+        """
+        submission = mock_praw_thread(fullname="t3_thread", selftext="Test submission", title="Thread title")
+        top_level_comment = mock_praw_comment(body="Top level comment", fullname="t1_top", parent_id="t3_thread")
+        reply = mock_praw_comment(body="Reply", fullname="t1_reply", parent_id="t1_top")
+        orphans = [mock_praw_comment(body=f"Orphan {i}", parent_id=f"t1_unloaded{i}") for i in range(150)]
+        submission.comments.list.return_value = [top_level_comment, reply, *orphans]
+        mock_reddit_client.return_value.submission.return_value = submission
+
+        thread_base_stub.llm.context_window = 100_000
+        thread_base_stub.env.reddit.submission.min_length = 1
+        thread_base_stub.env.thread.submission.min_submissions = 1
+        inputs = thread_base_stub.get_inputs()
+        assert inputs[:4] == [
+            thread_submission(text="Test submission"),
+            comment_submission(text="Top level comment", context="Thread title | Test submission"),
+            comment_submission(text="Reply", context="Top level comment"),
+            comment_submission(text="Orphan 0"),
+        ]
+        assert len(inputs) == 153
+
+        info = mock_reddit_client.return_value.info
+        assert [len(call.kwargs["fullnames"]) for call in info.call_args_list] == [100, 50]
+        assert thread_base_stub.parent_requests_avoided == 150
+
+    @pytest.mark.parametrize("tokenizer", [None, Mock(encode_ordinary=str.split)])
+    def test_get_inputs_budgets_comment_context(self, mock_praw_comment, mock_praw_thread, mock_reddit_client, thread_base_stub, tokenizer):
+        """
+        Test that the context of comments counts against the token budget, with or without exact token counting, so that
+        inputs that only fit without their context are dropped from the end.
+        """
+        thread_base_stub.tokenizer = thread_base_stub.llm_provider.tokenizer = tokenizer
+        submission = mock_praw_thread(fullname="t3_thread", selftext="Thread body " * 100)
+        submission.comments.list.return_value = [mock_praw_comment(body=f"Top level comment {i}", parent_id="t3_thread") for i in range(20)]
+        mock_reddit_client.return_value.submission.return_value = submission
+
+        thread_base_stub.env.reddit.submission.max_length = sys.maxsize
+        thread_base_stub.env.reddit.submission.min_length = 1
+        thread_base_stub.env.thread.submission.min_submissions = 1
+        inputs = thread_base_stub.get_inputs()
+        assert 1 < len(inputs) < 21
+        assert [llm_input.text for llm_input in inputs[1:]] == [f"Top level comment {i}" for i in range(len(inputs) - 1)]
+        assert thread_base_stub.llm_provider.estimate_tokens(inputs) < thread_base_stub.token_budget().max_tokens
+
+    def test_get_inputs_truncates_comment_context(self, comment_submission, mock_praw_comment, mock_praw_thread, mock_reddit_client, thread_base_stub):
+        """
+        Test that the context of comments is truncated to the maximum length of a submission.
+        """
+        submission = mock_praw_thread(fullname="t3_thread", selftext="Test submission", title="Thread title")
+        submission.comments.list.return_value = [mock_praw_comment(body="Top level comment", parent_id="t3_thread")]
+        mock_reddit_client.return_value.submission.return_value = submission
+
+        thread_base_stub.env.reddit.submission.max_length = 20
+        thread_base_stub.env.reddit.submission.min_length = 1
+        thread_base_stub.env.thread.submission.min_submissions = 1
+        inputs = thread_base_stub.get_inputs()
+        assert inputs[1:] == [comment_submission(text="Top level comment", context="Thread title | Test ")]
+
+    def test_get_inputs_resolves_parents_from_store(
+        self, comment_submission, fetched_submission_cls, mock_praw_comment, mock_praw_thread, mock_reddit_client, thread_base_stub
+    ):
+        """
+        Test that parents that were fetched before are read from the store instead of reddit and that parents fetched
+        from reddit are stored.
+        """
+        fetched_submission_cls(fullname="t1_stored", text="Stored parent")
+        submission = mock_praw_thread(selftext="Test submission")
+        submission.comments.list.return_value = [
+            mock_praw_comment(body="Reply to stored", parent_id="t1_stored"),
+            mock_praw_comment(body="Reply to unloaded", parent_id="t1_unloaded"),
+        ]
+        mock_reddit_client.return_value.submission.return_value = submission
+
+        thread_base_stub.env.reddit.submission.min_length = 1
+        thread_base_stub.env.thread.submission.min_submissions = 1
+        inputs = thread_base_stub.get_inputs()
+        assert inputs[1:] == [
+            comment_submission(text="Reply to stored", context="Stored parent"),
+            comment_submission(text="Reply to unloaded"),
+        ]
+        mock_reddit_client.return_value.info.assert_called_once_with(fullnames=["t1_unloaded"])
+        assert FetchedSubmission.objects.filter(fullname="t1_unloaded").exists()
+
     def test_get_inputs_excludes_duplicate_comments_text(
         self, comment_submission, mock_praw_comment, mock_praw_thread, mock_reddit_client, thread_base_stub, thread_submission
     ):
@@ -589,7 +1019,7 @@ class TestThreadBase:
         Test that if a PRAW NotFound exception is raised when looking up the thread, it is handled and raised
         as an UnprocessableThreadError.
         """
-        submission = Mock()
+        submission = Mock(__class__=Submission)
         type(submission).selftext = PropertyMock(side_effect=NotFound(Response()))
         mock_reddit_client.return_value.submission.return_value = submission
 
@@ -720,6 +1150,29 @@ class TestThreadDataService:
         assert obj.sentiment_subjectivity == raw_response.parsed.sentiment_subjectivity
         assert obj.summary == raw_response.parsed.summary
         assert obj.thread.identifier == thread_data_service_stub.identifier
+        assert Thread.objects.get(path=thread_data_service_stub.identifier).latest_data == obj
+
+    def test_create_object_invalidates_cache(self, django_capture_on_commit_callbacks, llm_provider_raw_response, thread_data_service_stub, thread_submission):
+        """
+        Test that the `create_object` method drops the cached representation of the thread once the transaction commits.
+        """
+        key = util.cache.processed_thread_key(thread_data_service_stub.identifier)
+        cache.set(key, {"path": thread_data_service_stub.identifier})
+        raw_response = llm_provider_raw_response()
+        with django_capture_on_commit_callbacks(execute=True):
+            thread_data_service_stub.create_object(
+                generated=GeneratedThreadDataWithContext(
+                    inputs=[thread_submission()],
+                    keywords=raw_response.parsed.keywords,
+                    prompt="Test data prompt",
+                    sentiment_polarity=raw_response.parsed.sentiment_polarity,
+                    sentiment_subjectivity=raw_response.parsed.sentiment_subjectivity,
+                    summary=raw_response.parsed.summary,
+                    usage_metadata=raw_response.raw.usage_metadata,
+                )
+            )
+            assert cache.get(key) is not None
+        assert cache.get(key) is None
 
     def test_generate(self, llm_provider_raw_response, mock_llm_provider, thread_data_service_stub, thread_submission):
         """
@@ -733,3 +1186,15 @@ class TestThreadDataService:
         assert result.sentiment_polarity == raw_response.parsed.sentiment_polarity
         assert result.sentiment_subjectivity == raw_response.parsed.sentiment_subjectivity
         assert result.summary == raw_response.parsed.summary
+
+    def test_agenerate(self, llm_provider_raw_response, mock_llm_provider, thread_data_service_stub, thread_submission):
+        """
+        Test that the `agenerate` method awaits the LLM provider and returns the same result as `generate`.
+        """
+        raw_response = llm_provider_raw_response()
+        mock_llm_provider.return_value.agenerate_data = AsyncMock(return_value=raw_response)
+        result = async_to_sync(thread_data_service_stub.agenerate)(inputs=[thread_submission()], prompt="Test data prompt")
+        mock_llm_provider.return_value.agenerate_data.assert_awaited_once()
+        mock_llm_provider.return_value.generate_data.assert_not_called()
+        assert isinstance(result, GeneratedThreadData)
+        assert result.summary == raw_response.parsed.summary
@@ -0,0 +1,45 @@
+from unittest.mock import Mock
+
+from django.core.cache import cache
+
+from reecon import util
+
+
+def test_get_or_set_many():
+    cache.set(util.cache.processed_redditor_key("cached"), {"username": "cached"})
+    load_func = Mock(side_effect=lambda missing: {identifier: {"username": identifier} for identifier in missing if identifier != "unknown"})
+
+    values = util.cache.get_or_set_many(
+        ["cached", "missing", "unknown"],
+        key_func=util.cache.processed_redditor_key,
+        load_func=load_func,
+        timeout=60,
+    )
+    assert values == {"cached": {"username": "cached"}, "missing": {"username": "missing"}}
+    load_func.assert_called_once_with(["missing", "unknown"])
+    assert cache.get(util.cache.processed_redditor_key("missing")) == {"username": "missing"}
+    assert cache.get(util.cache.processed_redditor_key("unknown")) is None
+
+
+def test_get_or_set_many_all_cached():
+    cache.set(util.cache.processed_thread_key("/r/test/comments/1"), {"path": "/r/test/comments/1"})
+    load_func = Mock()
+
+    values = util.cache.get_or_set_many(
+        ["/r/test/comments/1"],
+        key_func=util.cache.processed_thread_key,
+        load_func=load_func,
+        timeout=60,
+    )
+    assert values == {"/r/test/comments/1": {"path": "/r/test/comments/1"}}
+    load_func.assert_not_called()
+
+
+def test_context_query_key():
+    key = util.cache.context_query_key("redditor", data_id=1, env_id="env", llm_id=2, prompt="Is this   a bot?")
+    assert key.startswith("context-query:redditor:2:")
+    assert key == util.cache.context_query_key("redditor", data_id=1, env_id="env", llm_id=2, prompt=" is this a BOT? ")
+    assert key != util.cache.context_query_key("redditor", data_id=1, env_id="env", llm_id=2, prompt="Is this a human?")
+    assert key != util.cache.context_query_key("redditor", data_id=3, env_id="env", llm_id=2, prompt="Is this a bot?")
+    assert key != util.cache.context_query_key("redditor", data_id=1, env_id="other-env", llm_id=2, prompt="Is this a bot?")
+    assert key != util.cache.context_query_key("redditor", data_id=1, env_id="env", llm_id=3, prompt="Is this a bot?")
@@ -0,0 +1,28 @@
+from unittest.mock import (
+    Mock,
+    call,
+    patch,
+)
+
+from asgiref.sync import async_to_sync
+import pytest
+
+from reecon import util
+
+
+@pytest.mark.parametrize("thread_sensitive", [True, False])
+def test_database_sync_to_async(thread_sensitive):
+    manager = Mock()
+    manager.func.return_value = "result"
+    with patch("reecon.util.db.close_old_connections", manager.close_old_connections):
+        result = async_to_sync(util.db.database_sync_to_async(manager.func, thread_sensitive=thread_sensitive))("arg", kwarg="kwarg")
+    assert result == "result"
+    assert manager.mock_calls == [call.close_old_connections(), call.func("arg", kwarg="kwarg"), call.close_old_connections()]
+
+
+def test_database_sync_to_async_error():
+    manager = Mock()
+    manager.func.side_effect = ValueError("error")
+    with patch("reecon.util.db.close_old_connections", manager.close_old_connections), pytest.raises(ValueError):
+        async_to_sync(util.db.database_sync_to_async(manager.func))()
+    assert manager.mock_calls == [call.close_old_connections(), call.func(), call.close_old_connections()]
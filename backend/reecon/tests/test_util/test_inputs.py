@@ -1,3 +1,9 @@
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import (
+    Mock,
+    patch,
+)
+
 import pytest
 
 
@@ -19,3 +25,56 @@ from reecon import util
 )
 def test_sanitize(s, max_length, min_length, expected):
     assert util.inputs.sanitize(s, max_length=max_length, min_length=min_length) == expected
+
+
+def test_sanitize_too_short_is_not_parsed():
+    """
+    Test that text that is shorter than `min_length` before it is stripped is not parsed.
+    """
+    util.inputs.sanitize.cache_clear()
+    with patch("reecon.util.inputs.markdown.strip") as mock_strip:
+        assert util.inputs.sanitize("**Short**", max_length=50, min_length=10) == ""
+    mock_strip.assert_not_called()
+
+
+def test_sanitize_too_short_with_tabs_is_parsed():
+    """
+    Test that text that can become longer when it is stripped is parsed regardless of its length.
+    """
+    util.inputs.sanitize.cache_clear()
+    assert util.inputs.sanitize("a\tb\tc\td", max_length=50, min_length=8) == "a   b   c   d"
+
+
+def test_sanitize_is_memoized():
+    util.inputs.sanitize.cache_clear()
+    with patch("reecon.util.inputs.markdown.strip", return_value="This is a test string.") as mock_strip:
+        for _ in range(2):
+            assert util.inputs.sanitize("This is a test string.", max_length=50, min_length=5) == "This is a test string."
+    mock_strip.assert_called_once()
+    util.inputs.sanitize.cache_clear()
+
+
+def test_sanitize_all():
+    """
+    Test that texts sanitized on the pool are the same and in the same order as when sanitized one at a time.
+    """
+    texts = [f"__Comment__ number {i}" if i % 3 else "> Blockquote" for i in range(util.inputs.SANITIZE_CHUNK_SIZE + 10)]
+    expected = [util.inputs.sanitize(s, max_length=50, min_length=5) for s in texts]
+    assert util.inputs.sanitize_all(texts, max_length=50, min_length=5) == expected
+
+
+def test_sanitize_all_if_pool_is_broken():
+    """
+    Test that the texts are sanitized serially if a process of the pool died, and that the broken pool is replaced by
+    the next call.
+    """
+    texts = [f"__Comment__ number {i}" for i in range(util.inputs.SANITIZE_CHUNK_SIZE + 10)]
+    expected = [util.inputs.sanitize(s, max_length=50, min_length=5) for s in texts]
+    broken_executor = Mock(**{"map.side_effect": BrokenProcessPool("A child process terminated abruptly")})
+    with patch("reecon.util.inputs._executor", broken_executor):
+        assert util.inputs.sanitize_all(texts, max_length=50, min_length=5) == expected
+        broken_executor.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+        assert util.inputs._executor is None
+        assert util.inputs.sanitize_all(texts, max_length=50, min_length=5) == expected
+        assert util.inputs._executor not in (None, broken_executor)
+        util.inputs._executor.shutdown()
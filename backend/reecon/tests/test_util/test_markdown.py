@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
 from reecon import util
@@ -22,3 +24,48 @@ from reecon import util
 )
 def test_strip(md, expected):
     assert util.markdown.strip(md) == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "plain text",
+        "  leading and trailing whitespace  ",
+        "first paragraph\n\nsecond paragraph",
+        "first paragraph \n \n   second paragraph with a trailing space \n\n\n",
+        "a line\ncontinued on the next line\n  indented less than a code block",
+        "numbers like 3.5 and 10) are not lists",
+        "unicode \xa0whitespace\x0c and émojis 😀",
+    ],
+)
+def test_strip_without_syntax(text):
+    """
+    Test that text without Markdown syntax is stripped the same way as if it was parsed.
+    """
+    assert not util.markdown.has_syntax(text)
+    assert util.markdown.strip(text) == util.markdown._converter().reset().convert(text)
+
+
+@pytest.mark.parametrize("text", ["*a*", "a\n    code", "1. item", "a  \nb", "- item", "a\n# heading", "tab\tseparated", "<b>html</b>", "a &amp; b"])
+def test_has_syntax(text):
+    assert util.markdown.has_syntax(text)
+
+
+def test_converter_per_thread():
+    """
+    Test that every thread reuses a converter of its own.
+    """
+    converter = util.markdown._converter()
+    assert util.markdown._converter() is converter
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(util.markdown._converter).result() is not converter
+
+
+def test_strip_resets_converter():
+    """
+    Test that reference links defined in one text do not apply to the next one.
+    """
+    assert util.markdown.strip("[link][ref]\n\n[ref]: https://redditinc.com") == "link"
+    assert util.markdown.strip("[link][ref]") == "[link][ref]"
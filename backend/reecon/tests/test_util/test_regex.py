@@ -1,8 +1,17 @@
+import random
+import re
+
 import pytest
 
 from reecon import util
 
 
+# `match_block_quotes` before its quantifiers were made possessive.
+BACKTRACKING_MATCH_BLOCK_QUOTES = re.compile(r"(^\s{0,3}>\s?.*(\n(?!\n|\s{4}).*)*)", re.MULTILINE)
+# The pieces that random texts are made of. They cover every character class the pattern distinguishes.
+FRAGMENTS = ["a", "text", " ", "  ", "    ", "\n", "\n\n", ">", "> ", ">>", "\t", "\r", "\x0c", "\xa0", "\x85", "\u2028"]
+
+
 @pytest.mark.parametrize(
     "s, expected",
     [
@@ -20,3 +29,14 @@ from reecon import util
 )
 def test_match_block_quotes(s, expected):
     assert util.regex.match_block_quotes.sub("", s) == expected
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_match_block_quotes_matches_backtracking_pattern(seed):
+    """
+    Test that random texts have the same block quotes removed as with the pattern before it was made possessive.
+    """
+    rng = random.Random(seed)
+    for _ in range(500):
+        s = "".join(rng.choices(FRAGMENTS, k=rng.randint(0, 30)))
+        assert util.regex.match_block_quotes.sub("", s) == BACKTRACKING_MATCH_BLOCK_QUOTES.sub("", s)
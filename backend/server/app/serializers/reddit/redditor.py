@@ -42,6 +42,10 @@ class RedditorContextQueryCreateRequestSerializer(serializers.Serializer):
 
 class RedditorContextQueryCreateResponseSerializer(serializers.Serializer):
     job_id = serializers.CharField()
+    success = RedditorContextQuerySerializer(
+        default=None,
+        read_only=True,
+    )
 
 
 RedditorContextQueryListResponseSerializer = RedditorContextQuerySerializer
@@ -41,6 +41,10 @@ class ThreadContextQueryCreateRequestSerializer(serializers.Serializer):
 
 class ThreadContextQueryCreateResponseSerializer(serializers.Serializer):
     job_id = serializers.CharField()
+    success = ThreadContextQuerySerializer(
+        default=None,
+        read_only=True,
+    )
 
 
 ThreadContextQueryListResponseSerializer = ThreadContextQuerySerializer
@@ -1,7 +1,13 @@
 import logging
+from typing import (
+    Iterable,
+    Set,
+)
 
 import rq.exceptions
 from constance import config
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
 import django_rq
 from drf_spectacular.utils import (
@@ -13,11 +19,16 @@ from rest_framework import status
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
-from rq.job import Job
+from rq import Queue
+from rq.job import (
+    Job,
+    JobStatus,
+)
 
 from reecon import (
     models,
     schemas,
+    util,
 )
 
 from .... import serializers
@@ -33,6 +44,81 @@ __all__ = (
 
 log = logging.getLogger("app.views.api.v1.reddit")
 
+IN_FLIGHT_JOB_STATUSES = (
+    JobStatus.DEFERRED,
+    JobStatus.QUEUED,
+    JobStatus.SCHEDULED,
+    JobStatus.STARTED,
+)
+
+
+def _get_cached_context_query(
+    model: type[models.RedditorContextQuery | models.ThreadContextQuery],
+    identifier: str,
+    *,
+    data_id: int | None,
+    env_id: str,
+    llm_id: int,
+    prompt: str,
+    submitter: models.AppUser,
+) -> models.RedditorContextQuery | models.ThreadContextQuery | None:
+    """
+    Returns the answer to the same context query if it was answered since the redditor or thread was last processed.
+    The worker caches the results of context queries until the redditor or thread becomes stale.
+
+    The cached result may belong to another user, so the answer is returned as a context query of the submitter, which
+    reuses the response and the costs of the cached result. That way the users who asked before are not disclosed, and
+    the answer is listed among the context queries of the submitter.
+    """
+    if data_id is None:
+        return None
+    pk = cache.get(util.cache.context_query_key(identifier, data_id=data_id, env_id=env_id, llm_id=llm_id, prompt=prompt))
+    if pk is None or (cached := model.objects.select_related("context", "request_meta__llm").filter(pk=pk).first()) is None:
+        return None
+    with transaction.atomic():
+        return model.objects.create(
+            context=cached.context,
+            prompt=prompt,
+            request_meta=models.RequestMetadata.objects.create(
+                cached_input_tokens=cached.request_meta.cached_input_tokens,
+                contributor=submitter,
+                input_tokens=cached.request_meta.input_tokens,
+                llm=cached.request_meta.llm,
+                output_tokens=cached.request_meta.output_tokens,
+                submitter=submitter,
+                total_inputs=cached.request_meta.total_inputs,
+                total_tokens=cached.request_meta.total_tokens,
+            ),
+            response=cached.response,
+        )
+
+
+def _get_in_flight_job_ids(job_queue: Queue, job_ids: Iterable[str]) -> Set[str]:
+    """
+    Only the candidate jobs are fetched, in a single pipeline, so the cost of this does not grow with the size of the
+    queue. Finished and failed jobs are kept around for their result TTL and must not prevent reprocessing.
+    """
+    jobs = Job.fetch_many(list(job_ids), connection=job_queue.connection, serializer=job_queue.serializer)
+    return {job.id for job in jobs if job is not None and job.get_status(refresh=False) in IN_FLIGHT_JOB_STATUSES}
+
+
+def _get_deferred_identifiers(kind: models.LlmBatchRequest.Kind, identifiers: Iterable[str]) -> Set[str]:
+    """
+    The job of a redditor or thread whose LLM request was deferred to a batch finishes before the batch completes, so
+    the identifiers with a pending or submitted batch request are in flight as well. The batch requests are deleted
+    once their batch completes.
+    """
+    return set(models.LlmBatchRequest.objects.filter(identifier__in=list(identifiers), kind=kind).values_list("identifier", flat=True))
+
+
+def _get_thread_job_id(thread_path: str) -> str:
+    path_parts = thread_path.split("/")
+    subreddit, thread_id = path_parts[2], path_parts[4]
+
+    # Using the full thread URL as the job id causes the job to get enqueued but never executed.
+    # Maybe it's because of the length of the job id or symbols that are in the URL?
+    return f"thread-{subreddit}-{thread_id}"
+
 
 class RedditorContextQueryViewSet(GenericViewSet):
     lookup_url_kwarg = "job_id"
@@ -52,35 +138,51 @@ class RedditorContextQueryViewSet(GenericViewSet):
 
         log.debug("Received %s: %s", username, prompt)
 
+        cached = None
+        job_id = ""
+
         if config.REDDITOR_CONTEXT_QUERY_PROCESSING_ENABLED:
-            env = schemas.get_worker_env()
-            env.redditor.llm.prompts.process_context_query = prompt
-
-            # Do not explicitly set a job id because context-query jobs should have unique IDs.
-            # Multiple users could submit a context query for the same redditor, but each query
-            # will create a new job.
-            job_queue = django_rq.get_queue("high")
-            job = job_queue.enqueue(
-                "app.worker.process_redditor_context_query",  # this function is defined in the worker app
-                kwargs={
-                    "redditor_username": username,
-                    "contributor": request.user,
-                    "context_query_llm": models.LLM.objects.get(name=llm_name),
-                    "data_llm": models.LLM.objects.get(name=config.LLM_NAME),
-                    "llm_providers_settings": llm_providers_settings,
-                    "submitter": request.user,
-                    "env": env,
-                },
+            env_id = schemas.save_worker_env(schemas.get_worker_env())
+            context_query_llm_id = models.LLM.objects.values_list("pk", flat=True).get(name=llm_name)
+            cached = _get_cached_context_query(
+                models.RedditorContextQuery,
+                username,
+                data_id=models.Redditor.objects.filter(username=username).values_list("latest_data_id", flat=True).first(),
+                env_id=env_id,
+                llm_id=context_query_llm_id,
+                prompt=prompt,
+                submitter=request.user,
             )
 
-            job_id = job.id
+            if cached is None:
+                # Do not explicitly set a job id because context-query jobs should have unique IDs.
+                # Multiple users could submit a context query for the same redditor, but each query
+                # that was not answered recently will create a new job.
+                job_queue = django_rq.get_queue("high")
+                job = job_queue.enqueue(
+                    "app.worker.process_redditor_context_query",  # this function is defined in the worker app
+                    kwargs={
+                        "redditor_username": username,
+                        "contributor_id": request.user.pk,
+                        "context_query_llm_id": context_query_llm_id,
+                        "data_llm_id": models.LLM.objects.values_list("pk", flat=True).get(name=config.LLM_NAME),
+                        "llm_providers_settings": llm_providers_settings.model_dump(),
+                        "prompt": prompt,
+                        "submitter_id": request.user.pk,
+                        "env_id": env_id,
+                    },
+                )
+
+                job_id = job.id
+            else:
+                log.debug("Returning the cached result of the context query for %s", username)
         else:
-            job_id = ""
             log.debug("Redditor context query processing is disabled")
 
         response_serializer = serializers.RedditorContextQueryCreateResponseSerializer(
             instance={
                 "job_id": job_id,
+                "success": cached,
             }
         )
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
@@ -132,36 +234,39 @@ class RedditorDataViewSet(GenericViewSet):
         usernames = set(submit_serializer.validated_data["usernames"])
         log.debug("Received %s", usernames)
 
+        # Look up the state of every submitted username in a single query. The returned entries are serialized in the
+        # response without being queried again.
+        classification = models.Redditor.objects.classify(usernames, stale_before=timezone.now() - config.REDDITOR_FRESHNESS_TD)
+
         # Redditors that are already in the database.
-        known_redditors = self.get_queryset().filter(username__in=usernames)
-        known_usernames = set(known_redditors.values_list("username", flat=True))
+        known_redditors = classification.fresh + classification.stale
+        known_usernames = {redditor.username for redditor in known_redditors}
 
         # Usernames of redditors in the database that were inserted recently and not considered stale yet.
-        fresh_usernames = set(
-            known_redditors.exclude(last_processed__lt=timezone.now() - config.REDDITOR_FRESHNESS_TD).values_list(
-                "username",
-                flat=True,
-            )
-        )
+        fresh_usernames = {redditor.username for redditor in classification.fresh}
 
-        unprocessable_redditors = models.UnprocessableRedditor.objects.filter(username__in=usernames)
-        unprocessable_usernames = set(unprocessable_redditors.values_list("username", flat=True))
+        unprocessable_redditors = classification.unprocessable
+        unprocessable_usernames = {redditor.username for redditor in unprocessable_redditors}
 
-        ignored_redditors = models.IgnoredRedditor.objects.filter(username__in=usernames)
-        ignored_usernames = set(ignored_redditors.values_list("username", flat=True))
+        ignored_redditors = classification.ignored
+        ignored_usernames = {redditor.username for redditor in ignored_redditors}
 
         # This should only contain unprocessed usernames and 'stale' entries that need to be reprocessed.
         pending_usernames = usernames - fresh_usernames - unprocessable_usernames - ignored_usernames
         pending_redditors = []
 
         if config.REDDITOR_DATA_PROCESSING_ENABLED:
-            llm = models.LLM.objects.get(name=config.LLM_NAME)
-            env = schemas.get_worker_env()
+            llm_id = models.LLM.objects.values_list("pk", flat=True).get(name=config.LLM_NAME)
+            llm_providers_settings_data = llm_providers_settings.model_dump()
+            env_id = schemas.save_worker_env(schemas.get_worker_env())
 
             job_queue = django_rq.get_queue("default")
-            existing_job_ids = set(job_queue.get_job_ids())
+            job_ids = {redditor_username: f"redditor-{redditor_username}" for redditor_username in pending_usernames}
+            in_flight_job_ids = _get_in_flight_job_ids(job_queue, job_ids.values())
+            deferred_usernames = _get_deferred_identifiers(models.LlmBatchRequest.Kind.REDDITOR, job_ids.keys())
+            jobs_data = []
 
-            for redditor_username in pending_usernames:
+            for redditor_username, job_id in job_ids.items():
                 # If this is a stale entry that is being reprocessed, we do not want it to be included in the pending list.
                 # The old entry will still be returned in the response under the 'processed' key, but the username will be
                 # enqueued so that it can be reprocessed. I think it is better UX that the user who triggered this request
@@ -170,22 +275,27 @@ class RedditorDataViewSet(GenericViewSet):
                 if redditor_username not in known_usernames:
                     pending_redditors.append({"username": redditor_username})
 
-                job_id = f"redditor-{redditor_username}"
-                if job_id not in existing_job_ids:
-                    job_queue.enqueue(
-                        "app.worker.process_redditor_data",  # this function is defined in the worker app
-                        kwargs={
-                            "redditor_username": redditor_username,
-                            "contributor": request.user,
-                            "llm": llm,
-                            "llm_providers_settings": llm_providers_settings,
-                            "submitter": request.user,
-                            "env": env,
-                        },
-                        job_id=job_id,
+                if job_id not in in_flight_job_ids and redditor_username not in deferred_usernames:
+                    jobs_data.append(
+                        Queue.prepare_data(
+                            "app.worker.process_redditor_data",  # this function is defined in the worker app
+                            kwargs={
+                                "redditor_username": redditor_username,
+                                "contributor_id": request.user.pk,
+                                "llm_id": llm_id,
+                                "llm_providers_settings": llm_providers_settings_data,
+                                "submitter_id": request.user.pk,
+                                "env_id": env_id,
+                            },
+                            job_id=job_id,
+                        )
                     )
                 else:
                     log.debug("Not enqueuing duplicate job for %s", redditor_username)
+
+            if jobs_data:
+                # Push all jobs to redis in a single pipeline.
+                job_queue.enqueue_many(jobs_data)
         else:
             log.debug("Redditor data processing is disabled")
 
@@ -218,35 +328,51 @@ class ThreadContextQueryViewSet(GenericViewSet):
 
         log.debug("Received %s: %s", thread_path, prompt)
 
+        cached = None
+        job_id = ""
+
         if config.THREAD_CONTEXT_QUERY_PROCESSING_ENABLED:
-            env = schemas.get_worker_env()
-            env.thread.llm.prompts.process_context_query = prompt
-
-            # Do not explicitly set a job id because context-query jobs should have unique IDs.
-            # Multiple users could submit a context query for the same thread, but each query
-            # will create a new job.
-            job_queue = django_rq.get_queue("high")
-            job = job_queue.enqueue(
-                "app.worker.process_thread_context_query",  # this function is defined in the worker app
-                kwargs={
-                    "thread_path": thread_path,
-                    "contributor": request.user,
-                    "context_query_llm": models.LLM.objects.get(name=llm_name),
-                    "data_llm": models.LLM.objects.get(name=config.LLM_NAME),
-                    "llm_providers_settings": llm_providers_settings,
-                    "submitter": request.user,
-                    "env": env,
-                },
+            env_id = schemas.save_worker_env(schemas.get_worker_env())
+            context_query_llm_id = models.LLM.objects.values_list("pk", flat=True).get(name=llm_name)
+            cached = _get_cached_context_query(
+                models.ThreadContextQuery,
+                thread_path,
+                data_id=models.Thread.objects.filter(path=thread_path).values_list("latest_data_id", flat=True).first(),
+                env_id=env_id,
+                llm_id=context_query_llm_id,
+                prompt=prompt,
+                submitter=request.user,
             )
 
-            job_id = job.id
+            if cached is None:
+                # Do not explicitly set a job id because context-query jobs should have unique IDs.
+                # Multiple users could submit a context query for the same thread, but each query
+                # that was not answered recently will create a new job.
+                job_queue = django_rq.get_queue("high")
+                job = job_queue.enqueue(
+                    "app.worker.process_thread_context_query",  # this function is defined in the worker app
+                    kwargs={
+                        "thread_path": thread_path,
+                        "contributor_id": request.user.pk,
+                        "context_query_llm_id": context_query_llm_id,
+                        "data_llm_id": models.LLM.objects.values_list("pk", flat=True).get(name=config.LLM_NAME),
+                        "llm_providers_settings": llm_providers_settings.model_dump(),
+                        "prompt": prompt,
+                        "submitter_id": request.user.pk,
+                        "env_id": env_id,
+                    },
+                )
+
+                job_id = job.id
+            else:
+                log.debug("Returning the cached result of the context query for %s", thread_path)
         else:
-            job_id = ""
             log.debug("Thread context query processing is disabled")
 
         response_serializer = serializers.ThreadContextQueryCreateResponseSerializer(
             instance={
                 "job_id": job_id,
+                "success": cached,
             }
         )
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
@@ -298,33 +424,36 @@ class ThreadDataViewSet(GenericViewSet):
         thread_paths = set(submit_serializer.validated_data["paths"])
         log.debug("Received %s", thread_paths)
 
+        # Look up the state of every submitted path in a single query. The returned entries are serialized in the
+        # response without being queried again.
+        classification = models.Thread.objects.classify(thread_paths, stale_before=timezone.now() - config.THREAD_FRESHNESS_TD)
+
         # Threads that are already in the database.
-        known_threads = self.get_queryset().filter(path__in=thread_paths)
-        known_paths = set(known_threads.values_list("path", flat=True))
+        known_threads = classification.fresh + classification.stale
+        known_paths = {thread.path for thread in known_threads}
 
         # URL paths of threads in the database that were inserted recently and not considered stale yet.
-        fresh_paths = set(
-            known_threads.exclude(last_processed__lt=timezone.now() - config.THREAD_FRESHNESS_TD).values_list(
-                "path",
-                flat=True,
-            )
-        )
+        fresh_paths = {thread.path for thread in classification.fresh}
 
-        unprocessable_threads = models.UnprocessableThread.objects.filter(path__in=thread_paths)
-        unprocessable_paths = set(unprocessable_threads.values_list("path", flat=True))
+        unprocessable_threads = classification.unprocessable
+        unprocessable_paths = {thread.path for thread in unprocessable_threads}
 
         # This should only contain unprocessed paths and 'stale' entries that need to be reprocessed.
         pending_paths = thread_paths - fresh_paths - unprocessable_paths
         pending_threads = []
 
         if config.THREAD_DATA_PROCESSING_ENABLED:
-            llm = models.LLM.objects.get(name=config.LLM_NAME)
-            env = schemas.get_worker_env()
+            llm_id = models.LLM.objects.values_list("pk", flat=True).get(name=config.LLM_NAME)
+            llm_providers_settings_data = llm_providers_settings.model_dump()
+            env_id = schemas.save_worker_env(schemas.get_worker_env())
 
             job_queue = django_rq.get_queue("default")
-            existing_job_ids = set(job_queue.get_job_ids())
+            job_ids = {thread_path: _get_thread_job_id(thread_path) for thread_path in pending_paths}
+            in_flight_job_ids = _get_in_flight_job_ids(job_queue, job_ids.values())
+            deferred_paths = _get_deferred_identifiers(models.LlmBatchRequest.Kind.THREAD, job_ids.keys())
+            jobs_data = []
 
-            for thread_path in pending_paths:
+            for thread_path, job_id in job_ids.items():
                 # If this is a stale entry that is being reprocessed, we do not want it to be included in the pending list.
                 # The old entry will still be returned in the response under the 'processed' key, but the path will be
                 # enqueued so that it can be reprocessed. I think it is better UX that the user who triggered this request
@@ -333,28 +462,27 @@ class ThreadDataViewSet(GenericViewSet):
                 if thread_path not in known_paths:
                     pending_threads.append({"path": thread_path})
 
-                path_parts = thread_path.split("/")
-                subreddit, thread_id = path_parts[2], path_parts[4]
-
-                # Using the full thread URL as the job id causes the job to get enqueued but never executed.
-                # Maybe it's because of the length of the job id or symbols that are in the URL?
-
-                job_id = f"thread-{subreddit}-{thread_id}"
-                if job_id not in existing_job_ids:
-                    job_queue.enqueue(
-                        "app.worker.process_thread_data",  # this function is defined in the worker app
-                        kwargs={
-                            "thread_path": thread_path,
-                            "contributor": request.user,
-                            "llm": llm,
-                            "llm_providers_settings": llm_providers_settings,
-                            "submitter": request.user,
-                            "env": env,
-                        },
-                        job_id=job_id,
+                if job_id not in in_flight_job_ids and thread_path not in deferred_paths:
+                    jobs_data.append(
+                        Queue.prepare_data(
+                            "app.worker.process_thread_data",  # this function is defined in the worker app
+                            kwargs={
+                                "thread_path": thread_path,
+                                "contributor_id": request.user.pk,
+                                "llm_id": llm_id,
+                                "llm_providers_settings": llm_providers_settings_data,
+                                "submitter_id": request.user.pk,
+                                "env_id": env_id,
+                            },
+                            job_id=job_id,
+                        )
                     )
                 else:
                     log.debug("Not enqueuing duplicate job for %s", thread_path)
+
+            if jobs_data:
+                # Push all jobs to redis in a single pipeline.
+                job_queue.enqueue_many(jobs_data)
         else:
             log.debug("Thread data processing is disabled")
 
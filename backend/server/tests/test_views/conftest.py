@@ -1,4 +1,5 @@
 import pytest
+from django.core.cache import cache
 from django.utils import timezone
 from rest_framework.test import APIClient
 
@@ -39,6 +40,14 @@ def auth_client(api_client, user_stub):
     yield api_client
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Fixture to clear the cache so that cached representations do not leak between tests.
+    """
+    cache.clear()
+
+
 @pytest.fixture
 def ignored_redditor_cls():
     def func(*, reason, username):
@@ -176,7 +185,7 @@ def redditor_context_query_stub(redditor_context_query_cls, redditor_data_stub,
 @pytest.fixture
 def redditor_data_cls():
     def func(*, age, interests, iq, redditor, request_meta, sentiment_polarity, sentiment_subjectivity, summary):
-        return RedditorData.objects.create(
+        redditor_data = RedditorData.objects.create(
             age=age,
             interests=interests,
             iq=iq,
@@ -186,6 +195,9 @@ def redditor_data_cls():
             sentiment_subjectivity=sentiment_subjectivity,
             summary=summary,
         )
+        redditor.latest_data = redditor_data
+        redditor.save(update_fields=["latest_data"])
+        return redditor_data
 
     return func
 
@@ -311,7 +323,7 @@ def thread_context_query_stub(thread_context_query_cls, thread_data_stub, reques
 @pytest.fixture
 def thread_data_cls():
     def func(*, keywords, request_meta, sentiment_polarity, sentiment_subjectivity, summary, thread):
-        return ThreadData.objects.create(
+        thread_data = ThreadData.objects.create(
             keywords=keywords,
             request_meta=request_meta,
             sentiment_polarity=sentiment_polarity,
@@ -319,6 +331,9 @@ def thread_data_cls():
             summary=summary,
             thread=thread,
         )
+        thread.latest_data = thread_data
+        thread.save(update_fields=["latest_data"])
+        return thread_data
 
     return func
 
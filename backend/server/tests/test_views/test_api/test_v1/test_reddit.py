@@ -1,15 +1,26 @@
+import django_rq
 import pytest
 from constance import config
 from constance.test import override_config
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status
 import rq.exceptions
+from rq.job import JobStatus
 from unittest.mock import (
     Mock,
     patch,
 )
 
+from reecon import (
+    models,
+    schemas,
+    util,
+)
+
 
 @pytest.fixture(autouse=True)
 def mock_openai_client():
@@ -21,13 +32,21 @@ def mock_openai_client():
 
 
 @pytest.fixture
-def mock_queue():
+def mock_job_fetch_many():
+    """
+    Mock fetching RQ jobs by id. By default, none of the fetched jobs exist.
+    """
+    with patch("rq.job.Job.fetch_many", side_effect=lambda job_ids, **kwargs: [None] * len(job_ids)) as fetch_many_mock:
+        yield fetch_many_mock
+
+
+@pytest.fixture
+def mock_queue(mock_job_fetch_many):
     """
     Mock RQ job queue to prevent actual job creation.
     """
     with patch("django_rq.get_queue") as get_queue_mock:
         queue = Mock()
-        queue.get_job_ids.return_value = []
         queue.enqueue.return_value = Mock(id="test-job-id")
         get_queue_mock.return_value = queue
         yield queue
@@ -135,7 +154,117 @@ class TestRedditorContextQueryViewSet:
             },
         )
         assert response.status_code == status.HTTP_201_CREATED
-        assert response.json() == {"job_id": ""}
+        assert response.json() == {"job_id": "", "success": None}
+
+    def test_create_with_cached_result(self, auth_client, create_url_path, llm_stub, mock_queue, redditor_context_query_processing_enabled, redditor_context_query_stub):
+        """
+        Test that a context query that was answered since the redditor was last processed is returned without enqueuing a job,
+        even if the prompt differs in whitespace or case.
+        """
+        redditor = redditor_context_query_stub.context
+        key = util.cache.context_query_key(
+            redditor.identifier,
+            data_id=redditor.latest_data_id,
+            env_id=schemas.save_worker_env(schemas.get_worker_env()),
+            llm_id=llm_stub.pk,
+            prompt=redditor_context_query_stub.prompt,
+        )
+        cache.set(key, redditor_context_query_stub.pk)
+
+        response = auth_client.post(
+            path=create_url_path,
+            data={
+                "llm_name": llm_stub.name,
+                "llm_providers_settings": {
+                    "openai": {"api_key": "test-key"},
+                },
+                "username": redditor.identifier,
+                "prompt": f"  {redditor_context_query_stub.prompt.upper()} ",
+            },
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        data = response.json()
+        assert data["job_id"] == ""
+        assert data["success"]["response"] == redditor_context_query_stub.response
+        mock_queue.enqueue.assert_not_called()
+
+    def test_create_with_result_cached_for_another_user(
+        self, api_client, create_url_path, list_url_path, llm_stub, mock_queue, redditor_context_query_processing_enabled, redditor_context_query_stub, user_cls
+    ):
+        """
+        Test that a cached context query that was submitted by another user is returned as a context query of the user, which
+        does not disclose the other user and is listed among the context queries of the user.
+        """
+        redditor = redditor_context_query_stub.context
+        key = util.cache.context_query_key(
+            redditor.identifier,
+            data_id=redditor.latest_data_id,
+            env_id=schemas.save_worker_env(schemas.get_worker_env()),
+            llm_id=llm_stub.pk,
+            prompt=redditor_context_query_stub.prompt,
+        )
+        cache.set(key, redditor_context_query_stub.pk)
+
+        api_client.force_authenticate(user=user_cls(username="other-user", password="password"))
+        response = api_client.post(
+            path=create_url_path,
+            data={
+                "llm_name": llm_stub.name,
+                "llm_providers_settings": {
+                    "openai": {"api_key": "test-key"},
+                },
+                "username": redditor.identifier,
+                "prompt": redditor_context_query_stub.prompt,
+            },
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        data = response.json()
+        assert data["job_id"] == ""
+        assert data["success"]["response"] == redditor_context_query_stub.response
+        assert data["success"]["request_meta"]["contributor"] == {"username": "other-user"}
+        assert data["success"]["request_meta"]["submitter"] == {"username": "other-user"}
+        assert data["success"]["request_meta"]["total_tokens"] == redditor_context_query_stub.request_meta.total_tokens
+        mock_queue.enqueue.assert_not_called()
+
+        response = api_client.get(list_url_path)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == [data["success"]]
+
+        api_client.force_authenticate(user=redditor_context_query_stub.request_meta.submitter)
+        response = api_client.get(list_url_path)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) == 1
+
+    def test_create_after_reprocessing(self, auth_client, create_url_path, llm_stub, mock_queue, redditor_context_query_processing_enabled, redditor_context_query_stub):
+        """
+        Test that a cached context query is not returned once the redditor has been reprocessed.
+        """
+        redditor = redditor_context_query_stub.context
+        key = util.cache.context_query_key(
+            redditor.identifier,
+            data_id=redditor.latest_data_id - 1,
+            env_id=schemas.save_worker_env(schemas.get_worker_env()),
+            llm_id=llm_stub.pk,
+            prompt=redditor_context_query_stub.prompt,
+        )
+        cache.set(key, redditor_context_query_stub.pk)
+
+        response = auth_client.post(
+            path=create_url_path,
+            data={
+                "llm_name": llm_stub.name,
+                "llm_providers_settings": {
+                    "openai": {"api_key": "test-key"},
+                },
+                "username": redditor.identifier,
+                "prompt": redditor_context_query_stub.prompt,
+            },
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        data = response.json()
+        assert data["job_id"] == "test-job-id"
+        assert data["success"] is None
+        mock_queue.enqueue.assert_called_once()
 
     def test_create_if_unauthenticated(self, api_client, create_url_path, llm_stub, redditor_stub):
         """
@@ -229,6 +358,7 @@ class TestRedditorContextQueryViewSet:
             "submitter": {
                 "username": redditor_context_query_stub.request_meta.submitter.username,
             },
+            "cached_input_tokens": redditor_context_query_stub.request_meta.cached_input_tokens,
             "input_tokens": redditor_context_query_stub.request_meta.input_tokens,
             "output_tokens": redditor_context_query_stub.request_meta.output_tokens,
             "total_tokens": redditor_context_query_stub.request_meta.total_tokens,
@@ -318,12 +448,12 @@ class TestRedditorDataViewSet:
         with override_config(REDDITOR_DATA_PROCESSING_ENABLED=True):
             yield
 
-    def test_create_if_duplicate_job(self, auth_client, create_url_path, mock_queue, redditor_data_processing_enabled):
+    def test_create_if_duplicate_job(self, auth_client, create_url_path, mock_job_fetch_many, mock_queue, redditor_data_processing_enabled):
         """
         Test that no jobs are created when a duplicate job is detected.
         """
         username = "unprocessed-redditor"
-        mock_queue.get_job_ids.return_value = [f"redditor-{username}"]
+        mock_job_fetch_many.side_effect = lambda job_ids, **kwargs: [Mock(id=job_id, get_status=Mock(return_value=JobStatus.QUEUED)) for job_id in job_ids]
 
         response = auth_client.post(
             path=create_url_path,
@@ -338,13 +468,98 @@ class TestRedditorDataViewSet:
         assert response.status_code == status.HTTP_201_CREATED
 
         response_data = response.json()
-        mock_queue.enqueue.assert_not_called()
+        mock_queue.enqueue_many.assert_not_called()
         assert len(response_data["ignored"]) == 0
         assert len(response_data["processed"]) == 0
         assert len(response_data["pending"]) == 1
         assert len(response_data["unprocessable"]) == 0
         assert response_data["pending"][0] == {"username": username}
 
+    def test_create_if_finished_job(self, auth_client, create_url_path, mock_job_fetch_many, mock_queue, redditor_data_processing_enabled):
+        """
+        Test that a job is created again when the previous job for the username already finished.
+        """
+        username = "unprocessed-redditor"
+        mock_job_fetch_many.side_effect = lambda job_ids, **kwargs: [Mock(id=job_id, get_status=Mock(return_value=JobStatus.FINISHED)) for job_id in job_ids]
+
+        response = auth_client.post(
+            path=create_url_path,
+            data={
+                "usernames": [username],
+                "llm_providers_settings": {
+                    "openai": {"api_key": "test-key"},
+                },
+            },
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        mock_queue.enqueue_many.assert_called_once()
+        (job_data,) = mock_queue.enqueue_many.call_args[0][0]
+        assert job_data.job_id == f"redditor-{username}"
+
+    def test_create_if_deferred_to_batch(self, auth_client, create_url_path, llm_stub, mock_job_fetch_many, mock_queue, redditor_data_processing_enabled, user_stub):
+        """
+        Test that no job is created for a username whose LLM request was deferred to a batch that has not completed yet,
+        even though the job that deferred it already finished.
+        """
+        usernames = ["deferred-redditor", "unprocessed-redditor"]
+        models.LlmBatchRequest.objects.create(
+            api_key_hash="hash",
+            contributor=user_stub,
+            env_id="env",
+            identifier=usernames[0],
+            inputs=[],
+            kind=models.LlmBatchRequest.Kind.REDDITOR,
+            llm=llm_stub,
+            prompt="prompt",
+            submitter=user_stub,
+        )
+        mock_job_fetch_many.side_effect = lambda job_ids, **kwargs: [Mock(id=job_id, get_status=Mock(return_value=JobStatus.FINISHED)) for job_id in job_ids]
+
+        response = auth_client.post(
+            path=create_url_path,
+            data={
+                "usernames": usernames,
+                "llm_providers_settings": {
+                    "openai": {"api_key": "test-key"},
+                },
+            },
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert sorted(response.json()["pending"], key=lambda pending: pending["username"]) == [{"username": username} for username in usernames]
+        (job_data,) = mock_queue.enqueue_many.call_args[0][0]
+        assert job_data.job_id == f"redditor-{usernames[1]}"
+
+    def test_create_enqueues_jobs_in_one_call(self, auth_client, create_url_path, redditor_data_processing_enabled):
+        """
+        Test that jobs for all pending usernames are enqueued together and that submitting them again while the jobs
+        are queued does not create duplicates.
+        """
+        usernames = [f"unprocessed-redditor-{i}" for i in range(5)]
+        job_queue = django_rq.get_queue("default")
+        job_queue.empty()
+
+        def post():
+            return auth_client.post(
+                path=create_url_path,
+                data={
+                    "usernames": usernames,
+                    "llm_providers_settings": {
+                        "openai": {"api_key": "test-key"},
+                    },
+                },
+            )
+
+        try:
+            with patch.object(job_queue, "enqueue_many", wraps=job_queue.enqueue_many) as enqueue_many_mock, patch("django_rq.get_queue", return_value=job_queue):
+                assert post().status_code == status.HTTP_201_CREATED
+                assert post().status_code == status.HTTP_201_CREATED
+            enqueue_many_mock.assert_called_once()
+            assert sorted(job_queue.get_job_ids()) == sorted(f"redditor-{username}" for username in usernames)
+        finally:
+            job_queue.empty()
+
     def test_create_if_processing_disabled(self, auth_client, create_url_path, mock_queue, redditor_data_processing_disabled):
         """
         Test submitting usernames when Redditor data processing is disabled.
@@ -362,7 +577,7 @@ class TestRedditorDataViewSet:
         assert response.status_code == status.HTTP_201_CREATED
 
         response_data = response.json()
-        mock_queue.enqueue.assert_not_called()
+        mock_queue.enqueue_many.assert_not_called()
         assert len(response_data["ignored"]) == 0
         assert len(response_data["processed"]) == 0
         assert len(response_data["pending"]) == 0
@@ -404,7 +619,7 @@ class TestRedditorDataViewSet:
         assert response.status_code == status.HTTP_201_CREATED
 
         response_data = response.json()
-        mock_queue.enqueue.assert_not_called()
+        mock_queue.enqueue_many.assert_not_called()
         assert len(response_data["ignored"]) == 0
         assert len(response_data["processed"]) == 1
         assert len(response_data["pending"]) == 0
@@ -418,6 +633,7 @@ class TestRedditorDataViewSet:
                 "iq": redditor_data.iq,
                 "request_meta": {
                     "contributor": {"username": request_meta.contributor.username},
+                    "cached_input_tokens": request_meta.cached_input_tokens,
                     "input_tokens": request_meta.input_tokens,
                     "llm": {
                         "context_window": request_meta.llm.context_window,
@@ -444,6 +660,58 @@ class TestRedditorDataViewSet:
             "username": redditor.username,
         }
 
+    def test_create_with_fresh_usernames_uses_fixed_number_of_queries(self, auth_client, create_url_path, mock_queue, redditor_cls, redditor_data_processing_enabled):
+        """
+        Test that the number of queries made when serializing processed redditors does not grow with the number of usernames.
+        """
+        # The worker env snapshot is stored by the first request, which would add to its queries.
+        schemas.save_worker_env(schemas.get_worker_env())
+        usernames = [redditor_cls(username=f"fresh_redditor_{i}", with_data=True).username for i in range(5)]
+
+        def count_queries(submitted_usernames):
+            with CaptureQueriesContext(connection) as context:
+                response = auth_client.post(
+                    path=create_url_path,
+                    data={
+                        "usernames": submitted_usernames,
+                        "llm_providers_settings": {
+                            "openai": {"api_key": "test-key"},
+                        },
+                    },
+                )
+            assert response.status_code == status.HTTP_201_CREATED
+            assert len(response.json()["processed"]) == len(submitted_usernames)
+            return len(context.captured_queries)
+
+        assert count_queries(usernames[:1]) == count_queries(usernames)
+
+    def test_create_with_fresh_usernames_served_from_cache(self, auth_client, create_url_path, mock_queue, redditor_cls, redditor_data_processing_enabled):
+        """
+        Test that processed redditors are served from the cache once they have been serialized.
+        """
+        # The worker env snapshot is stored by the first request, which would add to its queries.
+        schemas.save_worker_env(schemas.get_worker_env())
+        usernames = [redditor_cls(username=f"fresh_redditor_{i}", with_data=True).username for i in range(5)]
+
+        def post():
+            with CaptureQueriesContext(connection) as context:
+                response = auth_client.post(
+                    path=create_url_path,
+                    data={
+                        "usernames": usernames,
+                        "llm_providers_settings": {
+                            "openai": {"api_key": "test-key"},
+                        },
+                    },
+                )
+            assert response.status_code == status.HTTP_201_CREATED
+            return response.json()["processed"], len(context.captured_queries)
+
+        uncached, uncached_queries = post()
+        cached, cached_queries = post()
+        assert cached == uncached
+        assert cached_queries == uncached_queries - 1
+
     def test_create_with_ignored_username(self, auth_client, create_url_path, ignored_redditor_stub, mock_queue, redditor_data_processing_enabled):
         """
         Test submitting an ignored username for processing.
@@ -461,7 +729,7 @@ class TestRedditorDataViewSet:
         assert response.status_code == status.HTTP_201_CREATED
 
         response_data = response.json()
-        mock_queue.enqueue.assert_not_called()
+        mock_queue.enqueue_many.assert_not_called()
         assert len(response_data["ignored"]) == 1
         assert len(response_data["processed"]) == 0
         assert len(response_data["pending"]) == 0
@@ -474,7 +742,7 @@ class TestRedditorDataViewSet:
             "username": ignored_redditor_stub.username,
         }
 
-    def test_create_with_stale_username(self, auth_client, create_url_path, mock_queue, redditor_cls, redditor_data_processing_enabled):
+    def test_create_with_stale_username(self, auth_client, create_url_path, llm_stub, mock_queue, redditor_cls, redditor_data_processing_enabled, user_stub):
         """
         Test submitting a stale username for Redditor data processing. A stale username is one that was processed a long time ago
         and should be reprocessed.
@@ -493,10 +761,14 @@ class TestRedditorDataViewSet:
         assert response.status_code == status.HTTP_201_CREATED
 
         # Verify the job was queued for the pending username resulting from the stale redditor
-        mock_queue.enqueue.assert_called_once()
-        kwargs = mock_queue.enqueue.call_args[1]["kwargs"]
+        mock_queue.enqueue_many.assert_called_once()
+        (job_data,) = mock_queue.enqueue_many.call_args[0][0]
+        kwargs = job_data.kwargs
         response_data = response.json()
         assert kwargs["redditor_username"] == stale_redditor.username
+        assert kwargs["contributor_id"] == kwargs["submitter_id"] == user_stub.pk
+        assert kwargs["llm_id"] == llm_stub.pk
+        assert schemas.load_worker_env(kwargs["env_id"]) == schemas.get_worker_env()
         assert len(response_data["ignored"]) == 0
         assert len(response_data["processed"]) == 1
         assert len(response_data["pending"]) == 0
@@ -519,7 +791,7 @@ class TestRedditorDataViewSet:
         assert response.status_code == status.HTTP_201_CREATED
 
         response_data = response.json()
-        mock_queue.enqueue.assert_not_called()
+        mock_queue.enqueue_many.assert_not_called()
         assert len(response_data["ignored"]) == 0
         assert len(response_data["processed"]) == 0
         assert len(response_data["pending"]) == 0
@@ -624,7 +896,117 @@ class TestThreadContextQueryViewSet:
             },
         )
         assert response.status_code == status.HTTP_201_CREATED
-        assert response.json() == {"job_id": ""}
+        assert response.json() == {"job_id": "", "success": None}
+
+    def test_create_with_cached_result(self, auth_client, create_url_path, llm_stub, mock_queue, thread_context_query_processing_enabled, thread_context_query_stub):
+        """
+        Test that a context query that was answered since the thread was last processed is returned without enqueuing a job,
+        even if the prompt differs in whitespace or case.
+        """
+        thread = thread_context_query_stub.context
+        key = util.cache.context_query_key(
+            thread.identifier,
+            data_id=thread.latest_data_id,
+            env_id=schemas.save_worker_env(schemas.get_worker_env()),
+            llm_id=llm_stub.pk,
+            prompt=thread_context_query_stub.prompt,
+        )
+        cache.set(key, thread_context_query_stub.pk)
+
+        response = auth_client.post(
+            path=create_url_path,
+            data={
+                "llm_name": llm_stub.name,
+                "llm_providers_settings": {
+                    "openai": {"api_key": "test-key"},
+                },
+                "path": thread.identifier,
+                "prompt": f"  {thread_context_query_stub.prompt.upper()} ",
+            },
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        data = response.json()
+        assert data["job_id"] == ""
+        assert data["success"]["response"] == thread_context_query_stub.response
+        mock_queue.enqueue.assert_not_called()
+
+    def test_create_with_result_cached_for_another_user(
+        self, api_client, create_url_path, list_url_path, llm_stub, mock_queue, thread_context_query_processing_enabled, thread_context_query_stub, user_cls
+    ):
+        """
+        Test that a cached context query that was submitted by another user is returned as a context query of the user, which
+        does not disclose the other user and is listed among the context queries of the user.
+        """
+        thread = thread_context_query_stub.context
+        key = util.cache.context_query_key(
+            thread.identifier,
+            data_id=thread.latest_data_id,
+            env_id=schemas.save_worker_env(schemas.get_worker_env()),
+            llm_id=llm_stub.pk,
+            prompt=thread_context_query_stub.prompt,
+        )
+        cache.set(key, thread_context_query_stub.pk)
+
+        api_client.force_authenticate(user=user_cls(username="other-user", password="password"))
+        response = api_client.post(
+            path=create_url_path,
+            data={
+                "llm_name": llm_stub.name,
+                "llm_providers_settings": {
+                    "openai": {"api_key": "test-key"},
+                },
+                "path": thread.identifier,
+                "prompt": thread_context_query_stub.prompt,
+            },
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        data = response.json()
+        assert data["job_id"] == ""
+        assert data["success"]["response"] == thread_context_query_stub.response
+        assert data["success"]["request_meta"]["contributor"] == {"username": "other-user"}
+        assert data["success"]["request_meta"]["submitter"] == {"username": "other-user"}
+        assert data["success"]["request_meta"]["total_tokens"] == thread_context_query_stub.request_meta.total_tokens
+        mock_queue.enqueue.assert_not_called()
+
+        response = api_client.get(list_url_path)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == [data["success"]]
+
+        api_client.force_authenticate(user=thread_context_query_stub.request_meta.submitter)
+        response = api_client.get(list_url_path)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) == 1
+
+    def test_create_after_reprocessing(self, auth_client, create_url_path, llm_stub, mock_queue, thread_context_query_processing_enabled, thread_context_query_stub):
+        """
+        Test that a cached context query is not returned once the thread has been reprocessed.
+        """
+        thread = thread_context_query_stub.context
+        key = util.cache.context_query_key(
+            thread.identifier,
+            data_id=thread.latest_data_id - 1,
+            env_id=schemas.save_worker_env(schemas.get_worker_env()),
+            llm_id=llm_stub.pk,
+            prompt=thread_context_query_stub.prompt,
+        )
+        cache.set(key, thread_context_query_stub.pk)
+
+        response = auth_client.post(
+            path=create_url_path,
+            data={
+                "llm_name": llm_stub.name,
+                "llm_providers_settings": {
+                    "openai": {"api_key": "test-key"},
+                },
+                "path": thread.identifier,
+                "prompt": thread_context_query_stub.prompt,
+            },
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        data = response.json()
+        assert data["job_id"] == "test-job-id"
+        assert data["success"] is None
+        mock_queue.enqueue.assert_called_once()
 
     def test_create_if_unauthenticated(self, api_client, create_url_path, llm_stub, thread_stub):
         """
@@ -718,6 +1100,7 @@ class TestThreadContextQueryViewSet:
             "submitter": {
                 "username": thread_context_query_stub.request_meta.submitter.username,
             },
+            "cached_input_tokens": thread_context_query_stub.request_meta.cached_input_tokens,
             "input_tokens": thread_context_query_stub.request_meta.input_tokens,
             "output_tokens": thread_context_query_stub.request_meta.output_tokens,
             "total_tokens": thread_context_query_stub.request_meta.total_tokens,
@@ -806,14 +1189,14 @@ class TestThreadDataViewSet:
         with override_config(THREAD_DATA_PROCESSING_ENABLED=True):
             yield
 
-    def test_create_if_duplicate_job(self, auth_client, create_url_path, mock_queue, thread_data_processing_enabled):
+    def test_create_if_duplicate_job(self, auth_client, create_url_path, mock_job_fetch_many, mock_queue, thread_data_processing_enabled):
         """
         Test that no jobs are created when a duplicate job is detected.
         """
         subreddit = "test"
         thread_id = "unprocessedthread"
         thread_path = f"/r/{subreddit}/comments/{thread_id}"
-        mock_queue.get_job_ids.return_value = [f"thread-{subreddit}-{thread_id}"]
+        mock_job_fetch_many.side_effect = lambda job_ids, **kwargs: [Mock(id=job_id, get_status=Mock(return_value=JobStatus.QUEUED)) for job_id in job_ids]
 
         response = auth_client.post(
             path=create_url_path,
@@ -828,12 +1211,46 @@ class TestThreadDataViewSet:
         assert response.status_code == status.HTTP_201_CREATED
 
         response_data = response.json()
-        mock_queue.enqueue.assert_not_called()
+        mock_queue.enqueue_many.assert_not_called()
         assert len(response_data["processed"]) == 0
         assert len(response_data["pending"]) == 1
         assert len(response_data["unprocessable"]) == 0
         assert response_data["pending"][0] == {"path": thread_path}
 
+    def test_create_if_deferred_to_batch(self, auth_client, create_url_path, llm_stub, mock_job_fetch_many, mock_queue, thread_data_processing_enabled, user_stub):
+        """
+        Test that no job is created for a thread whose LLM request was deferred to a batch that has not completed yet,
+        even though the job that deferred it already finished.
+        """
+        thread_paths = ["/r/test/comments/deferredthread", "/r/test/comments/unprocessedthread"]
+        models.LlmBatchRequest.objects.create(
+            api_key_hash="hash",
+            contributor=user_stub,
+            env_id="env",
+            identifier=thread_paths[0],
+            inputs=[],
+            kind=models.LlmBatchRequest.Kind.THREAD,
+            llm=llm_stub,
+            prompt="prompt",
+            submitter=user_stub,
+        )
+        mock_job_fetch_many.side_effect = lambda job_ids, **kwargs: [Mock(id=job_id, get_status=Mock(return_value=JobStatus.FINISHED)) for job_id in job_ids]
+
+        response = auth_client.post(
+            path=create_url_path,
+            data={
+                "paths": thread_paths,
+                "llm_providers_settings": {
+                    "openai": {"api_key": "test-key"},
+                },
+            },
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert sorted(response.json()["pending"], key=lambda pending: pending["path"]) == [{"path": thread_path} for thread_path in thread_paths]
+        (job_data,) = mock_queue.enqueue_many.call_args[0][0]
+        assert job_data.job_id == "thread-test-unprocessedthread"
+
     def test_create_if_processing_disabled(self, auth_client, create_url_path, mock_queue, thread_data_processing_disabled):
         """
         Test submitting paths when Thread data processing is disabled.
@@ -851,7 +1268,7 @@ class TestThreadDataViewSet:
         assert response.status_code == status.HTTP_201_CREATED
 
         response_data = response.json()
-        mock_queue.enqueue.assert_not_called()
+        mock_queue.enqueue_many.assert_not_called()
         assert len(response_data["processed"]) == 0
         assert len(response_data["pending"]) == 0
         assert len(response_data["unprocessable"]) == 0
@@ -892,7 +1309,7 @@ class TestThreadDataViewSet:
         assert response.status_code == status.HTTP_201_CREATED
 
         response_data = response.json()
-        mock_queue.enqueue.assert_not_called()
+        mock_queue.enqueue_many.assert_not_called()
         assert len(response_data["processed"]) == 1
         assert len(response_data["pending"]) == 0
         assert len(response_data["unprocessable"]) == 0
@@ -903,6 +1320,7 @@ class TestThreadDataViewSet:
                 "keywords": thread_data.keywords,
                 "request_meta": {
                     "contributor": {"username": request_meta.contributor.username},
+                    "cached_input_tokens": request_meta.cached_input_tokens,
                     "input_tokens": request_meta.input_tokens,
                     "llm": {
                         "context_window": request_meta.llm.context_window,
@@ -929,7 +1347,59 @@ class TestThreadDataViewSet:
             "source": thread.source,
         }
 
-    def test_create_with_stale_path(self, auth_client, create_url_path, mock_queue, thread_cls, thread_data_processing_enabled):
+    def test_create_with_fresh_paths_uses_fixed_number_of_queries(self, auth_client, create_url_path, mock_queue, thread_cls, thread_data_processing_enabled):
+        """
+        Test that the number of queries made when serializing processed threads does not grow with the number of paths.
+        """
+        # The worker env snapshot is stored by the first request, which would add to its queries.
+        schemas.save_worker_env(schemas.get_worker_env())
+        paths = [thread_cls(path=f"/r/test/comments/fresh{i}", with_data=True).path for i in range(5)]
+
+        def count_queries(submitted_paths):
+            with CaptureQueriesContext(connection) as context:
+                response = auth_client.post(
+                    path=create_url_path,
+                    data={
+                        "paths": submitted_paths,
+                        "llm_providers_settings": {
+                            "openai": {"api_key": "test-key"},
+                        },
+                    },
+                )
+            assert response.status_code == status.HTTP_201_CREATED
+            assert len(response.json()["processed"]) == len(submitted_paths)
+            return len(context.captured_queries)
+
+        assert count_queries(paths[:1]) == count_queries(paths)
+
+    def test_create_with_fresh_paths_served_from_cache(self, auth_client, create_url_path, mock_queue, thread_cls, thread_data_processing_enabled):
+        """
+        Test that processed threads are served from the cache once they have been serialized.
+        """
+        # The worker env snapshot is stored by the first request, which would add to its queries.
+        schemas.save_worker_env(schemas.get_worker_env())
+        paths = [thread_cls(path=f"/r/test/comments/fresh{i}", with_data=True).path for i in range(5)]
+
+        def post():
+            with CaptureQueriesContext(connection) as context:
+                response = auth_client.post(
+                    path=create_url_path,
+                    data={
+                        "paths": paths,
+                        "llm_providers_settings": {
+                            "openai": {"api_key": "test-key"},
+                        },
+                    },
+                )
+            assert response.status_code == status.HTTP_201_CREATED
+            return response.json()["processed"], len(context.captured_queries)
+
+        uncached, uncached_queries = post()
+        cached, cached_queries = post()
+        assert cached == uncached
+        assert cached_queries == uncached_queries - 1
+
+    def test_create_with_stale_path(self, auth_client, create_url_path, llm_stub, mock_queue, thread_cls, thread_data_processing_enabled, user_stub):
         """
         Test submitting a stale path for Thread data processing. A stale path is one that was processed a long time ago
         and should be reprocessed.
@@ -947,10 +1417,14 @@ class TestThreadDataViewSet:
 
         assert response.status_code == status.HTTP_201_CREATED
 
-        mock_queue.enqueue.assert_called_once()
-        kwargs = mock_queue.enqueue.call_args[1]["kwargs"]
+        mock_queue.enqueue_many.assert_called_once()
+        (job_data,) = mock_queue.enqueue_many.call_args[0][0]
+        kwargs = job_data.kwargs
         response_data = response.json()
         assert kwargs["thread_path"] == stale_thread.path
+        assert kwargs["contributor_id"] == kwargs["submitter_id"] == user_stub.pk
+        assert kwargs["llm_id"] == llm_stub.pk
+        assert schemas.load_worker_env(kwargs["env_id"]) == schemas.get_worker_env()
         assert len(response_data["processed"]) == 1
         assert len(response_data["pending"]) == 0
         assert len(response_data["unprocessable"]) == 0
@@ -972,7 +1446,7 @@ class TestThreadDataViewSet:
         assert response.status_code == status.HTTP_201_CREATED
 
         response_data = response.json()
-        mock_queue.enqueue.assert_not_called()
+        mock_queue.enqueue_many.assert_not_called()
         assert len(response_data["processed"]) == 0
         assert len(response_data["pending"]) == 0
         assert len(response_data["unprocessable"]) == 1
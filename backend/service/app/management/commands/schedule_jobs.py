@@ -21,6 +21,13 @@ def register_scheduled_jobs():
     # Cannot have scheduled jobs start immediately because the database may not be ready immediately.
     start_time = timezone.now() + timedelta(seconds=10)
 
+    scheduler.schedule(
+        scheduled_time=start_time,
+        func="app.scheduled_jobs.delete_fetched_submissions",
+        interval=24 * 60 * 60,  # every day
+        repeat=None,
+    )
+
     scheduler.schedule(
         scheduled_time=start_time,
         func="app.scheduled_jobs.delete_unprocessable_redditors",
@@ -35,6 +42,20 @@ def register_scheduled_jobs():
         repeat=None,
     )
 
+    scheduler.schedule(
+        scheduled_time=start_time,
+        func="app.scheduled_jobs.poll_llm_batches",
+        interval=5 * 60,  # every 5 minutes
+        repeat=None,
+    )
+
+    scheduler.schedule(
+        scheduled_time=start_time,
+        func="app.scheduled_jobs.submit_llm_batches",
+        interval=5 * 60,  # every 5 minutes
+        repeat=None,
+    )
+
 
 class Command(rqscheduler.Command):
     def handle(self, *args, **kwargs):
@@ -0,0 +1,208 @@
+import asyncio
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+import sys
+import threading
+import traceback
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from reecon import (
+    services,
+    util,
+)
+from rq.executions import Execution
+from rq.job import (
+    Job,
+    JobStatus,
+)
+from rq.queue import Queue
+from rq.timeouts import JobTimeoutException
+from rq.utils import now
+from rq.worker import (
+    SimpleWorker,
+    WorkerStatus,
+)
+
+from .worker import (
+    ASYNC_JOBS,
+    job_timeout,
+)
+
+
+__all__ = ("AsyncWorker",)
+
+
+def _check_timed_out(execute, sql, params, many, context):
+    # A job that timed out keeps running in the background if it was in a thread at the time. It must not write to the
+    # database anymore, because its failure has already been recorded.
+    if (timeout := job_timeout.get()) is not None and timeout.expired():
+        raise JobTimeoutException("The job has timed out")
+    return execute(sql, params, many, context)
+
+
+def _install_check_timed_out(sender, connection, **kwargs):
+    if _check_timed_out not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_check_timed_out)
+
+
+connection_created.connect(_install_check_timed_out, dispatch_uid="app.async_worker.check_timed_out")
+
+
+class AsyncWorker(SimpleWorker):
+    """
+    Runs jobs concurrently on an event loop in a background thread instead of one job at a time. Processing jobs spend
+    almost all of their time waiting on reddit and the LLM providers, so a single process can keep up to
+    `ASYNC_WORKER_MAX_JOBS` jobs in flight. Jobs in `app.worker.ASYNC_JOBS` run as coroutines. Any other job runs in a
+    thread of the loop's executor.
+
+    The rq bookkeeping is not concurrency safe because it tracks the current execution on the worker, so it is done
+    for one job at a time while holding `_bookkeeping_lock`.
+
+    The heartbeats of the jobs in flight are refreshed every `job_monitoring_interval` seconds, because a job may run for
+    longer than its timeout while it waits for an upstream slot. Otherwise, it would be considered abandoned and failed
+    while it is still running.
+
+    Timeouts, including the ones of the success and failure callbacks, stop the worker from waiting for a job instead of
+    interrupting it. The database queries of a job that has timed out fail, so that it does not write its outcome after
+    the job was marked as failed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._bookkeeping_lock = threading.Lock()
+        self._executions: dict[str, tuple[Job, Execution]] = {}
+        self._in_flight: set[Future] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._slots = threading.BoundedSemaphore(settings.ASYNC_WORKER_MAX_JOBS)
+
+    def _start_loop(self) -> asyncio.AbstractEventLoop:
+        # The loop is started lazily, because rq also instantiates workers to inspect them, e.g. `Worker.all()`.
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._loop.set_default_executor(ThreadPoolExecutor(max_workers=settings.ASYNC_WORKER_THREADS, thread_name_prefix=self.name))
+            threading.Thread(target=self._loop.run_forever, daemon=True, name=f"{self.name}-loop").start()
+            self._loop.call_soon_threadsafe(self._loop.call_later, self.job_monitoring_interval, self._maintain_heartbeats_periodically)
+        return self._loop
+
+    def execute_job(self, job: Job, queue: Queue):
+        loop = self._start_loop()
+
+        # Only dequeue the next job once there is room for it, sending heartbeats while waiting so that neither the worker
+        # nor the jobs in flight are considered dead.
+        while not self._slots.acquire(timeout=self.job_monitoring_interval):
+            self._maintain_heartbeats()
+
+        with self._bookkeeping_lock:
+            execution = self.prepare_execution(job)
+            self.prepare_job_execution(job, remove_from_intermediate_queue=len(self.queues) == 1)
+            job.started_at = now()
+            self._executions[job.id] = (job, execution)
+
+        future = asyncio.run_coroutine_threadsafe(self._perform_job(job, queue, execution), loop)
+        self._in_flight.add(future)
+        future.add_done_callback(self._job_done)
+
+    def _maintain_heartbeats_periodically(self):
+        # This runs on the loop rather than in its executor, whose threads may all be busy with jobs.
+        try:
+            self._maintain_heartbeats()
+        finally:
+            self._loop.call_later(self.job_monitoring_interval, self._maintain_heartbeats_periodically)
+
+    def _maintain_heartbeats(self):
+        ttl = self.job_monitoring_interval + 60
+        with self._bookkeeping_lock, self.connection.pipeline() as pipeline:
+            self.heartbeat(ttl, pipeline=pipeline)
+            job_heartbeats = {}
+            for job, execution in self._executions.values():
+                execution.heartbeat(job.started_job_registry, ttl, pipeline=pipeline)
+                job_heartbeats[len(pipeline)] = job
+                job.heartbeat(now(), ttl, pipeline=pipeline, xx=True)
+            results = pipeline.execute()
+            # A job that was deleted in the meantime is recreated by its heartbeat, like in `Worker.maintain_heartbeats`.
+            if deleted := [job.key for index, job in job_heartbeats.items() if results[index] == 1]:
+                self.connection.delete(*deleted)
+
+    def _job_done(self, future: Future):
+        self._in_flight.discard(future)
+        self._slots.release()
+
+    async def _perform_job(self, job: Job, queue: Queue, execution: Execution):
+        timeout = job.timeout or self.queue_class.DEFAULT_TIMEOUT
+        try:
+            try:
+                return_value = await self._run(job, None if timeout == -1 else timeout)
+            except TimeoutError as e:
+                raise JobTimeoutException(f"Task exceeded maximum timeout value ({timeout} seconds)") from e
+            await self._execute_callback(job.success_callback, job.success_callback_timeout, job, job.connection, return_value)
+        except Exception:
+            exc_info = sys.exc_info()
+            try:
+                await self._execute_callback(job.failure_callback, job.failure_callback_timeout, job, job.connection, *exc_info)
+            except Exception:
+                self.log.exception("Job %s: error while executing failure callback", job.id)
+                exc_info = sys.exc_info()
+            await asyncio.to_thread(self._handle_failure, job, queue, execution, exc_info)
+        else:
+            await asyncio.to_thread(self._handle_success, job, queue, execution, return_value)
+
+    async def _run(self, job: Job, timeout: int | None):
+        await asyncio.to_thread(job.connection.persist, job.key)
+        async with asyncio.timeout(timeout) as deadline:
+            # The timeout is paused while the job waits for an upstream slot, see `app.worker._upstream_limit`. The threads
+            # that the job starts inherit it, so that they can tell whether the job has timed out.
+            token = job_timeout.set(deadline)
+            try:
+                if coroutine_function := ASYNC_JOBS.get(job.func_name):
+                    # Each job runs in a task of its own, so the priority only applies to the requests of this job.
+                    with services.llm_provider.priority(job.origin):
+                        return await coroutine_function(*job.args, **job.kwargs)
+                # The threads of the executor outlive the jobs, so their connections are cleaned up around each job.
+                return await util.db.database_sync_to_async(job.perform, thread_sensitive=False)()
+            finally:
+                job_timeout.reset(token)
+
+    @staticmethod
+    async def _execute_callback(callback, timeout: int, *args):
+        if callback is not None:
+            try:
+                await asyncio.wait_for(asyncio.to_thread(callback, *args), timeout=timeout)
+            except TimeoutError as e:
+                raise JobTimeoutException(f"Callback exceeded maximum timeout value ({timeout} seconds)") from e
+
+    def _handle_success(self, job: Job, queue: Queue, execution: Execution, return_value):
+        with self._bookkeeping_lock:
+            del self._executions[job.id]
+            self.execution = execution
+            self.handle_execution_ended(job, queue, job.success_callback_timeout)
+            job._result = return_value
+            job._status = JobStatus.FINISHED
+            self.handle_job_success(job=job, queue=queue, started_job_registry=queue.started_job_registry)
+            self._set_idle_if_done()
+        self.log.info("Worker %s: %s: Job OK (%s)", self.name, job.origin, job.id)
+
+    def _handle_failure(self, job: Job, queue: Queue, execution: Execution, exc_info):
+        with self._bookkeeping_lock:
+            del self._executions[job.id]
+            self.execution = execution
+            job._status = JobStatus.FAILED
+            self.handle_execution_ended(job, queue, job.failure_callback_timeout)
+            self.handle_exception(job, *exc_info)
+            self.handle_job_failure(job=job, exc_string="".join(traceback.format_exception(*exc_info)), queue=queue, started_job_registry=queue.started_job_registry)
+            self._set_idle_if_done()
+
+    def _set_idle_if_done(self):
+        # The job whose bookkeeping is being done is still counted as in flight.
+        if len(self._in_flight) <= 1:
+            self.set_state(WorkerStatus.IDLE)
+
+    def teardown(self):
+        # Let the jobs in flight finish before the worker is registered as dead.
+        wait(list(self._in_flight))
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        super().teardown()
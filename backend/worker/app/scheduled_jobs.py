@@ -1,20 +1,37 @@
 from constance import config
 from django.utils import timezone
 
+from reecon import services
 from reecon.models import (
+    FetchedSubmission,
     UnprocessableRedditor,
     UnprocessableThread,
 )
 
 __all__ = (
+    "delete_fetched_submissions",
     "delete_unprocessable_redditors",
     "delete_unprocessable_threads",
+    "poll_llm_batches",
+    "submit_llm_batches",
 )
 
 
+def delete_fetched_submissions():
+    return FetchedSubmission.objects.filter(created__lte=timezone.now() - config.FETCHED_SUBMISSION_EXP_TD).delete()
+
+
 def delete_unprocessable_redditors():
     return UnprocessableRedditor.objects.filter(created__lte=timezone.now() - config.UNPROCESSABLE_REDDITOR_EXP_TD).delete()
 
 
 def delete_unprocessable_threads():
     return UnprocessableThread.objects.filter(created__lte=timezone.now() - config.UNPROCESSABLE_THREAD_EXP_TD).delete()
+
+
+def poll_llm_batches():
+    return services.batch.poll_submitted()
+
+
+def submit_llm_batches():
+    return services.batch.submit_pending()
@@ -0,0 +1,23 @@
+from django.db import close_old_connections
+from rq.job import Job
+from rq.queue import Queue
+from rq.worker import SimpleWorker
+
+
+__all__ = ("ConnectionClosingWorker",)
+
+
+class ConnectionClosingWorker(SimpleWorker):
+    """
+    Runs jobs in the worker process like `SimpleWorker`, so the reddit and LLM clients that are cached per process in
+    `reecon.services.clients` are reused across jobs. The worker process outlives the jobs, so the database connections
+    are cleaned up around each job the way Django does around a request. Otherwise, a connection that was dropped by the
+    database or that exceeded `CONN_MAX_AGE` would fail every job that runs after it.
+    """
+
+    def perform_job(self, job: Job, queue: Queue) -> bool:
+        close_old_connections()
+        try:
+            return super().perform_job(job, queue)
+        finally:
+            close_old_connections()
@@ -1,14 +1,31 @@
+import asyncio
+import contextlib
+import contextvars
+import datetime as dt
+import functools
 import logging
+from typing import List
+import weakref
 
+from constance import config
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+import rq
 from reecon import (
     exceptions,
     models,
     schemas,
     services,
+    util,
 )
 
 
 __all__ = (
+    "ASYNC_JOBS",
+    "aprocess_redditor_data",
+    "aprocess_thread_data",
+    "job_timeout",
     "process_redditor_context_query",
     "process_redditor_data",
     "process_thread_context_query",
@@ -18,6 +35,167 @@ __all__ = (
 
 log = logging.getLogger("app.worker.jobs.reddit")
 
+# The semaphores that bound the number of requests the jobs of an event loop have in flight against each upstream.
+# asyncio primitives belong to the loop they are first used in, so they are kept per loop.
+_upstream_semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore]] = weakref.WeakKeyDictionary()
+
+# The timeout of the job that `app.async_worker.AsyncWorker` runs in the current task.
+job_timeout: contextvars.ContextVar[asyncio.Timeout | None] = contextvars.ContextVar("job_timeout", default=None)
+
+
+def _get_llms(*llm_ids: int) -> List[models.LLM]:
+    llms = models.LLM.objects.select_related("provider").in_bulk(set(llm_ids))
+    return [llms[llm_id] for llm_id in llm_ids]
+
+
+def _get_users(*user_ids: int) -> List[models.AppUser]:
+    users = models.AppUser.objects.in_bulk(set(user_ids))
+    return [users[user_id] for user_id in user_ids]
+
+
+def _prioritized(func):
+    """
+    Schedule the LLM requests of a job with the priority of the queue it was enqueued in.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        job = rq.get_current_job()
+        with services.llm_provider.priority(job.origin if job else "default"):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _upstream_semaphore(upstream: str) -> asyncio.Semaphore:
+    semaphores = _upstream_semaphores.setdefault(asyncio.get_running_loop(), {})
+    if upstream not in semaphores:
+        limits = {
+            "llm": settings.ASYNC_WORKER_LLM_CONCURRENCY,
+            "reddit": settings.ASYNC_WORKER_REDDIT_CONCURRENCY,
+        }
+        semaphores[upstream] = asyncio.Semaphore(limits[upstream])
+    return semaphores[upstream]
+
+
+@contextlib.asynccontextmanager
+async def _upstream_limit(upstream: str):
+    """
+    Hold one of the slots of `upstream` for the duration of the block. The timeout of the job is paused while it waits
+    for the slot, so that a job is not timed out because the jobs ahead of it kept the upstream busy.
+    """
+    semaphore = _upstream_semaphore(upstream)
+    loop = asyncio.get_running_loop()
+    timeout = job_timeout.get()
+    remaining = None
+    if timeout is not None and not timeout.expired() and timeout.when() is not None:
+        remaining = timeout.when() - loop.time()
+        timeout.reschedule(None)
+    try:
+        await semaphore.acquire()
+    finally:
+        if remaining is not None:
+            timeout.reschedule(loop.time() + remaining)
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+async def _aprocess_redditor_data(
+    *,
+    redditor_username: str,
+    contributor: models.AppUser,
+    llm: models.LLM,
+    llm_providers_settings: schemas.LlmProvidersSettings,
+    submitter: models.AppUser,
+    env: schemas.WorkerEnv,
+) -> models.RedditorData | models.UnprocessableRedditor | models.LlmBatchRequest:
+    """
+    The coroutine version of `_process_redditor_data`.
+    """
+    service = services.RedditorDataService(
+        identifier=redditor_username,
+        contributor=contributor,
+        llm=llm,
+        llm_providers_settings=llm_providers_settings,
+        submitter=submitter,
+        env=env,
+    )
+
+    defer = services.batch.should_defer()
+    if defer and (request := await util.db.database_sync_to_async(services.batch.find)(service)):
+        return request
+
+    try:
+        async with _upstream_limit("reddit"):
+            inputs = await service.aget_inputs()
+    except exceptions.UnprocessableRedditorError as e:
+        log.exception("UnprocessableRedditorError thrown when running `aprocess_redditor_data` job.")
+        return e.obj
+    else:
+        if defer:
+            return await util.db.database_sync_to_async(services.batch.defer)(service, inputs=inputs, prompt=env.redditor.llm.prompts.process_data)
+        async with _upstream_limit("llm"):
+            generated = await service.agenerate(inputs=inputs, prompt=env.redditor.llm.prompts.process_data)
+        return await service.acreate_object(generated=generated)
+
+
+async def _aprocess_thread_data(
+    *,
+    thread_path: str,
+    contributor: models.AppUser,
+    llm: models.LLM,
+    llm_providers_settings: schemas.LlmProvidersSettings,
+    submitter: models.AppUser,
+    env: schemas.WorkerEnv,
+) -> models.ThreadData | models.UnprocessableThread | models.LlmBatchRequest:
+    """
+    The coroutine version of `_process_thread_data`.
+    """
+    service = services.ThreadDataService(
+        identifier=thread_path,
+        contributor=contributor,
+        llm=llm,
+        llm_providers_settings=llm_providers_settings,
+        submitter=submitter,
+        env=env,
+    )
+
+    defer = services.batch.should_defer()
+    if defer and (request := await util.db.database_sync_to_async(services.batch.find)(service)):
+        return request
+
+    try:
+        async with _upstream_limit("reddit"):
+            inputs = await service.aget_inputs()
+    except exceptions.UnprocessableThreadError as e:
+        log.exception("UnprocessableThreadError thrown when running `aprocess_thread_data` job.")
+        return e.obj
+    else:
+        if defer:
+            return await util.db.database_sync_to_async(services.batch.defer)(service, inputs=inputs, prompt=env.thread.llm.prompts.process_data)
+        async with _upstream_limit("llm"):
+            generated = await service.agenerate(inputs=inputs, prompt=env.thread.llm.prompts.process_data)
+        return await service.acreate_object(generated=generated)
+
+
+def _cache_context_query(obj: models.RedditorContextQuery | models.ThreadContextQuery, *, env_id: str, freshness: dt.timedelta) -> None:
+    """
+    Cache the result of a context query, so that the web app returns it for the same query instead of enqueuing a job
+    for as long as the redditor or thread is fresh.
+    """
+    timeout = (obj.context.last_processed + freshness - timezone.now()).total_seconds()
+    if timeout > 0:
+        key = util.cache.context_query_key(
+            obj.context.identifier,
+            data_id=obj.context.latest_data_id,
+            env_id=env_id,
+            llm_id=obj.request_meta.llm_id,
+            prompt=obj.prompt,
+        )
+        cache.set(key, obj.pk, timeout)
+
 
 def _ensure_redditor_context_query_processable(
     *,
@@ -83,9 +261,9 @@ def _ensure_redditor_data(
     without errors.
     """
     try:
-        redditor = models.Redditor.objects.get(username=redditor_username)
+        redditor = models.Redditor.objects.select_related("latest_data").get(username=redditor_username)
     except models.Redditor.DoesNotExist:
-        return process_redditor_data(
+        return _process_redditor_data(
             redditor_username=redditor_username,
             contributor=contributor,
             llm=llm,
@@ -94,7 +272,7 @@ def _ensure_redditor_data(
             env=env,
         )
     else:
-        return redditor.data.latest("created")
+        return redditor.latest_data
 
 
 def _ensure_thread_context_query_processable(
@@ -151,9 +329,9 @@ def _ensure_thread_data(
     `process_thread_data`. `Thread` objects are created when `process_thread_data` executes without errors.
     """
     try:
-        thread = models.Thread.objects.get(path=thread_path)
+        thread = models.Thread.objects.select_related("latest_data").get(path=thread_path)
     except models.Thread.DoesNotExist:
-        return process_thread_data(
+        return _process_thread_data(
             thread_path=thread_path,
             contributor=contributor,
             llm=llm,
@@ -162,16 +340,17 @@ def _ensure_thread_data(
             env=env,
         )
     else:
-        return thread.data.latest("created")
+        return thread.latest_data
 
 
-def process_redditor_context_query(
+def _process_redditor_context_query(
     *,
     redditor_username: str,
     contributor: models.AppUser,
     context_query_llm: models.LLM,
     data_llm: models.LLM,
     llm_providers_settings: schemas.LlmProvidersSettings,
+    prompt: str,
     submitter: models.AppUser,
     env: schemas.WorkerEnv,
 ) -> models.RedditorContextQuery | models.UnprocessableRedditorContextQuery:
@@ -199,11 +378,11 @@ def process_redditor_context_query(
     # Do not need to catch `UnprocessableRedditorError` here because it would have already been thrown when
     # `_ensure_redditor_context_query_processable` was called above.
     inputs = service.get_inputs()
-    generated = service.generate(inputs=inputs, prompt=env.redditor.llm.prompts.process_context_query)
+    generated = service.generate(inputs=inputs, prompt=prompt)
     return service.create_object(generated=generated)
 
 
-def process_redditor_data(
+def _process_redditor_data(
     *,
     redditor_username: str,
     contributor: models.AppUser,
@@ -211,7 +390,7 @@ def process_redditor_data(
     llm_providers_settings: schemas.LlmProvidersSettings,
     submitter: models.AppUser,
     env: schemas.WorkerEnv,
-) -> models.RedditorData | models.UnprocessableRedditor:
+) -> models.RedditorData | models.UnprocessableRedditor | models.LlmBatchRequest:
     service = services.RedditorDataService(
         identifier=redditor_username,
         contributor=contributor,
@@ -221,23 +400,30 @@ def process_redditor_data(
         env=env,
     )
 
+    defer = services.batch.should_defer()
+    if defer and (request := services.batch.find(service)):
+        return request
+
     try:
         inputs = service.get_inputs()
     except exceptions.UnprocessableRedditorError as e:
         log.exception("UnprocessableRedditorError thrown when running `process_redditor_data` job.")
         return e.obj
     else:
+        if defer:
+            return services.batch.defer(service, inputs=inputs, prompt=env.redditor.llm.prompts.process_data)
         generated = service.generate(inputs=inputs, prompt=env.redditor.llm.prompts.process_data)
         return service.create_object(generated=generated)
 
 
-def process_thread_context_query(
+def _process_thread_context_query(
     *,
     thread_path: str,
     contributor: models.AppUser,
     context_query_llm: models.LLM,
     data_llm: models.LLM,
     llm_providers_settings: schemas.LlmProvidersSettings,
+    prompt: str,
     submitter: models.AppUser,
     env: schemas.WorkerEnv,
 ) -> models.ThreadContextQuery | models.UnprocessableThreadContextQuery:
@@ -265,11 +451,11 @@ def process_thread_context_query(
     # Do not need to catch `UnprocessableThreadError` here because it would have already been thrown when
     # `_ensure_thread_context_query_processable` was called above.
     inputs = service.get_inputs()
-    generated = service.generate(inputs=inputs, prompt=env.thread.llm.prompts.process_context_query)
+    generated = service.generate(inputs=inputs, prompt=prompt)
     return service.create_object(generated=generated)
 
 
-def process_thread_data(
+def _process_thread_data(
     *,
     thread_path: str,
     contributor: models.AppUser,
@@ -277,7 +463,7 @@ def process_thread_data(
     llm_providers_settings: schemas.LlmProvidersSettings,
     submitter: models.AppUser,
     env: schemas.WorkerEnv,
-) -> models.ThreadData | models.UnprocessableThread:
+) -> models.ThreadData | models.UnprocessableThread | models.LlmBatchRequest:
     service = services.ThreadDataService(
         identifier=thread_path,
         contributor=contributor,
@@ -287,11 +473,174 @@ def process_thread_data(
         env=env,
     )
 
+    defer = services.batch.should_defer()
+    if defer and (request := services.batch.find(service)):
+        return request
+
     try:
         inputs = service.get_inputs()
     except exceptions.UnprocessableThreadError as e:
         log.exception("UnprocessableThreadError thrown when running `process_thread_data` job.")
         return e.obj
     else:
+        if defer:
+            return services.batch.defer(service, inputs=inputs, prompt=env.thread.llm.prompts.process_data)
         generated = service.generate(inputs=inputs, prompt=env.thread.llm.prompts.process_data)
         return service.create_object(generated=generated)
+
+
+# The functions below are the job entry points that are enqueued by the web app. Jobs only carry primary keys, the id
+# of a `WorkerEnv` snapshot and the identifier so that queued jobs stay small. They are resolved here before processing.
+
+
+@_prioritized
+def process_redditor_context_query(
+    *,
+    redditor_username: str,
+    contributor_id: int,
+    context_query_llm_id: int,
+    data_llm_id: int,
+    llm_providers_settings: dict,
+    prompt: str,
+    submitter_id: int,
+    env_id: str,
+) -> models.RedditorContextQuery | models.UnprocessableRedditorContextQuery:
+    contributor, submitter = _get_users(contributor_id, submitter_id)
+    context_query_llm, data_llm = _get_llms(context_query_llm_id, data_llm_id)
+    obj = _process_redditor_context_query(
+        redditor_username=redditor_username,
+        contributor=contributor,
+        context_query_llm=context_query_llm,
+        data_llm=data_llm,
+        llm_providers_settings=schemas.LlmProvidersSettings.model_validate(llm_providers_settings),
+        prompt=prompt,
+        submitter=submitter,
+        env=schemas.load_worker_env(env_id),
+    )
+    if isinstance(obj, models.RedditorContextQuery):
+        _cache_context_query(obj, env_id=env_id, freshness=config.REDDITOR_FRESHNESS_TD)
+    return obj
+
+
+@_prioritized
+def process_redditor_data(
+    *,
+    redditor_username: str,
+    contributor_id: int,
+    llm_id: int,
+    llm_providers_settings: dict,
+    submitter_id: int,
+    env_id: str,
+) -> models.RedditorData | models.UnprocessableRedditor | models.LlmBatchRequest:
+    contributor, submitter = _get_users(contributor_id, submitter_id)
+    (llm,) = _get_llms(llm_id)
+    return _process_redditor_data(
+        redditor_username=redditor_username,
+        contributor=contributor,
+        llm=llm,
+        llm_providers_settings=schemas.LlmProvidersSettings.model_validate(llm_providers_settings),
+        submitter=submitter,
+        env=schemas.load_worker_env(env_id),
+    )
+
+
+@_prioritized
+def process_thread_context_query(
+    *,
+    thread_path: str,
+    contributor_id: int,
+    context_query_llm_id: int,
+    data_llm_id: int,
+    llm_providers_settings: dict,
+    prompt: str,
+    submitter_id: int,
+    env_id: str,
+) -> models.ThreadContextQuery | models.UnprocessableThreadContextQuery:
+    contributor, submitter = _get_users(contributor_id, submitter_id)
+    context_query_llm, data_llm = _get_llms(context_query_llm_id, data_llm_id)
+    obj = _process_thread_context_query(
+        thread_path=thread_path,
+        contributor=contributor,
+        context_query_llm=context_query_llm,
+        data_llm=data_llm,
+        llm_providers_settings=schemas.LlmProvidersSettings.model_validate(llm_providers_settings),
+        prompt=prompt,
+        submitter=submitter,
+        env=schemas.load_worker_env(env_id),
+    )
+    if isinstance(obj, models.ThreadContextQuery):
+        _cache_context_query(obj, env_id=env_id, freshness=config.THREAD_FRESHNESS_TD)
+    return obj
+
+
+@_prioritized
+def process_thread_data(
+    *,
+    thread_path: str,
+    contributor_id: int,
+    llm_id: int,
+    llm_providers_settings: dict,
+    submitter_id: int,
+    env_id: str,
+) -> models.ThreadData | models.UnprocessableThread | models.LlmBatchRequest:
+    contributor, submitter = _get_users(contributor_id, submitter_id)
+    (llm,) = _get_llms(llm_id)
+    return _process_thread_data(
+        thread_path=thread_path,
+        contributor=contributor,
+        llm=llm,
+        llm_providers_settings=schemas.LlmProvidersSettings.model_validate(llm_providers_settings),
+        submitter=submitter,
+        env=schemas.load_worker_env(env_id),
+    )
+
+
+async def aprocess_redditor_data(
+    *,
+    redditor_username: str,
+    contributor_id: int,
+    llm_id: int,
+    llm_providers_settings: dict,
+    submitter_id: int,
+    env_id: str,
+) -> models.RedditorData | models.UnprocessableRedditor | models.LlmBatchRequest:
+    contributor, submitter = await util.db.database_sync_to_async(_get_users)(contributor_id, submitter_id)
+    (llm,) = await util.db.database_sync_to_async(_get_llms)(llm_id)
+    return await _aprocess_redditor_data(
+        redditor_username=redditor_username,
+        contributor=contributor,
+        llm=llm,
+        llm_providers_settings=schemas.LlmProvidersSettings.model_validate(llm_providers_settings),
+        submitter=submitter,
+        env=await util.db.database_sync_to_async(schemas.load_worker_env)(env_id),
+    )
+
+
+async def aprocess_thread_data(
+    *,
+    thread_path: str,
+    contributor_id: int,
+    llm_id: int,
+    llm_providers_settings: dict,
+    submitter_id: int,
+    env_id: str,
+) -> models.ThreadData | models.UnprocessableThread | models.LlmBatchRequest:
+    contributor, submitter = await util.db.database_sync_to_async(_get_users)(contributor_id, submitter_id)
+    (llm,) = await util.db.database_sync_to_async(_get_llms)(llm_id)
+    return await _aprocess_thread_data(
+        thread_path=thread_path,
+        contributor=contributor,
+        llm=llm,
+        llm_providers_settings=schemas.LlmProvidersSettings.model_validate(llm_providers_settings),
+        submitter=submitter,
+        env=await util.db.database_sync_to_async(schemas.load_worker_env)(env_id),
+    )
+
+
+# The coroutine versions of the jobs that `app.async_worker.AsyncWorker` runs on its event loop, keyed by the name of the
+# job function that the web app enqueues. The web app keeps enqueueing the synchronous functions, so the same jobs can be
+# processed by either worker.
+ASYNC_JOBS = {
+    "app.worker.process_redditor_data": aprocess_redditor_data,
+    "app.worker.process_thread_data": aprocess_thread_data,
+}
@@ -1,5 +1,6 @@
 from pathlib import Path
 
+import decouple
 from reecon import settings as reecon_settings
 
 
@@ -26,6 +27,17 @@ DATABASES = reecon_settings.DATABASES
 RQ = reecon_settings.RQ
 RQ_QUEUES = reecon_settings.RQ_QUEUES
 
+# `app.async_worker.AsyncWorker` settings. The maximum number of requests that the jobs of a worker have in flight
+# against each upstream.
+ASYNC_WORKER_LLM_CONCURRENCY = decouple.config("ASYNC_WORKER_LLM_CONCURRENCY", cast=int, default=50)
+ASYNC_WORKER_REDDIT_CONCURRENCY = decouple.config("ASYNC_WORKER_REDDIT_CONCURRENCY", cast=int, default=10)
+# A single worker process keeps up to `ASYNC_WORKER_MAX_JOBS` jobs in flight. Reddit allows 100 requests per minute per
+# OAuth client id, which all jobs share, so jobs beyond the ones that can hold an upstream slot would only queue up in
+# the worker instead of being left to other workers. By default there is one job for every upstream slot.
+ASYNC_WORKER_MAX_JOBS = decouple.config("ASYNC_WORKER_MAX_JOBS", cast=int, default=ASYNC_WORKER_LLM_CONCURRENCY + ASYNC_WORKER_REDDIT_CONCURRENCY)
+# The reddit requests of a job are made in one of `ASYNC_WORKER_THREADS` threads because praw is synchronous.
+ASYNC_WORKER_THREADS = decouple.config("ASYNC_WORKER_THREADS", cast=int, default=32)
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
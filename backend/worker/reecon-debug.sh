@@ -4,4 +4,4 @@ set -e
 
 supervisorctl stop rq-worker
 
-uv run python /worker/manage.py rqworker-pool high default low --num-workers=1
+uv run python /worker/manage.py rqworker-pool high default low --num-workers=1 --worker-class app.simple_worker.ConnectionClosingWorker
@@ -0,0 +1,248 @@
+import asyncio
+from concurrent.futures import wait
+import threading
+import time
+from unittest.mock import patch
+
+from fakeredis import FakeStrictRedis
+import pytest
+from rq import (
+    Callback,
+    Queue,
+)
+from rq.job import JobStatus
+from rq.timeouts import JobTimeoutException
+from rq.worker import WorkerStatus
+
+from app.async_worker import AsyncWorker
+from app.worker import _upstream_limit
+
+
+# The events that the `wait_for` jobs wait on, keyed by name.
+EVENTS: dict[str, threading.Event] = {}
+
+
+def echo(value):
+    return value
+
+
+async def aecho(value):
+    await asyncio.sleep(0)
+    return value
+
+
+def fail():
+    raise ValueError("Job failed")
+
+
+async def afail():
+    raise ValueError("Job failed")
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+
+
+async def asleep(seconds):
+    await asyncio.sleep(seconds)
+
+
+def wait_for(name):
+    EVENTS[name].wait()
+
+
+async def await_for(name):
+    await asyncio.to_thread(EVENTS[name].wait)
+
+
+async def await_for_upstream_slot(name):
+    async with _upstream_limit("llm"):
+        await asyncio.to_thread(EVENTS[name].wait)
+
+
+def get_expiration_time(registry, job):
+    # The started job registry keeps the executions of the jobs, scored by the time at which they are abandoned.
+    return max(score for member, score in registry.connection.zrange(registry.key, 0, -1, withscores=True) if member.decode().startswith(job.id))
+
+
+def record_callback(job, connection, *args):
+    connection.rpush("callbacks", job.id)
+
+
+def slow_callback(job, connection, *args):
+    time.sleep(2)
+
+
+@pytest.fixture(params=[True, False], ids=["coroutine", "sync"])
+def is_async(request):
+    """
+    Fixture to run the stub jobs either as coroutines, like the jobs in `app.worker.ASYNC_JOBS`, or as sync jobs in a
+    thread of the executor.
+    """
+    async_jobs = {f"{__name__}.echo": aecho, f"{__name__}.fail": afail, f"{__name__}.sleep": asleep, f"{__name__}.wait_for": await_for}
+    with patch.dict("app.async_worker.ASYNC_JOBS", async_jobs if request.param else {}, clear=True):
+        yield request.param
+
+
+@pytest.fixture
+def connection():
+    return FakeStrictRedis()
+
+
+@pytest.fixture
+def events():
+    yield EVENTS
+    # Release the jobs of a failed test so that the worker can be torn down.
+    for event in EVENTS.values():
+        event.set()
+    EVENTS.clear()
+
+
+@pytest.fixture
+def queue(connection):
+    return Queue("default", connection=connection)
+
+
+@pytest.fixture
+def worker(connection, queue):
+    worker = AsyncWorker([queue], connection=connection, job_monitoring_interval=1)
+    yield worker
+    if worker._loop is not None:
+        worker._loop.call_soon_threadsafe(worker._loop.stop)
+
+
+def test_success(is_async, queue, worker):
+    """
+    Test that the return value of a job is stored, its success callback is executed and it is moved to the finished job
+    registry.
+    """
+    job = queue.enqueue(echo, "value", on_success=Callback(record_callback))
+    worker.work(burst=True)
+
+    job.refresh()
+    assert job.get_status() == JobStatus.FINISHED
+    assert job.return_value() == "value"
+    assert job.id in queue.finished_job_registry
+    assert job.id not in queue.started_job_registry
+    assert queue.connection.lrange("callbacks", 0, -1) == [job.id.encode()]
+
+
+def test_failure(is_async, queue, worker):
+    """
+    Test that a job that raises an exception is moved to the failed job registry after its failure callback is executed.
+    """
+    job = queue.enqueue(fail, on_failure=Callback(record_callback))
+    worker.work(burst=True)
+
+    job.refresh()
+    assert job.get_status() == JobStatus.FAILED
+    assert "ValueError: Job failed" in job.latest_result().exc_string
+    assert job.id in queue.failed_job_registry
+    assert job.id not in queue.started_job_registry
+    assert queue.connection.lrange("callbacks", 0, -1) == [job.id.encode()]
+
+
+def test_timeout(is_async, queue, worker):
+    """
+    Test that the worker stops waiting for a job that exceeds its timeout and records it as failed.
+    """
+    job = queue.enqueue(sleep, 3, job_timeout=1)
+    started = time.monotonic()
+    worker.work(burst=True)
+
+    assert time.monotonic() - started < 3
+    job.refresh()
+    assert job.get_status() == JobStatus.FAILED
+    assert JobTimeoutException.__name__ in job.latest_result().exc_string
+    assert job.id in queue.failed_job_registry
+
+
+def test_callback_timeout(is_async, queue, worker):
+    """
+    Test that a job whose success callback exceeds its timeout is recorded as failed.
+    """
+    job = queue.enqueue(echo, "value", on_success=Callback(slow_callback, timeout=1))
+    worker.work(burst=True)
+
+    job.refresh()
+    assert job.get_status() == JobStatus.FAILED
+    assert "Callback exceeded maximum timeout value (1 seconds)" in job.latest_result().exc_string
+    assert job.id in queue.failed_job_registry
+
+
+def test_registry_state(events, is_async, queue, worker):
+    """
+    Test that the jobs in flight are registered as started and that their heartbeats are refreshed every
+    `job_monitoring_interval` seconds for as long as they run.
+    """
+    events["job"] = threading.Event()
+    job = queue.enqueue(wait_for, "job")
+    worker.execute_job(*queue.dequeue_any([queue], None, connection=queue.connection))
+
+    assert job.id in queue.started_job_registry
+    assert worker.get_state() == WorkerStatus.BUSY
+    time.sleep(1.5)
+    expires_at = get_expiration_time(queue.started_job_registry, job)
+    time.sleep(1)
+    assert get_expiration_time(queue.started_job_registry, job) > expires_at
+    queue.started_job_registry.cleanup()
+    assert job.id in queue.started_job_registry
+
+    events["job"].set()
+    wait(list(worker._in_flight))
+    assert job.id not in queue.started_job_registry
+    assert job.id in queue.finished_job_registry
+    assert worker.get_state() == WorkerStatus.IDLE
+
+
+def test_registry_state_while_waiting_for_an_upstream_slot(events, queue, settings, worker):
+    """
+    Test that the heartbeat of a job that waits for an upstream slot outlives the job timeout, because the timeout is
+    paused while waiting.
+    """
+    settings.ASYNC_WORKER_LLM_CONCURRENCY = 1
+    events["holder"], events["waiter"] = threading.Event(), threading.Event()
+    events["waiter"].set()
+    with patch.dict("app.async_worker.ASYNC_JOBS", {f"{__name__}.wait_for": await_for_upstream_slot}, clear=True):
+        queue.enqueue(wait_for, "holder")
+        job = queue.enqueue(wait_for, "waiter", job_timeout=1)
+        worker.execute_job(*queue.dequeue_any([queue], None, connection=queue.connection))
+        worker.execute_job(*queue.dequeue_any([queue], None, connection=queue.connection))
+
+        # A job is registered as started until its timeout plus 60 seconds.
+        expires_at = get_expiration_time(queue.started_job_registry, job)
+        time.sleep(2.5)
+        assert get_expiration_time(queue.started_job_registry, job) > expires_at
+
+        events["holder"].set()
+        wait(list(worker._in_flight))
+    assert job.get_status() == JobStatus.FINISHED
+
+
+def test_heartbeats_while_waiting_for_a_slot(connection, events, queue, settings):
+    """
+    Test that the worker keeps sending the heartbeats of the jobs in flight while it waits for a slot for the next job.
+    """
+    settings.ASYNC_WORKER_MAX_JOBS = 1
+    worker = AsyncWorker([queue], connection=connection, job_monitoring_interval=1)
+    events["job"] = threading.Event()
+    job = queue.enqueue(wait_for, "job")
+    queue.enqueue(echo, "value")
+
+    with patch.object(worker, "_maintain_heartbeats", wraps=worker._maintain_heartbeats) as maintain_heartbeats:
+        threading.Timer(2.5, events["job"].set).start()
+        worker.work(burst=True)
+    assert maintain_heartbeats.call_count >= 2
+    assert job.id in queue.finished_job_registry
+
+
+def test_teardown(is_async, queue, worker):
+    """
+    Test that the worker lets the jobs in flight finish before it is torn down.
+    """
+    jobs = [queue.enqueue(sleep, 1) for _ in range(3)]
+    worker.work(burst=True)
+
+    assert all(job.get_status() == JobStatus.FINISHED for job in jobs)
+    assert queue.started_job_registry.count == 0
+    assert not worker._in_flight
@@ -0,0 +1,46 @@
+from unittest.mock import patch
+
+from fakeredis import FakeStrictRedis
+import pytest
+from rq import Queue
+from rq.job import JobStatus
+
+from app.simple_worker import ConnectionClosingWorker
+
+
+# The order in which the stub jobs ran and the database connections were cleaned up.
+CALLS: list[str] = []
+
+
+def record():
+    CALLS.append("job")
+
+
+def fail():
+    CALLS.append("job")
+    raise ValueError("Job failed")
+
+
+@pytest.fixture
+def calls():
+    with patch("app.simple_worker.close_old_connections", side_effect=lambda: CALLS.append("close_old_connections")):
+        yield CALLS
+    CALLS.clear()
+
+
+@pytest.fixture
+def queue():
+    return Queue("default", connection=FakeStrictRedis())
+
+
+@pytest.mark.parametrize("func, status", [(record, JobStatus.FINISHED), (fail, JobStatus.FAILED)])
+def test_closes_old_connections_around_jobs(calls, func, status, queue):
+    """
+    Test that the database connections are cleaned up before and after each job, including the ones that fail.
+    """
+    jobs = [queue.enqueue(func) for _ in range(2)]
+    ConnectionClosingWorker([queue], connection=queue.connection).work(burst=True)
+
+    for job in jobs:
+        assert job.get_status(refresh=True) == status
+    assert calls == ["close_old_connections", "job", "close_old_connections"] * 2
@@ -104,6 +104,14 @@ export const ContextQueryForm = () => {
             setPostBody(null)
             setJobId(data.job_id)
 
+            // If the same query was answered recently, the response is returned right away without a job
+            if (data.success !== null) {
+                setIsLoading(false)
+                setQueryResponse(data.success.response)
+                setResponseModalVisible(true)
+                return
+            }
+
             // If context queries are disabled
             if (data.job_id.length === 0) {
                 setIsLoading(false)
@@ -72,6 +72,7 @@ export interface RedditorContextQuery extends ContextQuery {
 }
 
 interface RequestMetadata {
+    cached_input_tokens: number
     contributor: UserUsername
     input_tokens: number
     llm: LLM
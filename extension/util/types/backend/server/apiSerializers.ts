@@ -16,8 +16,9 @@ export interface AuthTokenRefreshResponse {
     access: string
 }
 
-interface ContextQueryCreateResponse {
+interface ContextQueryCreateResponse<T> {
     job_id: string
+    success: T | null
 }
 
 export interface LlmDefaultsResponse {
@@ -76,7 +77,7 @@ export interface RedditorDataResponse {
     unprocessable: UnprocessableRedditor[]
 }
 
-export type RedditorContextQueryCreateResponse = ContextQueryCreateResponse
+export type RedditorContextQueryCreateResponse = ContextQueryCreateResponse<RedditorContextQuery>
 
 export interface RedditorContextQueryRetrieveResponse {
     error: UnprocessableRedditorContextQuery | null
@@ -94,7 +95,7 @@ export interface ThreadContextQueryCreateRequest {
     prompt: string
 }
 
-export type ThreadContextQueryCreateResponse = ContextQueryCreateResponse
+export type ThreadContextQueryCreateResponse = ContextQueryCreateResponse<ThreadContextQuery>
 
 export interface ThreadContextQueryRetrieveResponse {
     error: UnprocessableThreadContextQuery | null